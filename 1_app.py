@@ -3,60 +3,77 @@
 
 import streamlit as st
 from PIL import Image
-import json, os, time, torch
-from torchvision import models, transforms
+import json, os, time
 import numpy as np
-from search_font_vision import find_most_similar_font
-from render_font_preview import render_font_preview
-import clip  # OpenAI CLIP
+from contextlib import closing
+from match_engine import search_batch
+from render_font_preview import render_previews
+import tracing
+import result_cache
+from text_regions import match_regions, draw_regions
+from model_registry import get_model, try_get_model, is_loaded, stats as model_stats
 
 # ----------------------------
 # KONFIG
 # ----------------------------
 PASSWORD = "finatinalozinka"
 FONT_DB_FILE = "data/fonts_db.json"
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+TOP_N = 10
+SHOW_TOP = 3
+PREVIEW_TEXT = "ABCDEFGHIJKLMNOPQRSTUVWXYZ\nabcdefghijklmnopqrstuvwxyz\n0123456789"
 
 # ----------------------------
-# UČITAJ ResNet MODEL
+# PUTANJE FONTOVA (iz fonts_db.json, bez os.path.exists probanja)
 # ----------------------------
-if "resnet_model" not in st.session_state:
-    with st.spinner("🧠 Učitavam ResNet50 model..."):
-        model = models.resnet50(weights=models.ResNet50_Weights.DEFAULT)
-        model = torch.nn.Sequential(*(list(model.children())[:-1]))  # bez fc sloja
-        model.eval().to(DEVICE)
-
-        preprocess = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(
-                mean=[0.485, 0.456, 0.406],
-                std=[0.229, 0.224, 0.225]
-            ),
-        ])
-
-        st.session_state["resnet_model"] = model
-        st.session_state["resnet_preprocess"] = preprocess
-        st.session_state["resnet_device"] = DEVICE
-    st.success("✅ ResNet50 model spreman!")
+@st.cache_data(show_spinner=False)
+def load_font_paths(db_file, mtime):
+    """file → sfnt putanja koju je upisao first_download_all_fonts.py (mtime služi kao ključ cachea)."""
+    with open(db_file, "r", encoding="utf-8") as f:
+        fonts_db = json.load(f)
+    return {
+        font["file"]: font.get("font_path") or os.path.join("data/all_fonts_flat", font["file"])
+        for font in fonts_db if font.get("file")
+    }
 
 # ----------------------------
-# UČITAJ CLIP MODEL (opcionalno)
+# KARTICA REZULTATA
 # ----------------------------
-if "clip_model" not in st.session_state:
-    try:
-        with st.spinner("🧠 Učitavam CLIP (ViT-B/32)..."):
-            clip_model, clip_preprocess = clip.load("ViT-B/32", device=DEVICE, jit=False)
-            clip_model.eval()
-            st.session_state["clip_model"] = clip_model
-            st.session_state["clip_preprocess"] = clip_preprocess
-            st.session_state["clip_device"] = DEVICE
-        st.success("✅ CLIP spreman!")
-    except Exception as e:
-        st.warning(f"⚠️ CLIP nije učitan: {e}")
-        st.session_state["clip_model"] = None
-        st.session_state["clip_preprocess"] = None
-        st.session_state["clip_device"] = None
+def show_card(slot, rank, res, preview):
+    fname = res["file"]
+    with slot.container():
+        st.markdown(f"### {rank}. {res.get('full_name') or fname}")
+        st.write(f"📊 Ukupni score: {res['score']:.2f}/100")
+        st.write(f"🔹 Embedding: {res['embed_score']:.2f} | 🔹 SSIM: {res['ssim_score']:.2f}")
+        st.write(f"📄 Licenca: {res.get('license') or 'Nepoznata'}")
+        st.write(f"🌐 Izvor: {res.get('source') or 'Nepoznata'}")
+        st.image(preview, caption=f"Preview: {fname}", use_container_width=True)
+
+# ----------------------------
+# MODELI — procesni registar (model_registry.py)
+# ----------------------------
+# Težine se učitavaju jednom po workeru i tek kad ih odabrani mod zatraži;
+# st.session_state dobiva samo reference na zajedničke objekte.
+MODE_MODELS = {
+    "ResNet50 (brza)": ["resnet50"],
+    "Hibridna (ResNet + SSIM)": ["resnet50", "clip"],
+}
+MODEL_LABELS = {"resnet50": "ResNet50 model", "clip": "CLIP (ViT-B/32)"}
+SESSION_PREFIX = {"resnet50": "resnet", "clip": "clip"}
+MODE_ENGINES = {"ResNet50 (brza)": "vision", "Hibridna (ResNet + SSIM)": "hybrid"}
+
+def ensure_models(names):
+    for name in names:
+        if not is_loaded(name):
+            with st.spinner(f"🧠 Učitavam {MODEL_LABELS[name]}..."):
+                model, preprocess, device = try_get_model(name)
+            if model is None:
+                st.warning(f"⚠️ {MODEL_LABELS[name]} nije učitan.")
+        else:
+            model, preprocess, device = get_model(name)
+        prefix = SESSION_PREFIX[name]
+        st.session_state[f"{prefix}_model"] = model
+        st.session_state[f"{prefix}_preprocess"] = preprocess
+        st.session_state[f"{prefix}_device"] = device
 
 # ----------------------------
 # LOGIN
@@ -99,76 +116,98 @@ if st.session_state.authenticated:
         index=0,
     )
 
-    if search_mode == "Hibridna (ResNet + SSIM)":
-        from search_font_vision_hybrid import find_most_similar_font
-    else:
-        from search_font_vision import find_most_similar_font
     st.write(f"🧠 Aktivni modul: {search_mode}")
+    ensure_models(MODE_MODELS[search_mode])
+    multi_region = st.sidebar.checkbox("🧩 Više regija teksta (naslov, tekst...)", value=False)
+    debug_panel = st.sidebar.checkbox("🐞 Debug: vremena po fazi", value=False)
+
+    with st.sidebar.expander("🧠 Modeli u memoriji"):
+        info = model_stats()
+        st.write(f"PID {info['pid']} — RSS {info['rss_bytes'] / 1e6:.0f} MB")
+        st.json(info["models"])
 
     uploaded_file = st.file_uploader("Uploadajte sliku s tekstom", type=["png", "jpg", "jpeg"])
 
     if uploaded_file is not None:
-        upload_path = "data/upload_tmp.png"
-        image = Image.open(uploaded_file).convert("RGB")
-        image.save(upload_path)
-        st.image(image, caption="📸 Uploadana slika", use_container_width=True)
-
-        st.info("🔍 Tražim najsličnije fontove...")
-        progress = st.progress(0.0)
-
-        start_time = time.time()
-        try:
-            results = find_most_similar_font(upload_path, top_n=10)
-        except Exception as e:
-            st.error(f"⚠️ Greška prilikom pretrage: {e}")
-            results = []
-
-        elapsed = time.time() - start_time
-        st.success(f"✅ Pretraga završena u {elapsed:.2f} sekundi")
-
-        filtered = []
-        for res in results:
-            font_path = None
-            fname = res.get("file")
-            if fname:
-                for base_dir in ["data/all_fonts_flat", "data/all_fonts_flat_converted"]:
-                    fpath = os.path.join(base_dir, fname)
-                    if os.path.exists(fpath):
-                        font_path = fpath
+        with tracing.trace("1_app") as query_trace:
+            upload_bytes = uploaded_file.getvalue()
+            with tracing.span("decode"):
+                image = Image.open(uploaded_file).convert("RGB")
+            st.image(image, caption="📸 Uploadana slika", use_container_width=True)
+
+            # ----------------------------
+            # VIŠE REGIJA TEKSTA (jedan batched embedding za sve izreze)
+            # ----------------------------
+            if multi_region:
+                st.info("🔍 Tražim regije teksta i fontove za svaku...")
+                start_time = time.time()
+                try:
+                    regions = result_cache.get_or_compute(
+                        result_cache.upload_key(upload_bytes, search_mode, "regions", 3),
+                        lambda: match_regions(image, engine=MODE_ENGINES[search_mode], top_n=3),
+                    )
+                except Exception as e:
+                    st.error(f"⚠️ Greška prilikom pretrage po regijama: {e}")
+                    st.stop()
+                st.success(f"✅ {len(regions)} regija obrađeno u {time.time() - start_time:.2f} sekundi")
+                st.image(draw_regions(image, [r["bbox"] for r in regions]),
+                         caption="🧩 Pronađene regije teksta", use_container_width=True)
+                for region in regions:
+                    st.markdown(f"## Regija {region['region']}")
+                    st.image(image.crop(region["bbox"]), use_container_width=True)
+                    for i, res in enumerate(region["results"], 1):
+                        fullname = res.get("full_name") or res["file"]
+                        st.write(f"{i}. **{fullname}** — {res['score']:.2f}/100 "
+                                 f"(📄 {res.get('license') or 'Nepoznata'})")
+                    st.divider()
+                st.stop()
+
+            st.info("🔍 Tražim najsličnije fontove...")
+            progress = st.progress(0.0)
+
+            start_time = time.time()
+            try:
+                # rerun (odjava, promjena widgeta) s istom slikom → rezultat iz cachea;
+                # match_engine bilježi spanove embed / index_search / ssim_rerank / metadata
+                results = result_cache.get_or_compute(
+                    result_cache.upload_key(upload_bytes, search_mode, TOP_N),
+                    lambda: search_batch([image], engine=MODE_ENGINES[search_mode], top_n=TOP_N)[0],
+                )
+            except Exception as e:
+                st.error(f"⚠️ Greška prilikom pretrage: {e}")
+                results = []
+
+            elapsed = time.time() - start_time
+            progress.progress(0.5)
+            st.success(f"✅ Pretraga završena u {elapsed:.2f} sekundi")
+
+            # kartice se renderiraju konkurentno i pune slotove redom rangiranja: rezultat
+            # ide u slot čim su svi bolje rangirani riješeni (preview uspio, pao ili istekao)
+            font_paths = load_font_paths(FONT_DB_FILE, os.path.getmtime(FONT_DB_FILE))
+            candidates = [res for res in results if res.get("font_path") or font_paths.get(res.get("file"))]
+            paths = [res.get("font_path") or font_paths[res["file"]] for res in candidates]
+            if candidates:
+                st.markdown("## 🏆 Najsličniji fontovi")
+            slots = [st.empty() for _ in range(min(SHOW_TOP, len(candidates)))]
+            previews, shown, next_rank = {}, 0, 0
+            with closing(render_previews(paths, text=PREVIEW_TEXT)) as renders:
+                for i, img in renders:
+                    previews[i] = img
+                    while next_rank in previews and shown < len(slots):
+                        if previews[next_rank] is not None:
+                            show_card(slots[shown], shown + 1, candidates[next_rank], previews[next_rank])
+                            shown += 1
+                        next_rank += 1
+                    progress.progress(0.5 + 0.5 * max(shown / len(slots), next_rank / len(candidates)))
+                    if shown >= len(slots):
                         break
-            if not font_path:
-                continue
-
-            img_preview = render_font_preview(
-                font_path,
-                text="ABCDEFGHIJKLMNOPQRSTUVWXYZ\nabcdefghijklmnopqrstuvwxyz\n0123456789"
-            )
-            if img_preview is not None:
-                res["preview_img"] = img_preview
-                filtered.append(res)
-
-            if len(filtered) >= 3:
-                break
-
-        if filtered:
-            st.markdown("## 🏆 Najsličniji fontovi")
-            for i, res in enumerate(filtered, 1):
-                fname = res["file"]
-                score = res["score"]
-                fullname = res.get("full_name") or fname
-                licenca = res.get("license") or "Nepoznata"
-                izvor = res.get("source") or "Nepoznata"
-
-                st.markdown(f"### {i}. {fullname}")
-                st.write(f"📊 Ukupni score: {score:.2f}/100")
-                st.write(f"🔹 Embedding: {res['embed_score']:.2f} | 🔹 SSIM: {res['ssim_score']:.2f}")
-                st.write(f"📄 Licenca: {licenca}")
-                st.write(f"🌐 Izvor: {izvor}")
-
-                img_preview = res.get("preview_img")
-                if img_preview is not None:
-                    st.image(img_preview, caption=f"Preview: {fname}", use_container_width=True)
-                else:
-                    st.info(f"⚠️ Nije moguće generirati preview za {fname}.")
-        else:
+        progress.progress(1.0)
+        tracing.write_metrics()
+
+        if not shown:
             st.warning("⚠️ Nije pronađen nijedan font s valjanim prikazom.")
+
+        if debug_panel:
+            with st.expander("🐞 Vremena po fazi (ovaj upit)", expanded=True):
+                st.write(f"Ukupno: {query_trace.seconds * 1000:.0f} ms")
+                st.table(query_trace.breakdown())
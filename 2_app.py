@@ -3,34 +3,35 @@
 
 import streamlit as st
 from PIL import Image
-import json, os, time, torch
-import numpy as np
-import clip
-from render_font_preview import render_font_preview
-from sklearn.metrics.pairwise import cosine_similarity
+import os
+from render_font_preview import render_previews
+from clip_text_index import get_text_index, search_text_index
+from model_registry import get_model, is_loaded, CLIP_MODEL_NAME
+from embed_service import embed_query
+from font_meta import open_meta
 
 # ----------------------------
 # KONFIG
 # ----------------------------
 PASSWORD = "finatinalozinka"
 FONT_DB_FILE = "data/fonts_db.json"
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+PREVIEW_TEXT = "ABCDEFGHIJKLMNOPQRSTUVWXYZ\nabcdefghijklmnopqrstuvwxyz\n0123456789"
 
 # ----------------------------
-# MODEL: CLIP
+# MODEL: CLIP (procesni registar — jednom po workeru, dijele ga sve sesije)
 # ----------------------------
-if "clip_model" not in st.session_state:
+if not is_loaded("clip"):
     try:
-        with st.spinner("🧠 Učitavam CLIP (ViT-B/32)..."):
-            clip_model, clip_preprocess = clip.load("ViT-B/32", device=DEVICE, jit=False)
-            clip_model.eval()
-            st.session_state["clip_model"] = clip_model
-            st.session_state["clip_preprocess"] = clip_preprocess
-            st.session_state["clip_device"] = DEVICE
+        with st.spinner(f"🧠 Učitavam CLIP ({CLIP_MODEL_NAME})..."):
+            get_model("clip")
         st.success("✅ CLIP spreman!")
     except Exception as e:
         st.error(f"⚠️ Greška pri učitavanju CLIP modela: {e}")
         st.stop()
+clip_model, clip_preprocess, DEVICE = get_model("clip")
+st.session_state["clip_model"] = clip_model
+st.session_state["clip_preprocess"] = clip_preprocess
+st.session_state["clip_device"] = DEVICE
 
 # ----------------------------
 # LOGIN (NETAKNUTO)
@@ -65,19 +66,21 @@ if st.session_state.authenticated:
     st.title("🎨 Font Matcher — CLIP vizualna pretraga")
 
     # ----------------------------
-    # UČITAJ BAZU FONTOVA
+    # BAZA FONTOVA (SQLite, otvorena jednom po procesu — bez parsiranja JSON-a po rerunu)
     # ----------------------------
     if not os.path.exists(FONT_DB_FILE):
         st.error("❌ Datoteka s bazom fontova nije pronađena!")
         st.stop()
 
-    with open(FONT_DB_FILE, "r", encoding="utf-8") as f:
-        fonts_db = json.load(f)
-
-    if not isinstance(fonts_db, list):
-        st.error("⚠️ Datoteka fonts_db.json nije u ispravnom formatu (očekuje se lista).")
+    try:
+        font_meta = open_meta(db_file=FONT_DB_FILE)
+    except Exception as e:
+        st.error(f"⚠️ Ne mogu otvoriti bazu fontova: {e}")
         st.stop()
 
+    free_only = st.sidebar.checkbox("🆓 Samo besplatni fontovi", value=False)
+    sources = st.sidebar.multiselect("🌐 Izvor", font_meta.distinct("source"))
+
     # ----------------------------
     # UPLOAD SLIKE
     # ----------------------------
@@ -87,44 +90,29 @@ if st.session_state.authenticated:
         st.image(image, caption="📸 Uploadana slika", use_container_width=True)
 
         st.info("🔍 Generiram embedding slike...")
-        clip_model = st.session_state["clip_model"]
-        clip_preprocess = st.session_state["clip_preprocess"]
-
-        with torch.no_grad():
-            image_tensor = clip_preprocess(image).unsqueeze(0).to(DEVICE)
-            image_emb = clip_model.encode_image(image_tensor)
-            image_emb /= image_emb.norm(dim=-1, keepdim=True)
-            image_emb = image_emb.cpu().numpy()
+        # embed_service ako je pokrenut (micro-batching za istodobne korisnike), inače lokalno
+        image_emb = embed_query(image, model="clip")
 
         # ----------------------------
         # IZRAČUNAJ SLIČNOST FONTOVA
         # ----------------------------
         st.info("🔍 Računam sličnost s fontovima...")
-        font_embs = []
-        valid_fonts = []
-
-        for font in fonts_db:
-            name = font.get("full_name") or font.get("file", "")
-            if not name:
-                continue
-            try:
-                tokens = clip.tokenize(name).to(DEVICE)
-                with torch.no_grad():
-                    txt_emb = clip_model.encode_text(tokens)
-                    txt_emb /= txt_emb.norm(dim=-1, keepdim=True)
-                    font_embs.append(txt_emb.cpu().numpy())
-                    valid_fonts.append(font)
-            except Exception as e:
-                print(f"⚠️ Preskačem {name}: {e}")
-
-        if not font_embs:
+        try:
+            font_embs, valid_fonts = get_text_index(clip_model, DEVICE, model_name=CLIP_MODEL_NAME,
+                                                    db_file=FONT_DB_FILE)
+        except Exception as e:
+            st.error(f"⚠️ Greška pri izgradnji indeksa fontova: {e}")
+            st.stop()
+
+        if not valid_fonts:
             st.error("⚠️ Nema valjanih fontova u bazi.")
             st.stop()
 
-        font_embs = np.vstack(font_embs)
-        sims = cosine_similarity(image_emb, font_embs)[0]
-        top_indices = np.argsort(sims)[::-1][:10]
-        results = [(valid_fonts[i], sims[i]) for i in top_indices]
+        # filtri se primjenjuju prije top-N, pa uvijek dobijemo do 10 rezultata
+        mask = font_meta.candidate_mask([font.get("file") for font in valid_fonts],
+                                        free=True if free_only else None, source=sources or None)
+        top_indices, top_sims = search_text_index(image_emb, font_embs, top_n=10, mask=mask)
+        results = [(valid_fonts[i], s) for i, s in zip(top_indices, top_sims)]
 
         # ----------------------------
         # PRIKAZ REZULTATA
@@ -132,30 +120,27 @@ if st.session_state.authenticated:
         st.success("✅ Pretraga završena!")
         st.markdown("## 🏆 Najsličniji fontovi:")
 
+        # kartice odmah s podacima; previewi se renderiraju konkurentno i upisuju
+        # u svoj slot čim su gotovi (spor ili neispravan font ne blokira ostale)
+        progress = st.progress(0.0)
+        preview_slots, paths = [], []
         for i, (font, score) in enumerate(results, 1):
             fname = font.get("file", "N/A")
-            fullname = font.get("full_name", fname)
-            license = font.get("license", "Nepoznata")
-            source = font.get("source", "Nepoznata")
-
-            # koristi original_path ako postoji, inače fallback na all_fonts_flat
-            path = font.get("original_path", os.path.join("data/all_fonts_flat", fname))
-
-            preview = None
-            if os.path.exists(path):
-                try:
-                    preview = render_font_preview(
-                        path,
-                        text="ABCDEFGHIJKLMNOPQRSTUVWXYZ\nabcdefghijklmnopqrstuvwxyz\n0123456789"
-                    )
-                except Exception as e:
-                    st.warning(f"⚠️ Nije moguće generirati preview za {fname}: {e}")
-            else:
-                st.warning(f"⚠️ Font datoteka nije pronađena: {path}")
-
-            st.markdown(f"### {i}. {fullname}")
+            st.markdown(f"### {i}. {font.get('full_name', fname)}")
             st.write(f"📊 Sličnost: {score:.3f}")
-            st.write(f"📄 Licenca: {license} | 🌐 Izvor: {source}")
-            if preview is not None:
-                st.image(preview, caption=f"Preview: {fname}", use_container_width=True)
+            st.write(f"📄 Licenca: {font.get('license', 'Nepoznata')} | 🌐 Izvor: {font.get('source', 'Nepoznata')}")
+            slot = st.empty()
+            slot.caption("⏳ Generiram preview...")
+            preview_slots.append(slot)
+            # font_path upisuje ingest (već dekomprimiran sfnt); stare baze → all_fonts_flat
+            paths.append(font.get("font_path") or os.path.join("data/all_fonts_flat", fname))
             st.divider()
+
+        for done, (i, preview) in enumerate(render_previews(paths, text=PREVIEW_TEXT), 1):
+            fname = results[i][0].get("file", "N/A")
+            if preview is not None:
+                preview_slots[i].image(preview, caption=f"Preview: {fname}", use_container_width=True)
+            else:
+                preview_slots[i].warning(f"⚠️ Font se ne može učitati ili render predugo traje: {paths[i]}")
+            progress.progress(done / len(paths))
+        progress.progress(1.0)
@@ -3,13 +3,11 @@
 
 import streamlit as st
 from PIL import Image
-import cv2
-import numpy as np
-import requests
-import base64
-import tempfile
-import os
 from pprint import pprint
+from concurrent.futures import ThreadPoolExecutor
+from image_prep import prepare_for_api
+from text_regions import detect_regions, draw_regions
+from whatfontis_client import identify_font, WhatFontIsError, metrics as whatfontis_metrics
 
 # ----------------------------
 # KONFIG
@@ -57,53 +55,78 @@ if st.session_state.authenticated:
         st.image(image, caption="📸 Uploadana slika", use_container_width=True)
 
         # ----------------------------
-        # Opcionalna obrada slike: razdvajanje slova ako su spojena
+        # VIŠE REGIJA TEKSTA: svaka regija ide na API paralelno
         # ----------------------------
-        np_img = np.array(image)
-        gray = cv2.cvtColor(np_img, cv2.COLOR_RGB2GRAY)
-        _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-        # Morfološka operacija za razdvajanje slova
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
-        processed = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel)
+        if st.sidebar.checkbox("🧩 Više regija teksta (naslov, tekst...)", value=False):
+            boxes = detect_regions(image) or [(0, 0, image.width, image.height)]
+            st.image(draw_regions(image, boxes), caption="🧩 Pronađene regije teksta", use_container_width=True)
+            region_params = {
+                "API_KEY": WHATFONTIS_API_KEY,
+                "NOTTEXTBOXSDETECTION": 1,
+                "FREEFONTS": 0,
+                "limit": 3,
+                "textmode": 1
+            }
+
+            def _identify_region(crop):
+                prepared = prepare_for_api(crop)
+                return identify_font(prepared["png_bytes"], region_params,
+                                     cache_image=prepared["processed"], url=WHATFONTIS_API_URL)
+
+            st.info(f"📡 Šaljem {len(boxes)} regija na WhatFontIs API...")
+            crops = [image.crop(b) for b in boxes]
+            with ThreadPoolExecutor(max_workers=min(4, len(crops))) as pool:
+                futures = [pool.submit(_identify_region, c) for c in crops]
+            for i, (crop, fut) in enumerate(zip(crops, futures), 1):
+                st.markdown(f"## Regija {i}")
+                st.image(crop, use_container_width=True)
+                try:
+                    region_results = fut.result()
+                except Exception as e:
+                    st.error(f"❌ {e}")
+                    continue
+                if isinstance(region_results, list) and region_results:
+                    for j, font in enumerate(region_results, 1):
+                        st.markdown(f"{j}. [{font.get('title', 'Nepoznat font')}]({font.get('url', '')})")
+                        if font.get("image"):
+                            st.image(font["image"], width="stretch")
+                else:
+                    st.warning("⚠️ Nije pronađen nijedan font za ovu regiju.")
+                st.divider()
+            st.stop()
 
-        # Privremeni fajl
-        tmp_path = tempfile.mktemp(suffix=".png")
-        cv2.imwrite(tmp_path, cv2.bitwise_not(processed))
+        # ----------------------------
+        # Obrada slike (image_prep): Otsu + open, izrez na tekst, smanjenje, PNG u memoriji
+        # ----------------------------
+        prepared = prepare_for_api(image)
+        processed = prepared["processed"]
+        img_bytes = prepared["png_bytes"]
 
         # Prikaz obrade
         st.image(processed, caption="🧩 Obradjena slika za prepoznavanje", use_container_width=True)
+        st.caption(f"📦 {len(img_bytes) / 1024:.1f} KB za slanje (izrez {prepared['bbox']}, "
+                   f"skala {prepared['scale']:.2f}, {prepared['seconds'] * 1000:.0f} ms)")
 
         # ----------------------------
-        # Pretvori sliku u Base64
-        # ----------------------------
-        with open(tmp_path, "rb") as f:
-            img_b64 = base64.b64encode(f.read()).decode("utf-8")
-
-        # ----------------------------
-        # Poziv prema WhatFontIs API-ju
+        # Poziv prema WhatFontIs API-ju (pooled Session, retry, cache po perceptual hashu)
         # ----------------------------
         st.info("📡 Šaljem sliku na WhatFontIs API...")
         params = {
             "API_KEY": WHATFONTIS_API_KEY,
-            "IMAGEBASE64": 1,
             "NOTTEXTBOXSDETECTION": 1, #0,
             "FREEFONTS": 0, #1,
             "limit": 10,
-            "urlimagebase64": img_b64,
             "textmode": 1
         }
 
         try:
-            r = requests.post(WHATFONTIS_API_URL, data=params, timeout=60)
-            if r.status_code != 200:
-                st.error(f"❌ API greška: {r.status_code} — {r.text}")
-            else:
-                try:
-                    results = r.json()
-                except Exception:
-                    st.error("⚠️ API nije vratio valjani JSON odgovor.")
-                    results = []
+            try:
+                results = identify_font(img_bytes, params, cache_image=processed, url=WHATFONTIS_API_URL)
+            except WhatFontIsError as e:
+                st.error(f"❌ {e}" + (f" — {e.body}" if e.body else ""))
+                results = None
 
+            if results is not None:
                 if isinstance(results, list) and len(results) > 0:
                     pprint(results)
                     st.success(f"✅ Pronađeno {len(results)} fontova!")
@@ -131,8 +154,5 @@ if st.session_state.authenticated:
         except Exception as e:
             st.error(f"💥 Greška prilikom slanja zahtjeva: {e}")
 
-        # Briši privremeni fajl
-        try:
-            os.remove(tmp_path)
-        except:
-            pass
+        with st.sidebar.expander("📈 WhatFontIs cache"):
+            st.json(whatfontis_metrics())
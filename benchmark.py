@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+benchmark.py — reproducibilni benchmark točnosti i latencije svih enginea.
+
+Upiti se sintetiziraju iz poznatih fontova kataloga (render_font_preview +
+nasumičan tekst, skaliranje, blur i šum) uz fiksni seed, pa svako pokretanje
+s istim argumentima pretražuje iste slike. Svaka kombinacija engine × veličina
+kataloga radi u svom (spawn) procesu, tako da je vršni RSS mjeren po pokretanju.
+
+Po pokretanju se mjeri:
+  • p50/p95 latencija jednog upita (nakon zagrijavanja)
+  • propusnost (upita/s) u batchu od --batch-size
+  • vršni RSS procesa
+  • top-1 / top-10 točnost (pogođen izvorni font)
+
+Rezultat je JSON (data/benchmark/), a `compare` ispisuje razlike dvaju pokretanja:
+    python3 benchmark.py run --engines vision hybrid clip-text --queries 200 --sizes 1000 full
+    python3 benchmark.py run --engines vision module:search_font_vision
+    python3 benchmark.py compare data/benchmark/stari.json data/benchmark/novi.json
+"""
+
+import os
+import sys
+import json
+import time
+import string
+import logging
+import platform
+import resource
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image, ImageFilter
+
+# ----------------------------
+# KONFIG
+# ----------------------------
+BENCH_DIR = "data/benchmark"
+DEFAULT_QUERIES = 200
+DEFAULT_SEED = 0
+DEFAULT_TOP_N = 10
+DEFAULT_BATCH_SIZE = 16
+WARMUP_QUERIES = 3
+SCALE_RANGE = (0.5, 1.25)
+BLUR_MAX = 1.5      # radijus Gaussova blura (px)
+NOISE_MAX = 12.0    # sigma aditivnog šuma (0–255)
+FONT_SIZE_RANGE = (40, 80)
+P95_TOLERANCE = 0.10   # compare: +10% p95 je regresija
+ACC_TOLERANCE = 0.01   # compare: -1 p.p. top-1/top-10 je regresija
+
+
+# ----------------------------
+# SINTETIČKI UPITI
+# ----------------------------
+def random_text(rng):
+    """1–3 "riječi" od 3–9 slova, prva velikim slovom (nije uvijek abeceda iz previewa)."""
+    words = []
+    for _ in range(rng.integers(1, 4)):
+        n = rng.integers(3, 10)
+        word = "".join(rng.choice(list(string.ascii_lowercase), n))
+        words.append(word.capitalize() if rng.random() < 0.5 else word)
+    return " ".join(words)
+
+
+def augment(img, rng):
+    """Skaliranje, blur i šum; vraća (slika, parametri) da se upit može reproducirati."""
+    scale = float(rng.uniform(*SCALE_RANGE))
+    blur = float(rng.uniform(0, BLUR_MAX))
+    noise = float(rng.uniform(0, NOISE_MAX))
+    w, h = img.size
+    img = img.resize((max(1, int(w * scale)), max(1, int(h * scale))), Image.BILINEAR)
+    if blur > 0.05:
+        img = img.filter(ImageFilter.GaussianBlur(blur))
+    arr = np.asarray(img, dtype=np.float32)
+    arr = arr + rng.normal(0, noise, arr.shape)
+    img = Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8))
+    return img, {"scale": round(scale, 3), "blur": round(blur, 3), "noise": round(noise, 3)}
+
+
+def make_queries(n=DEFAULT_QUERIES, seed=DEFAULT_SEED, out_dir=None):
+    """
+    Generiraj (ili ponovno iskoristi) n upita u data/benchmark/queries_s<seed>_n<n>/.
+    Svaki zapis manifesta: {path, file, row, text, size, aug}.
+    """
+    from match_engine import load_catalog
+    from render_font_preview import render_font_preview
+
+    out_dir = out_dir or os.path.join(BENCH_DIR, f"queries_s{seed}_n{n}")
+    manifest_path = os.path.join(out_dir, "manifest.jsonl")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            queries = [json.loads(line) for line in f if line.strip()]
+        if len(queries) == n:
+            return queries
+
+    files, meta = load_catalog()
+    candidates = [row for row, file in enumerate(files)
+                  if (meta.get(file) or {}).get("font_path") and os.path.exists(meta[file]["font_path"])]
+    if not candidates:
+        raise RuntimeError("Nema fontova s postojećim font_path u katalogu.")
+
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    queries = []
+    attempts = 0
+    while len(queries) < n and attempts < n * 5:
+        attempts += 1
+        row = int(rng.choice(candidates))
+        font = meta[files[row]]
+        text = random_text(rng)
+        size = int(rng.integers(*FONT_SIZE_RANGE))
+        img = render_font_preview(font["font_path"], text=text, size=size, use_cache=False)
+        if img is None:
+            continue
+        img, aug = augment(img, rng)
+        path = os.path.join(out_dir, f"{len(queries):05d}.png")
+        img.save(path)
+        queries.append({"path": path, "file": files[row], "row": row, "text": text, "size": size, "aug": aug})
+
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        for q in queries:
+            f.write(json.dumps(q, ensure_ascii=False) + "\n")
+    logging.info(f"✅ {len(queries)} queries written to {out_dir}")
+    return queries
+
+
+# ----------------------------
+# PODSKUP KATALOGA
+# ----------------------------
+class SubsetIndex:
+    """Exact pretraga nad podskupom redaka; vraća originalne retke visual_index.json."""
+
+    backend = "subset"
+
+    def __init__(self, store, rows):
+        from vector_index import ExactIndex
+
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.inner = ExactIndex(store.rows(self.rows))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def search(self, queries, k=10):
+        ids, scores = self.inner.search(queries, k)
+        return self.rows[ids], scores
+
+
+def catalog_rows(total, size, required_rows, seed):
+    """`size` redaka koji sigurno sadrže izvorne fontove upita (ostatak nasumično, uz seed)."""
+    required = np.unique(np.asarray(required_rows, dtype=np.int64))
+    if size >= total:
+        return None
+    rest = np.setdiff1d(np.arange(total), required)
+    rng = np.random.default_rng(seed)
+    extra = rng.choice(rest, max(0, size - len(required)), replace=False)
+    return np.sort(np.concatenate([required, extra]))
+
+
+# ----------------------------
+# JEDNO POKRETANJE (u zasebnom procesu)
+# ----------------------------
+def _percentile(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 2) if values else None
+
+
+def _result_file(r):
+    if isinstance(r, dict):
+        return r.get("file")
+    return r[0] if isinstance(r, (list, tuple)) and r else None
+
+
+def run_one(engine, queries, size, seed=DEFAULT_SEED, top_n=DEFAULT_TOP_N, batch_size=DEFAULT_BATCH_SIZE):
+    """Jedan engine nad jednom veličinom kataloga; vraća dict metrika."""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    images = []
+    for q in queries:
+        with Image.open(q["path"]) as f:
+            images.append(f.convert("RGB"))
+
+    catalog_size = None
+    if engine.startswith("module:"):
+        import importlib
+        find = importlib.import_module(engine.split(":", 1)[1]).find_most_similar_font
+
+        def search_one(i):
+            return find(queries[i]["path"], top_n=top_n)
+
+        search_many = None
+    else:
+        from match_engine import search_batch, load_catalog
+
+        index = None
+        if engine in ("vision", "hybrid"):
+            from vector_index import get_visual_index
+            full = get_visual_index()
+            catalog_size = len(full)
+            if size != "full":
+                rows = catalog_rows(len(full), int(size), [q["row"] for q in queries], seed)
+                if rows is not None:
+                    from embedding_store import open_embeddings
+                    index = SubsetIndex(open_embeddings(), rows)
+                    catalog_size = len(index)
+        elif engine == "clip-text":
+            catalog_size = len(load_catalog()[1])
+        else:
+            catalog_size = len(load_catalog()[0])
+
+        def search_one(i):
+            return search_batch([images[i]], engine=engine, top_n=top_n, index=index)[0]
+
+        def search_many(batch):
+            return search_batch(batch, engine=engine, top_n=top_n, index=index)
+
+    for i in range(min(WARMUP_QUERIES, len(queries))):
+        search_one(i)
+
+    latencies, top1, top10 = [], 0, 0
+    for i, q in enumerate(queries):
+        t0 = time.perf_counter()
+        results = search_one(i)
+        latencies.append(time.perf_counter() - t0)
+        found = [_result_file(r) for r in results or []]
+        top1 += int(found[:1] == [q["file"]])
+        top10 += int(q["file"] in found[:10])
+
+    throughput = None
+    if search_many is not None:
+        t0 = time.perf_counter()
+        for start in range(0, len(images), batch_size):
+            search_many(images[start:start + batch_size])
+        throughput = round(len(images) / max(time.perf_counter() - t0, 1e-9), 2)
+    elif latencies:
+        throughput = round(len(latencies) / sum(latencies), 2)
+
+    n = max(1, len(queries))
+    return {
+        "engine": engine,
+        "size": size,
+        "catalog_size": catalog_size,
+        "queries": len(queries),
+        "p50_ms": _percentile(latencies, 50),
+        "p95_ms": _percentile(latencies, 95),
+        "mean_ms": round(float(np.mean(latencies)) * 1000, 2) if latencies else None,
+        "throughput_qps": throughput,
+        "batch_size": batch_size if search_many is not None else 1,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "top1": round(top1 / n, 4),
+        "top10": round(top10 / n, 4),
+    }
+
+
+# ----------------------------
+# CIJELI BENCHMARK
+# ----------------------------
+def _environment():
+    env = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+    }
+    try:
+        import torch
+        env["torch"] = torch.__version__
+        env["cuda"] = torch.cuda.is_available()
+    except ImportError:
+        pass
+    try:
+        env["git"] = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                    text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return env
+
+
+def run(engines, n_queries=DEFAULT_QUERIES, sizes=("full",), seed=DEFAULT_SEED, top_n=DEFAULT_TOP_N,
+        batch_size=DEFAULT_BATCH_SIZE, out=None):
+    queries = make_queries(n_queries, seed)
+    ctx = multiprocessing.get_context("spawn")
+    runs = []
+    for engine in engines:
+        # veličina kataloga vrijedi samo za vizualni indeks
+        engine_sizes = sizes if engine in ("vision", "hybrid") else ["full"]
+        for size in engine_sizes:
+            logging.info(f"▶️ {engine} @ {size}")
+            try:
+                with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                    result = pool.submit(run_one, engine, queries, size, seed, top_n, batch_size).result()
+            except Exception as e:
+                logging.error(f"❌ {engine} @ {size}: {e}")
+                result = {"engine": engine, "size": size, "error": str(e)}
+            logging.info(json.dumps(result))
+            runs.append(result)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"queries": len(queries), "seed": seed, "top_n": top_n, "batch_size": batch_size,
+                   "sizes": list(sizes), "engines": list(engines)},
+        "environment": _environment(),
+        "runs": runs,
+    }
+    out = out or os.path.join(BENCH_DIR, f"results-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    logging.info(f"✅ Results saved to {out}")
+    return report
+
+
+def compare(old, new, p95_tolerance=P95_TOLERANCE, acc_tolerance=ACC_TOLERANCE):
+    """Razlike po (engine, size); vraća listu regresija (prazna = OK)."""
+    old_runs = {(r["engine"], str(r["size"])): r for r in old["runs"] if "error" not in r}
+    regressions = []
+    print(f"{'engine':<28} {'size':>8} {'p95 ms':>18} {'top1':>16} {'top10':>16}")
+    for r in new["runs"]:
+        key = (r["engine"], str(r["size"]))
+        base = old_runs.get(key)
+        if base is None or "error" in r:
+            print(f"{key[0]:<28} {key[1]:>8}  {'(nema usporedbe)' if base is None else r['error']}")
+            continue
+        p95 = f"{base['p95_ms']}→{r['p95_ms']}"
+        t1 = f"{base['top1']}→{r['top1']}"
+        t10 = f"{base['top10']}→{r['top10']}"
+        print(f"{key[0]:<28} {key[1]:>8} {p95:>18} {t1:>16} {t10:>16}")
+        if base["p95_ms"] and r["p95_ms"] > base["p95_ms"] * (1 + p95_tolerance):
+            regressions.append(f"{key}: p95 {base['p95_ms']} → {r['p95_ms']} ms")
+        for metric in ("top1", "top10"):
+            if r[metric] < base[metric] - acc_tolerance:
+                regressions.append(f"{key}: {metric} {base[metric]} → {r[metric]}")
+    return regressions
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s", stream=sys.stderr)
+    parser = argparse.ArgumentParser(description="Accuracy/latency benchmark across search engines")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_run = sub.add_parser("run")
+    p_run.add_argument("--engines", nargs="+", default=["vision", "hybrid", "clip-text", "glyph", "cascade"],
+                       help="vision, hybrid, clip-text, glyph, cascade or module:<search module>")
+    p_run.add_argument("--queries", type=int, default=DEFAULT_QUERIES)
+    p_run.add_argument("--sizes", nargs="+", default=["full"], help="catalog sizes (rows) or 'full'")
+    p_run.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    p_run.add_argument("--top-n", type=int, default=DEFAULT_TOP_N)
+    p_run.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    p_run.add_argument("--out", default=None)
+
+    p_cmp = sub.add_parser("compare")
+    p_cmp.add_argument("old")
+    p_cmp.add_argument("new")
+    p_cmp.add_argument("--p95-tolerance", type=float, default=P95_TOLERANCE)
+    p_cmp.add_argument("--acc-tolerance", type=float, default=ACC_TOLERANCE)
+    args = parser.parse_args()
+
+    if args.cmd == "run":
+        run(args.engines, args.queries, args.sizes, args.seed, args.top_n, args.batch_size, args.out)
+    else:
+        with open(args.old, "r", encoding="utf-8") as f:
+            old = json.load(f)
+        with open(args.new, "r", encoding="utf-8") as f:
+            new = json.load(f)
+        regressions = compare(old, new, args.p95_tolerance, args.acc_tolerance)
+        for line in regressions:
+            print(f"⚠️ {line}")
+        sys.exit(1 if regressions else 0)
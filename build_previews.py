@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+build_previews.py — paralelni, inkrementalni build previewa (WebP + sprite sheetovi).
+
+  • render: process pool preko render_font_preview (isti tekst/veličina kao embeddingi)
+  • inkrementalno: manifest.json u direktoriju previewa pamti sha256 fonta i hash
+    parametara rendera; nepromijenjeni fontovi se iz prošle generacije (reuse_dir)
+    hardlinkaju umjesto ponovnog rendera
+  • izlaz:
+      <file>.webp            pojedinačni preview (lossless WebP)
+      sheet_0000.webp ...    sprite sheetovi od SHEET_COLS × SHEET_ROWS ćelija
+      atlas.json             {"cell": [w, h], "cols", "rows", "sheets": [...],
+                              "entries": {file: [sheet, col, row]}}
+
+Učitavanje tisuća referenci (PreviewAtlas.iter_cells) tako je nekoliko velikih
+sekvencijalnih čitanja i dekodiranja umjesto tisuća malih otvaranja datoteka,
+uz samo jedan dekodirani sheet u memoriji.
+
+    python3 build_previews.py build [--db data/fonts_db.json] [--out data/previews] [--workers 8]
+    python3 build_previews.py info [--dir data/previews]
+"""
+
+import os
+import io
+import json
+import hashlib
+import logging
+import threading
+import numpy as np
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+
+# ----------------------------
+# KONFIG
+# ----------------------------
+FONT_DB_FILE = "data/fonts_db.json"
+PREVIEW_DIR = "data/previews"
+FONT_DIR = "data/all_fonts_flat"
+MANIFEST_NAME = "manifest.json"
+ATLAS_NAME = "atlas.json"
+PREVIEW_TEXT = "ABCDEFGHIJKLMNOPQRSTUVWXYZ\nabcdefghijklmnopqrstuvwxyz\n0123456789"
+PREVIEW_SIZE = 64
+PREVIEW_IMAGE_SIZE = (512, 256)
+SHEET_COLS = 8
+SHEET_ROWS = 16       # 8 × 16 ćelija od 512×256 → 4096×4096 px po sheetu
+WEBP_METHOD = 4       # 0 (brzo) – 6 (najmanje datoteke)
+DEFAULT_WORKERS = os.cpu_count() or 4
+
+
+def render_params():
+    """Sve što utječe na piksele previewa; promjena → ponovni render svih fontova."""
+    return {"text": PREVIEW_TEXT, "size": PREVIEW_SIZE, "image_size": list(PREVIEW_IMAGE_SIZE)}
+
+
+def params_hash(params):
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def preview_name(file):
+    # puno ime fonta + .webp (Foo.ttf i Foo.otf ne smiju dijeliti preview)
+    return file + ".webp"
+
+
+def _encode_webp(img):
+    buf = io.BytesIO()
+    img.save(buf, format="WEBP", lossless=True, method=WEBP_METHOD)
+    return buf.getvalue()
+
+
+def _render_worker(item):
+    """(file, font_path) → (file, webp bajtovi) ili (file, None)."""
+    file, font_path = item
+    from render_font_preview import render_font_preview
+
+    # render_cache se ne puni: ovaj build ima vlastiti inkrementalni manifest
+    img = render_font_preview(font_path, text=PREVIEW_TEXT, size=PREVIEW_SIZE,
+                              image_size=PREVIEW_IMAGE_SIZE, use_cache=False)
+    if img is None:
+        return file, None
+    return file, _encode_webp(img.convert("L"))
+
+
+def _load_manifest(preview_dir):
+    try:
+        with open(os.path.join(preview_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _reuse(file, reuse_dir, out_dir):
+    src = os.path.join(reuse_dir, preview_name(file))
+    dest = os.path.join(out_dir, preview_name(file))
+    if os.path.abspath(src) != os.path.abspath(dest):
+        try:
+            os.link(src, dest)
+        except FileExistsError:
+            pass
+        except OSError:
+            import shutil
+            shutil.copy2(src, dest)
+
+
+class PreviewBuild:
+    """
+    Inkrementalni build u paketima: add() odmah preuzima nepromijenjene i
+    renderira nove previewe (npr. iz ingest toka dok collect još radi),
+    finish() zapisuje sprite sheetove i manifest. font_path iz baze čita se
+    kroz `path_map` ({aktivni: staging}, kao build_visual_embeddings.local_path),
+    jer ingest renderira prije nego što su staging direktoriji aktivirani.
+    """
+
+    def __init__(self, font_dir=FONT_DIR, out_dir=PREVIEW_DIR, reuse_dir=None, workers=DEFAULT_WORKERS,
+                 path_map=None):
+        os.makedirs(out_dir, exist_ok=True)
+        self.font_dir = font_dir
+        self.out_dir = out_dir
+        self.reuse_dir = reuse_dir or out_dir
+        self.path_map = path_map
+        self.params = render_params()
+        self.p_hash = params_hash(self.params)
+        self.old = _load_manifest(self.reuse_dir)
+        self.fonts = []  # (file, sha) redoslijedom dolaska
+        self.seen, self.ok = set(), set()
+        self.reused = self.failed = 0
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+
+    def add(self, db):
+        from build_visual_embeddings import local_path
+
+        todo = []
+        for font in db:
+            file = font.get("file")
+            if not file or file in self.seen:
+                continue
+            self.seen.add(file)
+            sha = font.get("sha256")
+            self.fonts.append((file, sha))
+            font_path = local_path(font.get("font_path") or os.path.join(self.font_dir, file), self.path_map)
+            prev = self.old.get(file)
+            if (sha and prev and prev.get("sha256") == sha and prev.get("params") == self.p_hash
+                    and os.path.exists(os.path.join(self.reuse_dir, preview_name(file)))):
+                try:
+                    _reuse(file, self.reuse_dir, self.out_dir)
+                    self.ok.add(file)
+                    self.reused += 1
+                    continue
+                except OSError as e:
+                    logging.warning(f"⚠️ Cannot reuse preview for {file}: {e}")
+            todo.append((file, font_path))
+
+        for file, webp in self.pool.map(_render_worker, todo, chunksize=16):
+            if webp is None:
+                self.failed += 1
+                continue
+            tmp_path = os.path.join(self.out_dir, preview_name(file) + ".tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(webp)
+            os.replace(tmp_path, os.path.join(self.out_dir, preview_name(file)))
+            self.ok.add(file)
+
+    def finish(self):
+        self.close()
+        manifest = {file: {"sha256": sha, "params": self.p_hash} for file, sha in self.fonts if file in self.ok}
+        write_atlas([file for file, _ in self.fonts if file in self.ok], self.out_dir, self.params)
+        with open(os.path.join(self.out_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1, ensure_ascii=False)
+        logging.info(f"✅ Previews in {self.out_dir}: {len(self.fonts)} fonts, {self.reused} unchanged, "
+                     f"{len(self.ok) - self.reused} rendered, {self.failed} unrenderable")
+        return manifest
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+def build_previews(db, font_dir=FONT_DIR, out_dir=PREVIEW_DIR, reuse_dir=None, workers=DEFAULT_WORKERS,
+                   path_map=None):
+    """
+    Renderiraj previewe za sve zapise baze (font_path, inače font_dir/file) u out_dir.
+    reuse_dir je prošla generacija (npr. aktivni data/previews kad se gradi u _new).
+    """
+    builder = PreviewBuild(font_dir, out_dir, reuse_dir, workers, path_map)
+    try:
+        builder.add(db)
+    except BaseException:
+        builder.close()
+        raise
+    return builder.finish()
+
+
+def write_atlas(files, out_dir, params):
+    """
+    Zapakiraj <file>.webp iz out_dir u sprite sheetove redoslijedom `files` i
+    zapiši atlas.json. U memoriji je samo jedan sheet odjednom.
+    """
+    w, h = PREVIEW_IMAGE_SIZE
+    per_sheet = SHEET_COLS * SHEET_ROWS
+    for name in os.listdir(out_dir):
+        if name.startswith("sheet_") and name.endswith(".webp"):
+            os.remove(os.path.join(out_dir, name))  # broj sheetova se može smanjiti
+
+    sheets, entries = [], {}
+    for start in range(0, len(files), per_sheet):
+        chunk = files[start:start + per_sheet]
+        rows_used = (len(chunk) + SHEET_COLS - 1) // SHEET_COLS
+        sheet = np.full((rows_used * h, SHEET_COLS * w), 255, dtype=np.uint8)
+        sheet_no = len(sheets)
+        for i, file in enumerate(chunk):
+            col, row = i % SHEET_COLS, i // SHEET_COLS
+            with Image.open(os.path.join(out_dir, preview_name(file))) as f:
+                sheet[row * h:(row + 1) * h, col * w:(col + 1) * w] = np.asarray(f.convert("L"))
+            entries[file] = [sheet_no, col, row]
+        name = f"sheet_{sheet_no:04d}.webp"
+        Image.fromarray(sheet).save(os.path.join(out_dir, name), format="WEBP", lossless=True, method=WEBP_METHOD)
+        sheets.append(name)
+
+    atlas = {"cell": [w, h], "cols": SHEET_COLS, "rows": SHEET_ROWS, "params": params,
+             "sheets": sheets, "entries": entries}
+    tmp_path = os.path.join(out_dir, ATLAS_NAME + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(atlas, f, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(out_dir, ATLAS_NAME))
+    return atlas
+
+
+class PreviewAtlas:
+    """Čitanje previewa iz sprite sheetova; jedan sheet se dekodira jednom za sve njegove ćelije."""
+
+    def __init__(self, preview_dir=PREVIEW_DIR):
+        self.dir = preview_dir
+        with open(os.path.join(preview_dir, ATLAS_NAME), "r", encoding="utf-8") as f:
+            self.atlas = json.load(f)
+        self.cell = tuple(self.atlas["cell"])
+        self.entries = self.atlas["entries"]
+
+    def __contains__(self, file):
+        return file in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _sheet(self, sheet_no):
+        with Image.open(os.path.join(self.dir, self.atlas["sheets"][sheet_no])) as f:
+            return np.asarray(f.convert("L"), dtype=np.uint8)
+
+    def _cell(self, sheet, col, row):
+        w, h = self.cell
+        return sheet[row * h:(row + 1) * h, col * w:(col + 1) * w]
+
+    def get(self, file):
+        """Jedan preview kao L PIL slika (za pojedinačne je brži <file>.webp)."""
+        if file not in self.entries:
+            return None
+        path = os.path.join(self.dir, preview_name(file))
+        if os.path.exists(path):
+            with Image.open(path) as f:
+                return f.convert("L")
+        sheet_no, col, row = self.entries[file]
+        return Image.fromarray(self._cell(self._sheet(sheet_no), col, row))
+
+    def iter_cells(self, files=None):
+        """
+        Generator (file, uint8 (H, W)) za zadane (ili sve) fontove. Sheetovi se
+        čitaju redom, svaki jednom, i u memoriji je samo trenutni: ćelija je pogled
+        u njega pa je pozivatelj mora obraditi (ili kopirati) prije sljedeće.
+        """
+        files = list(self.entries) if files is None else [f for f in files if f in self.entries]
+        by_sheet = {}
+        for file in files:
+            sheet_no, col, row = self.entries[file]
+            by_sheet.setdefault(sheet_no, []).append((file, col, row))
+        for sheet_no in sorted(by_sheet):
+            sheet = self._sheet(sheet_no)
+            for file, col, row in by_sheet[sheet_no]:
+                yield file, self._cell(sheet, col, row)
+            del sheet
+
+
+_lock = threading.Lock()
+_atlases = {}
+
+
+def get_atlas(preview_dir=PREVIEW_DIR):
+    """PreviewAtlas jednom po procesu (ponovno kad se atlas.json zamijeni), ili None."""
+    path = os.path.join(preview_dir, ATLAS_NAME)
+    with _lock:
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        cached = _atlases.get(preview_dir)
+        if cached is None or cached[0] != mtime:
+            cached = _atlases[preview_dir] = (mtime, PreviewAtlas(preview_dir))
+        return cached[1]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Parallel incremental preview build (WebP + sprite sheets)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_build = sub.add_parser("build")
+    p_build.add_argument("--db", default=FONT_DB_FILE)
+    p_build.add_argument("--fonts", default=FONT_DIR)
+    p_build.add_argument("--out", default=PREVIEW_DIR)
+    p_build.add_argument("--reuse", default=None)
+    p_build.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    p_info = sub.add_parser("info")
+    p_info.add_argument("--dir", default=PREVIEW_DIR)
+    args = parser.parse_args()
+
+    if args.cmd == "build":
+        with open(args.db, "r", encoding="utf-8") as f:
+            build_previews(json.load(f), args.fonts, args.out, args.reuse, args.workers)
+    else:
+        atlas = PreviewAtlas(args.dir)
+        size = sum(os.path.getsize(os.path.join(args.dir, s)) for s in atlas.atlas["sheets"])
+        print(json.dumps({"fonts": len(atlas), "sheets": len(atlas.atlas["sheets"]),
+                          "sheet_bytes": size, "cell": atlas.cell}))
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+build_visual_embeddings.py — paralelni, inkrementalni i nastavljivi build
+data/visual_embeddings.npy + data/visual_index.json.
+
+  • render: process pool preko render_font_preview
+  • embedding: ResNet50 (bez fc sloja) u batchevima, podesiv batch i broj torch threadova
+  • manifest (data/visual_manifest.json): sha256 fonta → red; ponovni build
+    embedda samo nove/promijenjene fontove, a obrisane izbacuje
+  • checkpoint (data/visual_build_ckpt/): svaki gotov batch se odmah sprema,
+    pa prekinuti build nastavlja gdje je stao
+
+    python3 build_visual_embeddings.py [--workers 8] [--batch-size 64] [--threads 4]
+                                       [--full] [--store-dtype float16]
+"""
+
+import os
+import json
+import glob
+import time
+import shutil
+import hashlib
+import logging
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+# ----------------------------
+# KONFIG
+# ----------------------------
+FONT_DB_FILE = "data/fonts_db.json"
+EMBEDDINGS_FILE = "data/visual_embeddings.npy"
+INDEX_FILE = "data/visual_index.json"
+MANIFEST_FILE = "data/visual_manifest.json"
+CHECKPOINT_DIR = "data/visual_build_ckpt"
+LOG_FILE = "logs/build_visual_embeddings.log"
+
+MODEL_NAME = "resnet50-avgpool"
+PREVIEW_TEXT = "ABCDEFGHIJKLMNOPQRSTUVWXYZ\nabcdefghijklmnopqrstuvwxyz\n0123456789"
+PREVIEW_SIZE = 64
+PREVIEW_IMAGE_SIZE = (512, 256)
+DEFAULT_WORKERS = os.cpu_count() or 4
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_TORCH_THREADS = max(1, (os.cpu_count() or 4) // 2)
+
+
+def build_params():
+    """Sve što utječe na vektor; promjena bilo čega → puni rebuild."""
+    return {
+        "model": MODEL_NAME,
+        "text": PREVIEW_TEXT,
+        "size": PREVIEW_SIZE,
+        "image_size": list(PREVIEW_IMAGE_SIZE),
+    }
+
+
+def sha256sum(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _hash_worker(font_path):
+    try:
+        return font_path, sha256sum(font_path)
+    except OSError as e:
+        logging.warning(f"⚠️ Cannot hash {font_path}: {e}")
+        return font_path, None
+
+
+def _render_worker(item):
+    """(sha, font_path) → (sha, uint8 HxWx3 ili None). Izvodi se u zasebnom procesu."""
+    sha, font_path = item
+    from render_font_preview import render_font_preview
+    # render_cache je za upite; build ima vlastiti manifest/checkpoint
+    img = render_font_preview(font_path, text=PREVIEW_TEXT, size=PREVIEW_SIZE,
+                              image_size=PREVIEW_IMAGE_SIZE, use_cache=False)
+    return sha, (np.asarray(img, dtype=np.uint8) if img is not None else None)
+
+
+def load_resnet(device, threads=DEFAULT_TORCH_THREADS):
+    import torch
+    from model_registry import load_resnet50
+
+    torch.set_num_threads(threads)
+    return load_resnet50(device)
+
+
+def embed_batch(model, preprocess, device, arrays):
+    """Lista uint8 slika → L2-normalizirana float32 matrica (len × 2048)."""
+    import torch
+    from PIL import Image
+
+    batch = torch.stack([preprocess(Image.fromarray(a)) for a in arrays]).to(device)
+    with torch.no_grad():
+        feats = model(batch).flatten(1).float()
+    feats /= feats.norm(dim=-1, keepdim=True).clamp_min(1e-12)
+    return feats.cpu().numpy()
+
+
+# ----------------------------
+# MANIFEST I CHECKPOINT
+# ----------------------------
+def load_previous(params):
+    """Vrati {sha: vektor} iz prošlog builda, ako je rađen s istim parametrima."""
+    if not (os.path.exists(MANIFEST_FILE) and os.path.exists(EMBEDDINGS_FILE)):
+        return {}
+    try:
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("params") != params:
+            logging.info("ℹ️ Build parameters changed — full rebuild")
+            return {}
+        matrix = np.load(EMBEDDINGS_FILE, mmap_mode="r")
+        if matrix.shape[0] != len(manifest["rows"]):
+            logging.warning("⚠️ Manifest does not match visual_embeddings.npy — full rebuild")
+            return {}
+        return {row["sha256"]: np.array(matrix[i]) for i, row in enumerate(manifest["rows"])}
+    except Exception as e:
+        logging.warning(f"⚠️ Cannot read previous build: {e}")
+        return {}
+
+
+def load_checkpoint(params):
+    """Vrati {sha: vektor ili None} iz prekinutog builda s istim parametrima."""
+    meta_file = os.path.join(CHECKPOINT_DIR, "params.json")
+    done = {}
+    if os.path.exists(meta_file):
+        with open(meta_file, "r", encoding="utf-8") as f:
+            if json.load(f) != params:
+                shutil.rmtree(CHECKPOINT_DIR, ignore_errors=True)
+                return done
+        for part in sorted(glob.glob(os.path.join(CHECKPOINT_DIR, "part_*.npz"))):
+            try:
+                with np.load(part, allow_pickle=False) as data:
+                    for sha, vec in zip(data["shas"], data["vectors"]):
+                        done[str(sha)] = vec
+                    for sha in data["failed"]:
+                        done[str(sha)] = None
+            except Exception as e:
+                logging.warning(f"⚠️ Skipping corrupt checkpoint {part}: {e}")
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    with open(meta_file, "w", encoding="utf-8") as f:
+        json.dump(params, f)
+    return done
+
+
+def save_checkpoint_part(part_no, shas, vectors, failed):
+    path = os.path.join(CHECKPOINT_DIR, f"part_{part_no:06d}.npz")
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path,
+             shas=np.asarray(shas, dtype="U64"),
+             vectors=np.asarray(vectors, dtype=np.float32),
+             failed=np.asarray(failed, dtype="U64"))
+    os.replace(tmp_path, path)
+
+
+# ----------------------------
+# BUILD
+# ----------------------------
+def list_fonts(db_file=FONT_DB_FILE):
+    """Jedinstveni (file, font_path) parovi iz fonts_db.json, redoslijedom baze."""
+    with open(db_file, "r", encoding="utf-8") as f:
+        fonts_db = json.load(f)
+    seen = set()
+    fonts = []
+    for font in fonts_db:
+        fname = font.get("file")
+        if not fname or fname in seen:
+            continue
+        seen.add(fname)
+        fonts.append((fname, font.get("font_path") or os.path.join("data/all_fonts_flat", fname)))
+    return fonts
+
+
+def local_path(font_path, path_map=None):
+    """
+    font_path iz baze → putanja s koje se čita. Baza uvijek bilježi aktivne
+    direktorije; ingest prije aktivacije čita iz staging direktorija
+    ({aktivni: staging}). Uspoređuje se cijela komponenta putanje, jer je
+    "all_fonts_flat" prefiks od "all_fonts_flat_converted".
+    """
+    for active, staged in (path_map or {}).items():
+        if font_path.startswith(active.rstrip("/") + "/"):
+            return staged.rstrip("/") + font_path[len(active.rstrip("/")):]
+    return font_path
+
+
+class EmbeddingBuild:
+    """
+    Inkrementalni build u paketima: add() hashira, renderira i embedda fontove
+    čim stignu (npr. iz ingest toka dok collect još radi), finish() zapisuje
+    npy + index + manifest + store. Prošli build za inkrementalnost se uvijek
+    čita iz aktivnih EMBEDDINGS_FILE/MANIFEST_FILE; izlazne putanje su podesive
+    da ingest gradi novu generaciju pokraj aktivne.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, batch_size=DEFAULT_BATCH_SIZE, threads=DEFAULT_TORCH_THREADS,
+                 full=False, path_map=None):
+        self.t_start = time.perf_counter()
+        self.workers = workers
+        self.batch_size = batch_size
+        self.threads = threads
+        self.path_map = path_map
+        self.params = build_params()
+        self.known = {} if full else load_previous(self.params)
+        self.known.update(load_checkpoint(self.params))
+        self.part_no = len(glob.glob(os.path.join(CHECKPOINT_DIR, "part_*.npz")))
+        self.fonts = []          # (file, font_path iz baze, sha) redoslijedom dolaska
+        self.seen, self.queued = set(), set()
+        self.shas, self.arrays, self.failed = [], [], []
+        self.embedded = self.reused = 0
+        self.model = None
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+
+    def add(self, fonts):
+        """fonts: [(file, font_path iz baze)]; duplikati po `file` se preskaču."""
+        fonts = [(fname, path) for fname, path in fonts if fname not in self.seen]
+        self.seen.update(fname for fname, _ in fonts)
+        hashes = dict(self.pool.map(_hash_worker, [local_path(p, self.path_map) for _, p in fonts], chunksize=64))
+        todo = []
+        for fname, path in fonts:
+            sha = hashes.get(local_path(path, self.path_map))
+            if not sha:
+                continue
+            self.fonts.append((fname, path, sha))
+            if sha in self.queued:
+                continue
+            self.queued.add(sha)
+            if sha in self.known:
+                self.reused += 1
+            else:
+                todo.append((sha, local_path(path, self.path_map)))
+        for sha, arr in self.pool.map(_render_worker, todo, chunksize=8):
+            if arr is None:
+                self.failed.append(sha)
+            else:
+                self.shas.append(sha)
+                self.arrays.append(arr)
+            if len(self.arrays) >= self.batch_size:
+                self._flush()
+
+    def _flush(self):
+        vectors = np.zeros((0, 2048), dtype=np.float32)
+        if self.arrays:
+            if self.model is None:
+                import torch
+                self.device = "cuda" if torch.cuda.is_available() else "cpu"
+                self.model, self.preprocess = load_resnet(self.device, self.threads)
+            vectors = embed_batch(self.model, self.preprocess, self.device, self.arrays)
+        save_checkpoint_part(self.part_no, self.shas, vectors, self.failed)
+        for sha, vec in zip(self.shas, vectors):
+            self.known[sha] = vec
+        for sha in self.failed:
+            self.known[sha] = None
+        self.embedded += len(self.shas) + len(self.failed)
+        self.part_no += 1
+        logging.info(f"   … {self.embedded} embedded")
+        self.shas, self.arrays, self.failed = [], [], []
+
+    def finish(self, store_dtype=None, embeddings_file=EMBEDDINGS_FILE, index_file=INDEX_FILE,
+               manifest_file=MANIFEST_FILE, store_dir=None):
+        if self.shas or self.failed:
+            self._flush()
+        self.close()
+        rows = [(fname, path, sha) for fname, path, sha in self.fonts if self.known.get(sha) is not None]
+        matrix = np.stack([self.known[sha] for _, _, sha in rows]).astype(np.float32) if rows \
+            else np.zeros((0, 2048), dtype=np.float32)
+        write_outputs(matrix, rows, self.params, embeddings_file, index_file, manifest_file)
+        refresh_store(matrix, store_dtype, embeddings_file, store_dir)
+        shutil.rmtree(CHECKPOINT_DIR, ignore_errors=True)
+        logging.info(f"✅ visual embeddings: {matrix.shape[0]} rows ({self.reused} reused, {self.embedded} "
+                     f"embedded) in {time.perf_counter() - self.t_start:.1f}s")
+        return matrix.shape[0]
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+def build(workers=DEFAULT_WORKERS, batch_size=DEFAULT_BATCH_SIZE, threads=DEFAULT_TORCH_THREADS,
+          full=False, db_file=FONT_DB_FILE, store_dtype=None):
+    fonts = list_fonts(db_file)
+    logging.info(f"➡️ {len(fonts)} fonts (workers={workers}, batch={batch_size}, threads={threads})")
+    builder = EmbeddingBuild(workers, batch_size, threads, full)
+    try:
+        builder.add(fonts)
+    except BaseException:
+        builder.close()
+        raise
+    return builder.finish(store_dtype)
+
+
+def refresh_store(matrix, store_dtype=None, embeddings_file=EMBEDDINGS_FILE, store_dir=None):
+    """
+    Uskladi mmap store s novim visual_embeddings.npy. Bez `store_dtype` zadržava
+    se dtype postojećeg (aktivnog) storea; store se preskače samo ako je već
+    izgrađen iz identičnog .npy u istom dtypeu.
+    """
+    from embedding_store import STORE_DIR, write_store
+
+    def read_meta(path):
+        meta_file = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_file):
+            return {}
+        with open(meta_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    store_dir = store_dir or STORE_DIR
+    meta = read_meta(store_dir)
+    dtype = store_dtype or meta.get("dtype") or read_meta(STORE_DIR).get("dtype")
+    if not dtype:
+        return
+    source = sha256sum(embeddings_file)
+    if meta.get("source_sha256") == source and meta.get("dtype") == dtype:
+        logging.info(f"✅ Embedding store {store_dir} already matches {embeddings_file}")
+        return
+    write_store(matrix, store_dir, dtype=dtype, source_sha256=source)
+
+
+def write_outputs(matrix, rows, params, embeddings_file=EMBEDDINGS_FILE, index_file=INDEX_FILE,
+                  manifest_file=MANIFEST_FILE):
+    """npy + index + manifest idu preko tmp datoteka i os.replace; manifest zadnji."""
+    tmp_npy = embeddings_file + ".tmp.npy"
+    np.save(tmp_npy, matrix)
+    os.replace(tmp_npy, embeddings_file)
+
+    tmp_index = index_file + ".tmp"
+    with open(tmp_index, "w", encoding="utf-8") as f:
+        json.dump([fname for fname, _, _ in rows], f, ensure_ascii=False)
+    os.replace(tmp_index, index_file)
+
+    manifest = {
+        "version": 1,
+        "params": params,
+        "rows": [{"file": fname, "font_path": path, "sha256": sha} for fname, path, sha in rows],
+    }
+    tmp_manifest = manifest_file + ".tmp"
+    with open(tmp_manifest, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_manifest, manifest_file)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        handlers=[
+            logging.FileHandler(LOG_FILE, encoding="utf-8"),
+            logging.StreamHandler()
+        ]
+    )
+    parser = argparse.ArgumentParser(description="Build visual_embeddings.npy + visual_index.json")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--threads", type=int, default=DEFAULT_TORCH_THREADS)
+    parser.add_argument("--db", default=FONT_DB_FILE)
+    parser.add_argument("--full", action="store_true", help="ignore previous build and re-embed everything")
+    parser.add_argument("--store-dtype", choices=["float32", "float16", "int8"], default=None,
+                        help="write the mmap embedding store in this dtype (default: refresh an "
+                             "existing store in its current dtype)")
+    args = parser.parse_args()
+    build(workers=args.workers, batch_size=args.batch_size, threads=args.threads,
+          full=args.full, db_file=args.db, store_dtype=args.store_dtype)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+cascade.py — coarse-to-fine pretraga: pHash → embedding → SSIM.
+
+  1. pHash: 64-bitni perceptualni hash svakog previewa pakiran u jedan uint64
+     niz (data/phash.npy, poravnat s visual_index.json). Upit se uspoređuje sa
+     SVIM fontovima vektoriziranim XOR + popcount; zadržava se PHASH_KEEP
+     najbližih po Hammingovoj udaljenosti.
+  2. embedding: ResNet50 upita · retci embedding_storea samo za preživjele.
+  3. SSIM: ssim_rerank.rerank samo nad EMBED_KEEP najboljih; konačni score
+     kao u hybrid engineu.
+
+Svaka granica je podesiva (argumenti search_cascade), pa skupe faze vide samo
+mali skup kandidata.
+
+    python3 cascade.py build          # data/phash.npy iz data/ssim_refs.npy
+    python3 cascade.py query slika.png --phash-keep 2000 --embed-keep 100
+"""
+
+import os
+import json
+import logging
+import threading
+import cv2
+import numpy as np
+import tracing
+from embedding_store import file_stamp
+
+try:
+    import imagehash
+except ImportError:
+    imagehash = None
+
+# ----------------------------
+# KONFIG
+# ----------------------------
+INDEX_FILE = "data/visual_index.json"
+PHASH_FILE = "data/phash.npy"
+PHASH_META_FILE = "data/phash.json"
+PHASH_KEEP = 2000   # faza 1 → faza 2
+EMBED_KEEP = 100    # faza 2 → faza 3 (SSIM)
+EMBED_WEIGHT = 0.7  # kao match_engine hybrid
+
+
+# ----------------------------
+# pHASH
+# ----------------------------
+def _phash_dct(gray):
+    """pHash bez imagehash paketa: 32×32 → DCT → 8×8 niske frekvencije > medijan."""
+    small = cv2.resize(np.asarray(gray, dtype=np.float32), (32, 32), interpolation=cv2.INTER_AREA)
+    low = cv2.dct(small)[:8, :8]
+    return (low > np.median(low)).ravel()
+
+
+def phash64(image, method=None):
+    """PIL slika / uint8 ndarray → pHash kao np.uint64."""
+    from PIL import Image
+
+    method = method or ("imagehash" if imagehash is not None else "dct")
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    gray = image.convert("L")
+    if method == "imagehash":
+        if imagehash is None:
+            raise RuntimeError("phash.npy je izgrađen s imagehash paketom koji nije instaliran.")
+        bits = np.asarray(imagehash.phash(gray).hash).ravel()
+    else:
+        bits = _phash_dct(gray)
+    return np.packbits(bits.astype(np.uint8)).view(">u8")[0].astype(np.uint64)
+
+
+def popcount64(x):
+    """Broj postavljenih bitova po elementu uint64 niza."""
+    if hasattr(np, "bitwise_count"):  # numpy >= 2.0
+        return np.bitwise_count(x)
+    return np.unpackbits(np.ascontiguousarray(x).view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def hamming(query_hash, hashes):
+    return popcount64(np.bitwise_xor(hashes, np.uint64(query_hash)))
+
+
+def build_phash(out_file=PHASH_FILE, refs_file=None):
+    """Hash svakog reda iz pakiranih SSIM referenci (isti previewi, bez ponovnog rendera)."""
+    from ssim_rerank import REFS_FILE, get_reference_rasters
+
+    method = "imagehash" if imagehash is not None else "dct"
+    refs = get_reference_rasters(refs_file or REFS_FILE)
+    hashes = np.fromiter((phash64(refs[i], method) for i in range(len(refs))), dtype=np.uint64, count=len(refs))
+    tmp_file = out_file + ".tmp.npy"
+    np.save(tmp_file, hashes)
+    os.replace(tmp_file, out_file)
+    with open(os.path.splitext(out_file)[0] + ".json", "w", encoding="utf-8") as f:
+        json.dump({"rows": len(hashes), "method": method}, f)
+    logging.info(f"✅ pHash: {len(hashes)} rows ({method}) → {out_file}")
+
+
+_lock = threading.Lock()
+_loaded = {}
+
+
+def get_phashes():
+    """(uint64 niz, metoda) — učitano jednom po procesu i ponovno kad build zamijeni datoteke."""
+    stamp = file_stamp(PHASH_FILE, PHASH_META_FILE)
+    with _lock:
+        cached = _loaded.get("hashes")
+        if cached is None or cached[0] != stamp:
+            method = "dct"
+            if os.path.exists(PHASH_META_FILE):
+                with open(PHASH_META_FILE, "r", encoding="utf-8") as f:
+                    method = json.load(f).get("method", "dct")
+            cached = (stamp, (np.load(PHASH_FILE), method))
+            _loaded["hashes"] = cached
+        return cached[1]
+
+
+# ----------------------------
+# KASKADA
+# ----------------------------
+def search_cascade(images, top_n=10, phash_keep=PHASH_KEEP, embed_keep=EMBED_KEEP, use_ssim=True,
+                   stats=None, mask=None):
+    """
+    Lista PIL slika → po slici lista (red, score 0–100, embed_score, ssim_score),
+    silazno. `stats` (dict) dobiva zbroj kandidata po fazi; `mask` (bool po redu)
+    isključuje fontove već u prvoj fazi.
+    """
+    from embedding_store import open_embeddings
+    from model_registry import embed_images
+    from ssim_rerank import rerank, prep_for_ssim
+
+    stats = stats if stats is not None else {}
+    hashes, method = get_phashes()
+    store = open_embeddings()
+
+    vectors = embed_images("resnet50", images)
+    out = []
+    for img, vec in zip(images, vectors):
+        with tracing.span("phash_filter", keep=phash_keep) as attrs:
+            dist = hamming(phash64(prep_for_ssim(img), method), hashes)  # isti oblik kao reference
+            allowed = np.arange(len(dist)) if mask is None else np.flatnonzero(mask)
+            dist = dist[allowed]
+            keep = min(phash_keep, len(dist))
+            survivors = allowed[np.argpartition(dist, keep - 1)[:keep]] if keep < len(dist) else allowed
+            survivors.sort()  # sekvencijalnija čitanja iz mmapa
+            attrs["survivors"] = len(survivors)
+        stats["phash_candidates"] = stats.get("phash_candidates", 0) + len(survivors)
+
+        if len(survivors) == 0:
+            out.append([])
+            continue
+        with tracing.span("embed_filter", candidates=len(survivors)):
+            sims = store.rows(survivors) @ vec
+            keep = min(embed_keep, len(sims))
+            top = np.argpartition(-sims, keep - 1)[:keep]
+            top = top[np.argsort(-sims[top])]
+            rows, embed_scores = survivors[top], sims[top]
+        stats["embed_candidates"] = stats.get("embed_candidates", 0) + len(rows)
+
+        if use_ssim and len(rows):
+            ssim_scores = rerank(img, rows)
+            scores = 100 * (EMBED_WEIGHT * embed_scores + (1 - EMBED_WEIGHT) * ssim_scores)
+        else:
+            ssim_scores = np.zeros(len(rows), dtype=np.float32)
+            scores = 100 * embed_scores
+        order = np.argsort(-scores)[:top_n]
+        out.append([(int(rows[i]), float(scores[i]), float(embed_scores[i]), float(ssim_scores[i]))
+                    for i in order])
+    return out
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="pHash → embedding → SSIM cascade")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("build")
+    p_query = sub.add_parser("query")
+    p_query.add_argument("image")
+    p_query.add_argument("--top-n", type=int, default=10)
+    p_query.add_argument("--phash-keep", type=int, default=PHASH_KEEP)
+    p_query.add_argument("--embed-keep", type=int, default=EMBED_KEEP)
+    p_query.add_argument("--no-ssim", action="store_true")
+    args = parser.parse_args()
+
+    if args.cmd == "build":
+        build_phash()
+    else:
+        from PIL import Image
+        with open(INDEX_FILE, "r", encoding="utf-8") as f:
+            files = json.load(f)
+        with Image.open(args.image) as f:
+            img = f.convert("RGB")
+        stage = {}
+        results = search_cascade([img], args.top_n, args.phash_keep, args.embed_keep, not args.no_ssim, stage)
+        for row, score, embed_score, ssim_score in results[0]:
+            print(json.dumps({"file": files[row], "score": round(score, 2),
+                              "embed_score": round(embed_score, 4), "ssim_score": round(ssim_score, 4)}))
+        print(json.dumps({"candidates": stage}))
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+clip_text_index.py — unaprijed izračunata CLIP tekstualna matrica za katalog fontova.
+
+Svi `full_name` nazivi iz fonts_db.json kodiraju se jednom, u batchevima, a
+normalizirana matrica se sprema na disk zajedno s hashom baze i imenom modela.
+Aplikacija matricu učitava jednom po procesu i svaki upit rješava jednim
+matrično-vektorskim produktom. Matrica se ponovno gradi samo kad se promijeni
+hash baze ili model.
+
+Ručni build:
+    python3 clip_text_index.py [--model ViT-B/32] [--batch-size 256]
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+import numpy as np
+
+# ----------------------------
+# KONFIG
+# ----------------------------
+FONT_DB_FILE = "data/fonts_db.json"
+TEXT_INDEX_FILE = "data/clip_text_index.npz"
+DEFAULT_MODEL_NAME = "ViT-B/32"
+DEFAULT_BATCH_SIZE = 256
+
+_lock = threading.Lock()
+_cache = {}        # (db_file, model_name) -> (db_hash, matrix, fonts)
+_hash_cache = {}   # db_file -> ((mtime, size), sha256)
+
+
+def catalog_hash(db_file=FONT_DB_FILE):
+    """sha256 sadržaja fonts_db.json; ponovno se računa samo kad se promijeni mtime/veličina."""
+    st = os.stat(db_file)
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _hash_cache.get(db_file)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    h = hashlib.sha256()
+    with open(db_file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    _hash_cache[db_file] = (stamp, digest)
+    return digest
+
+
+def _font_label(font):
+    return font.get("full_name") or font.get("file", "")
+
+
+def encode_names(clip_model, names, device, batch_size=DEFAULT_BATCH_SIZE):
+    """Kodiraj listu naziva u batchevima i vrati L2-normaliziranu float32 matricu."""
+    import clip
+    import torch
+
+    chunks = []
+    with torch.no_grad():
+        for start in range(0, len(names), batch_size):
+            tokens = clip.tokenize(names[start:start + batch_size], truncate=True).to(device)
+            emb = clip_model.encode_text(tokens).float()
+            emb /= emb.norm(dim=-1, keepdim=True)
+            chunks.append(emb.cpu().numpy())
+    if not chunks:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.vstack(chunks).astype(np.float32, copy=False)
+
+
+def build_text_index(clip_model, device, model_name=DEFAULT_MODEL_NAME,
+                     db_file=FONT_DB_FILE, index_file=TEXT_INDEX_FILE,
+                     batch_size=DEFAULT_BATCH_SIZE):
+    """Izgradi matricu za cijelu bazu i spremi je u `index_file` (atomic rename)."""
+    with open(db_file, "r", encoding="utf-8") as f:
+        fonts_db = json.load(f)
+    db_hash = catalog_hash(db_file)
+
+    rows = [i for i, font in enumerate(fonts_db) if _font_label(font)]
+    names = [_font_label(fonts_db[i]) for i in rows]
+    logging.info(f"🧠 Encoding {len(names)} font names with CLIP {model_name} (batch={batch_size})...")
+    matrix = encode_names(clip_model, names, device, batch_size=batch_size)
+
+    os.makedirs(os.path.dirname(index_file) or ".", exist_ok=True)
+    tmp_file = index_file + ".tmp.npz"
+    np.savez(
+        tmp_file,
+        matrix=matrix,
+        rows=np.asarray(rows, dtype=np.int64),
+        db_hash=np.asarray(db_hash),
+        model_name=np.asarray(model_name),
+    )
+    os.replace(tmp_file, index_file)
+    logging.info(f"✅ CLIP text index saved to {index_file} ({matrix.shape[0]} rows)")
+    return db_hash, matrix, [fonts_db[i] for i in rows]
+
+
+def _load_from_disk(db_file, index_file, model_name, db_hash):
+    if not os.path.exists(index_file):
+        return None
+    try:
+        with np.load(index_file, allow_pickle=False) as data:
+            if str(data["db_hash"]) != db_hash or str(data["model_name"]) != model_name:
+                return None
+            matrix = data["matrix"].astype(np.float32, copy=False)
+            rows = data["rows"]
+    except Exception as e:
+        logging.warning(f"⚠️ Ne mogu pročitati {index_file}: {e}")
+        return None
+    with open(db_file, "r", encoding="utf-8") as f:
+        fonts_db = json.load(f)
+    return matrix, [fonts_db[i] for i in rows]
+
+
+def get_text_index(clip_model, device, model_name=DEFAULT_MODEL_NAME,
+                   db_file=FONT_DB_FILE, index_file=TEXT_INDEX_FILE):
+    """
+    Vrati (matrix, fonts) za trenutnu bazu. Rezultat se drži u memoriji procesa;
+    disk se čita samo pri prvom pozivu, a build se pokreće samo kad se hash promijeni.
+    """
+    db_hash = catalog_hash(db_file)
+    key = (db_file, model_name)
+    with _lock:
+        cached = _cache.get(key)
+        if cached and cached[0] == db_hash:
+            return cached[1], cached[2]
+
+        loaded = _load_from_disk(db_file, index_file, model_name, db_hash)
+        if loaded is not None:
+            matrix, fonts = loaded
+        else:
+            db_hash, matrix, fonts = build_text_index(
+                clip_model, device, model_name=model_name,
+                db_file=db_file, index_file=index_file,
+            )
+        _cache[key] = (db_hash, matrix, fonts)
+        return matrix, fonts
+
+
+def search_text_index(query_emb, matrix, top_n=10, mask=None):
+    """
+    Kosinusna sličnost normaliziranog upita i matrice; vraća (indeksi, sličnosti)
+    silazno. `mask` (bool po retku matrice) ograničava kandidate.
+    """
+    if matrix.shape[0] == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    q = np.asarray(query_emb, dtype=np.float32).reshape(-1)
+    sims = matrix @ q
+    if mask is not None:
+        allowed = np.flatnonzero(mask)
+        if allowed.size == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        k = min(top_n, allowed.size)
+        top = allowed[np.argpartition(-sims[allowed], k - 1)[:k]]
+        top = top[np.argsort(-sims[top])]
+        return top, sims[top]
+    k = min(top_n, sims.shape[0])
+    top = np.argpartition(-sims, k - 1)[:k]
+    top = top[np.argsort(-sims[top])]
+    return top, sims[top]
+
+
+if __name__ == "__main__":
+    import argparse
+    import torch
+    import clip
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Build CLIP text-embedding matrix for fonts_db.json")
+    parser.add_argument("--model", default=DEFAULT_MODEL_NAME)
+    parser.add_argument("--db", default=FONT_DB_FILE)
+    parser.add_argument("--out", default=TEXT_INDEX_FILE)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model, _ = clip.load(args.model, device=device, jit=False)
+    model.eval()
+    build_text_index(model, device, model_name=args.model, db_file=args.db,
+                     index_file=args.out, batch_size=args.batch_size)
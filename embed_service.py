@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+embed_service.py — opcionalni lokalni servis za embedding upita s dinamičkim
+micro-batchingom.
+
+Server (asyncio, Unix socket ili TCP) skuplja zahtjeve unutar kratkog prozora
+(BATCH_WINDOW_MS) u jedan batched forward po modelu i svakom klijentu vraća
+njegov vektor. Red je ograničen (MAX_QUEUE): kad je pun, zahtjev se odmah
+odbija s "busy" i klijent računa lokalno — nema neograničenog gomilanja.
+
+Protokol (oba smjera): [4B duljina][JSON zaglavlje][4B duljina][tijelo]
+    zahtjev:  {"op": "embed", "model": "resnet50"|"clip"} + PNG bajtovi
+              {"op": "stats"} + prazno tijelo
+    odgovor:  {"ok": true, "dim": D, "batch_size": B} + float32 bajtovi
+              {"ok": false, "error": "busy"|...}
+
+    python3 embed_service.py [--socket data/embed.sock | --port 8765] [--window-ms 5] [--max-batch 32]
+"""
+
+import io
+import os
+import json
+import time
+import socket
+import struct
+import asyncio
+import logging
+import numpy as np
+from PIL import Image
+
+# ----------------------------
+# KONFIG
+# ----------------------------
+SOCKET_PATH = "data/embed.sock"
+BATCH_WINDOW_MS = 5
+MAX_BATCH = 32
+MAX_QUEUE = 256
+CLIENT_TIMEOUT = 10.0
+
+_HDR = struct.Struct("!I")
+
+
+def _pack(header, body=b""):
+    h = json.dumps(header).encode("utf-8")
+    return _HDR.pack(len(h)) + h + _HDR.pack(len(body)) + body
+
+
+# ----------------------------
+# SERVER
+# ----------------------------
+class MicroBatcher:
+    """Jedan red + jedan batcher task po modelu; forward ide u executor da petlja ne stoji."""
+
+    def __init__(self, model, window_ms=BATCH_WINDOW_MS, max_batch=MAX_BATCH, max_queue=MAX_QUEUE):
+        self.model = model
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.metrics = {"requests": 0, "rejected": 0, "batches": 0, "batched_items": 0,
+                        "max_queue_depth": 0, "forward_seconds": 0.0}
+
+    def submit(self, image):
+        """Vrati future s vektorom, ili None ako je red pun (backpressure)."""
+        fut = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((image, fut))
+        except asyncio.QueueFull:
+            self.metrics["rejected"] += 1
+            return None
+        self.metrics["requests"] += 1
+        self.metrics["max_queue_depth"] = max(self.metrics["max_queue_depth"], self.queue.qsize())
+        return fut
+
+    async def run(self):
+        from model_registry import embed_images
+
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self.queue.get()]
+            deadline = loop.time() + self.window
+            while len(items) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            t0 = time.perf_counter()
+            try:
+                vectors = await loop.run_in_executor(None, embed_images, self.model, [i for i, _ in items])
+            except Exception as e:
+                for _, fut in items:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            self.metrics["forward_seconds"] += time.perf_counter() - t0
+            self.metrics["batches"] += 1
+            self.metrics["batched_items"] += len(items)
+            for (_, fut), vec in zip(items, vectors):
+                if not fut.done():
+                    fut.set_result((vec, len(items)))
+
+    def snapshot(self):
+        m = dict(self.metrics)
+        m["queue_depth"] = self.queue.qsize()
+        m["avg_batch_size"] = round(m["batched_items"] / m["batches"], 2) if m["batches"] else 0.0
+        return m
+
+
+class EmbedServer:
+    def __init__(self, window_ms=BATCH_WINDOW_MS, max_batch=MAX_BATCH, max_queue=MAX_QUEUE):
+        self.window_ms = window_ms
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.batchers = {}
+        self.tasks = []
+
+    def _batcher(self, model):
+        if model not in self.batchers:
+            b = MicroBatcher(model, self.window_ms, self.max_batch, self.max_queue)
+            self.batchers[model] = b
+            self.tasks.append(asyncio.create_task(b.run()))
+        return self.batchers[model]
+
+    async def _read_frame(self, reader):
+        (hlen,) = _HDR.unpack(await reader.readexactly(_HDR.size))
+        header = json.loads(await reader.readexactly(hlen))
+        (blen,) = _HDR.unpack(await reader.readexactly(_HDR.size))
+        body = await reader.readexactly(blen) if blen else b""
+        return header, body
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    header, body = await self._read_frame(reader)
+                except asyncio.IncompleteReadError:
+                    break
+                op = header.get("op")
+                if op == "stats":
+                    writer.write(_pack({"ok": True, "models": {m: b.snapshot() for m, b in self.batchers.items()}}))
+                elif op == "embed":
+                    from model_registry import LOADERS
+                    model = header.get("model", "resnet50")
+                    if model not in LOADERS:
+                        writer.write(_pack({"ok": False, "error": f"unknown model {model}"}))
+                    else:
+                        image = Image.open(io.BytesIO(body)).convert("RGB")
+                        fut = self._batcher(model).submit(image)
+                        if fut is None:
+                            writer.write(_pack({"ok": False, "error": "busy"}))
+                        else:
+                            try:
+                                vec, batch_size = await fut
+                                vec = np.asarray(vec, dtype=np.float32)
+                                writer.write(_pack({"ok": True, "dim": int(vec.shape[0]), "batch_size": batch_size},
+                                                   vec.tobytes()))
+                            except Exception as e:
+                                writer.write(_pack({"ok": False, "error": str(e)}))
+                else:
+                    writer.write(_pack({"ok": False, "error": f"unknown op {op}"}))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, socket_path=SOCKET_PATH, host=None, port=None):
+        if port:
+            server = await asyncio.start_server(self.handle, host or "127.0.0.1", port)
+            where = f"{host or '127.0.0.1'}:{port}"
+        else:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            os.makedirs(os.path.dirname(socket_path) or ".", exist_ok=True)
+            server = await asyncio.start_unix_server(self.handle, path=socket_path)
+            where = socket_path
+        logging.info(f"🚀 Embed service on {where} (window={self.window_ms}ms, "
+                     f"max_batch={self.max_batch}, max_queue={self.max_queue})")
+        async with server:
+            await server.serve_forever()
+
+
+# ----------------------------
+# KLIJENT (sinkroni — Streamlit i CLI)
+# ----------------------------
+def _recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("embed service closed connection")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def _request(header, body=b"", socket_path=SOCKET_PATH, address=None, timeout=CLIENT_TIMEOUT):
+    if address:
+        sock = socket.create_connection(address, timeout=timeout)
+    else:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+    with sock:
+        sock.sendall(_pack(header, body))
+        (hlen,) = _HDR.unpack(_recv_exact(sock, _HDR.size))
+        resp = json.loads(_recv_exact(sock, hlen))
+        (blen,) = _HDR.unpack(_recv_exact(sock, _HDR.size))
+        payload = _recv_exact(sock, blen) if blen else b""
+    return resp, payload
+
+
+def remote_embed(image, model="resnet50", socket_path=SOCKET_PATH, address=None):
+    """Embedding jedne PIL slike preko servisa. Baca RuntimeError ako servis odbije zahtjev."""
+    buf = io.BytesIO()
+    image.convert("RGB").save(buf, format="PNG")
+    resp, payload = _request({"op": "embed", "model": model}, buf.getvalue(),
+                             socket_path=socket_path, address=address)
+    if not resp.get("ok"):
+        raise RuntimeError(resp.get("error", "embed service error"))
+    return np.frombuffer(payload, dtype=np.float32)
+
+
+def service_stats(socket_path=SOCKET_PATH, address=None):
+    return _request({"op": "stats"}, socket_path=socket_path, address=address)[0]
+
+
+def embed_query(image, model="resnet50", socket_path=SOCKET_PATH, address=None):
+    """
+    Embedding upita: preko servisa ako radi, inače (nema socketa, busy, timeout)
+    lokalno kroz model_registry — ponašanje je isto, samo bez batchinga.
+    """
+    if address or os.path.exists(socket_path):
+        try:
+            return remote_embed(image, model, socket_path=socket_path, address=address)
+        except (OSError, RuntimeError, ConnectionError) as e:
+            logging.info(f"ℹ️ Embed service unavailable ({e}), computing locally")
+    from model_registry import embed_images
+    return embed_images(model, [image])[0]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Micro-batching embedding service")
+    parser.add_argument("--socket", default=SOCKET_PATH)
+    parser.add_argument("--host", default=None)
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--window-ms", type=float, default=BATCH_WINDOW_MS)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE)
+    parser.add_argument("--warmup", nargs="*", default=["resnet50"])
+    args = parser.parse_args()
+
+    from model_registry import warm_up
+    warm_up(args.warmup)
+    server = EmbedServer(args.window_ms, args.max_batch, args.max_queue)
+    asyncio.run(server.serve(socket_path=args.socket, host=args.host, port=args.port))
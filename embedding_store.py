@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+embedding_store.py — verzionirani, memory-mapped spremnik embeddinga.
+
+Format (direktorij, npr. data/visual_embeddings.store/):
+    meta.json     {"format": "finatina-embeddings", "version": 1, "dtype": "float32|float16|int8",
+                   "rows": N, "dim": D, "normalized": true, "source_sha256": "..."}
+    vectors.npy   N×D matrica u zadanom dtypeu (otvara se s mmap_mode="r")
+    scale.npy     samo int8: D float32 faktora      x ≈ (q - zero_point) * scale
+    zero_point.npy samo int8: D float32 pomaka
+
+Budući da se vectors.npy mapira, svi Streamlit workeri (i sve sesije) dijele iste
+stranice iz page cachea umjesto da svaki drži svoju kopiju float32 matrice.
+
+Točnost u odnosu na float32 (kosinusne sličnosti L2-normaliziranih vektora;
+izmjeri na vlastitim podacima s `python3 embedding_store.py report`):
+    float16 — greška score-a reda 1e-4, top-10 praktički identičan; ½ memorije
+    int8    — greška score-a reda 1e-3 (per-dimenzija scale/zero-point),
+              top-10 preklapanje tipično ≥ 0.95; ¼ memorije
+
+    python3 embedding_store.py convert --dtype int8 [--src data/visual_embeddings.npy]
+    python3 embedding_store.py report --dtype float16 int8
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+import numpy as np
+
+# ----------------------------
+# KONFIG
+# ----------------------------
+FORMAT_NAME = "finatina-embeddings"
+FORMAT_VERSION = 1
+EMBEDDINGS_FILE = "data/visual_embeddings.npy"
+STORE_DIR = "data/visual_embeddings.store"
+SUPPORTED_DTYPES = ("float32", "float16", "int8")
+CHUNK_ROWS = 16384  # dekvantizacija po blokovima — ne alocira float32 kopiju cijele matrice
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_stamp(*paths):
+    """(mtime_ns, veličina) po putanji, None ako ne postoji — ključ procesnih cacheva."""
+    stamp = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stamp.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+_digest_lock = threading.Lock()
+_digests = {}  # path → (stamp, sha256)
+
+
+def file_sha256(path):
+    """sha256 datoteke; ponovno se računa samo kad se promijeni mtime/veličina."""
+    stamp = file_stamp(path)
+    with _digest_lock:
+        cached = _digests.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    digest = _sha256(path)
+    with _digest_lock:
+        _digests[path] = (stamp, digest)
+    return digest
+
+
+def _normalize(x):
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+def quantize_int8(matrix):
+    """Asimetrična per-dimenzija kvantizacija u int8. Vraća (codes, scale, zero_point)."""
+    lo = matrix.min(axis=0)
+    hi = matrix.max(axis=0)
+    scale = (hi - lo) / 255.0
+    scale[scale == 0] = 1e-8
+    zero_point = -128.0 - lo / scale
+    codes = np.clip(np.rint(matrix / scale + zero_point), -128, 127).astype(np.int8)
+    return codes, scale.astype(np.float32), zero_point.astype(np.float32)
+
+
+def write_store(matrix, store_dir=STORE_DIR, dtype="float32", source_sha256=None):
+    """Normaliziraj i zapiši matricu u store format; zamjena direktorija je atomska (rename)."""
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Nepodržan dtype: {dtype}")
+    matrix = _normalize(matrix)
+    tmp_dir = store_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    if dtype == "int8":
+        codes, scale, zero_point = quantize_int8(matrix)
+        np.save(os.path.join(tmp_dir, "vectors.npy"), codes)
+        np.save(os.path.join(tmp_dir, "scale.npy"), scale)
+        np.save(os.path.join(tmp_dir, "zero_point.npy"), zero_point)
+    else:
+        np.save(os.path.join(tmp_dir, "vectors.npy"), matrix.astype(dtype))
+
+    meta = {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "dtype": dtype,
+        "rows": int(matrix.shape[0]),
+        "dim": int(matrix.shape[1]),
+        "normalized": True,
+        "source_sha256": source_sha256,
+    }
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+    old_dir = store_dir + "_old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(store_dir):
+        os.rename(store_dir, old_dir)
+    os.rename(tmp_dir, store_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    logging.info(f"✅ Embedding store {store_dir}: {meta['rows']}×{meta['dim']} {dtype}")
+    return meta
+
+
+class EmbeddingStore:
+    """Read-only pogled na store; `vectors` je np.memmap, ništa se ne kopira pri otvaranju."""
+
+    def __init__(self, vectors, dtype, scale=None, zero_point=None, meta=None):
+        self.vectors = vectors
+        self.dtype = dtype
+        self.scale = scale
+        self.zero_point = zero_point
+        self.meta = meta or {}
+
+    @classmethod
+    def from_array(cls, matrix):
+        """In-memory float32 store (npr. za stari visual_embeddings.npy bez konverzije)."""
+        return cls(_normalize(matrix), "float32")
+
+    @classmethod
+    def open(cls, store_dir=STORE_DIR):
+        with open(os.path.join(store_dir, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != FORMAT_NAME or meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Nepoznat format spremnika: {meta.get('format')} v{meta.get('version')}")
+        vectors = np.load(os.path.join(store_dir, "vectors.npy"), mmap_mode="r")
+        scale = zero_point = None
+        if meta["dtype"] == "int8":
+            scale = np.load(os.path.join(store_dir, "scale.npy"))
+            zero_point = np.load(os.path.join(store_dir, "zero_point.npy"))
+        return cls(vectors, meta["dtype"], scale, zero_point, meta)
+
+    @property
+    def shape(self):
+        return self.vectors.shape
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    def rows(self, idx):
+        """Dekvantizirani float32 retci za zadane indekse."""
+        block = np.asarray(self.vectors[idx], dtype=np.float32)
+        if self.dtype == "int8":
+            block = (block - self.zero_point) * self.scale
+        return block
+
+    def to_float32(self):
+        return self.rows(slice(None))
+
+    def scores(self, queries):
+        """
+        Skalarni produkti (nq × N) normaliziranih upita sa svim retcima, računato
+        po blokovima od CHUNK_ROWS redaka. Za int8: (c - zp)·s·q = c·(s·q) - zp·(s·q).
+        """
+        q = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if self.dtype == "int8":
+            q_scaled = q * self.scale
+            bias = q_scaled @ self.zero_point
+        out = np.empty((q.shape[0], len(self)), dtype=np.float32)
+        for start in range(0, len(self), CHUNK_ROWS):
+            block = np.asarray(self.vectors[start:start + CHUNK_ROWS], dtype=np.float32)
+            if self.dtype == "int8":
+                out[:, start:start + block.shape[0]] = q_scaled @ block.T - bias[:, None]
+            else:
+                out[:, start:start + block.shape[0]] = q @ block.T
+        return out
+
+
+# ----------------------------
+# PROCESNI LOADER
+# ----------------------------
+_lock = threading.Lock()
+_opened = {}
+
+
+def _open_current(store_dir, fallback_npy):
+    """Store ako je izgrađen iz trenutnog .npy (source_sha256), inače mapirani .npy."""
+    if os.path.exists(os.path.join(store_dir, "meta.json")):
+        store = EmbeddingStore.open(store_dir)
+        source = store.meta.get("source_sha256")
+        if source is None or not os.path.exists(fallback_npy) or file_sha256(fallback_npy) == source:
+            return store
+        logging.warning(f"⚠️ {store_dir} je izgrađen iz starijeg {fallback_npy} — koristim .npy "
+                        f"(python3 embedding_store.py convert --dtype {store.dtype})")
+    return EmbeddingStore(np.load(fallback_npy, mmap_mode="r"), "float32")
+
+
+def open_embeddings(store_dir=STORE_DIR, fallback_npy=EMBEDDINGS_FILE):
+    """
+    Otvori store jednom po procesu i ponovno kad se store ili izvorni .npy
+    promijene (mtime/veličina). Store bez izvora (npr. glyph store) koristi se
+    uvijek; store izgrađen iz drugog .npy se preskače i mapira se .npy (float32),
+    kao i kad store ne postoji.
+    """
+    key = (store_dir, fallback_npy)
+    stamp = file_stamp(os.path.join(store_dir, "meta.json"), os.path.join(store_dir, "vectors.npy"), fallback_npy)
+    with _lock:
+        cached = _opened.get(key)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, _open_current(store_dir, fallback_npy))
+            _opened[key] = cached
+        return cached[1]
+
+
+def accuracy_report(matrix, dtypes=("float16", "int8"), queries=200, k=10, seed=0):
+    """Greška kosinusnih score-ova i top-k preklapanje kvantiziranih varijanti prema float32."""
+    ref = EmbeddingStore.from_array(matrix)
+    rng = np.random.default_rng(seed)
+    q = ref.vectors[rng.choice(len(ref), min(queries, len(ref)), replace=False)]
+    ref_scores = ref.scores(q)
+    ref_top = np.argsort(-ref_scores, axis=1)[:, :k]
+
+    report = []
+    for dtype in dtypes:
+        if dtype == "int8":
+            codes, scale, zero_point = quantize_int8(ref.vectors)
+            store = EmbeddingStore(codes, "int8", scale, zero_point)
+        else:
+            store = EmbeddingStore(ref.vectors.astype(dtype), dtype)
+        scores = store.scores(q)
+        err = np.abs(scores - ref_scores)
+        top = np.argsort(-scores, axis=1)[:, :k]
+        overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(top, ref_top)])
+        report.append({
+            "dtype": dtype,
+            "bytes": int(store.vectors.nbytes),
+            "bytes_vs_float32": round(store.vectors.nbytes / ref.vectors.nbytes, 3),
+            "max_abs_score_err": float(err.max()),
+            "mean_abs_score_err": float(err.mean()),
+            f"top{k}_overlap": round(float(overlap), 4),
+        })
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Versioned mmap embedding store")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_convert = sub.add_parser("convert")
+    p_convert.add_argument("--src", default=EMBEDDINGS_FILE)
+    p_convert.add_argument("--out", default=STORE_DIR)
+    p_convert.add_argument("--dtype", choices=SUPPORTED_DTYPES, default="float16")
+    p_report = sub.add_parser("report")
+    p_report.add_argument("--src", default=EMBEDDINGS_FILE)
+    p_report.add_argument("--dtype", nargs="+", default=["float16", "int8"])
+    args = parser.parse_args()
+
+    if args.cmd == "convert":
+        write_store(np.load(args.src), args.out, dtype=args.dtype, source_sha256=_sha256(args.src))
+    else:
+        print(json.dumps(accuracy_report(np.load(args.src), dtypes=args.dtype), indent=2))
@@ -10,7 +10,12 @@ import hashlib
 import json
 import logging
 import re
+import time
+import queue
+import threading
 from tempfile import mkdtemp
+from concurrent.futures import ProcessPoolExecutor
+from font_meta import build_meta_db
 
 try:
     from fontTools.ttLib import TTFont
@@ -25,18 +30,74 @@ os.makedirs(LOG_DIR, exist_ok=True)
 # --- STAGING PATHS ---
 BASE_DIR = "data/all_fonts_new"
 FLAT_DIR = "data/all_fonts_flat_new"
+CONVERTED_DIR = "data/all_fonts_flat_converted_new"
 PREVIEW_DIR = "data/previews_new"
 DB_FILE = "data/fonts_db_new.json"
+META_DB_FILE = "data/fonts_meta_new.sqlite"
 LOG_FILE = os.path.join(LOG_DIR, "script_new.log")
 
 # --- ACTIVE PATHS ---
 ACTIVE_BASE = "data/all_fonts"
 ACTIVE_FLAT = "data/all_fonts_flat"
+ACTIVE_CONVERTED = "data/all_fonts_flat_converted"
 ACTIVE_PREVIEWS = "data/previews"
 ACTIVE_DB = "data/fonts_db.json"
+ACTIVE_META_DB = "data/fonts_meta.sqlite"
+
+MANIFEST_FILE = "data/fonts_manifest.json"
+
+# --- DERIVED ARTIFACTS (grade se nad staging fontovima, aktiviraju se zajedno s njima) ---
+VISUAL_EMBEDDINGS_FILE = "data/visual_embeddings_new.npy"
+VISUAL_INDEX_FILE = "data/visual_index_new.json"
+VISUAL_MANIFEST_FILE = "data/visual_manifest_new.json"
+VISUAL_STORE_DIR = "data/visual_embeddings_new.store"
+VISUAL_IVF_DIR = "data/visual_ivf_new"
+VISUAL_HNSW_FILE = "data/visual_hnsw_new.bin"
+SSIM_REFS_FILE = "data/ssim_refs_new.npy"
+PHASH_FILE = "data/phash_new.npy"
+GLYPH_STORE_DIR = "data/glyph_embeddings_new.store"
+GLYPH_ROWS_FILE = "data/glyph_rows_new.npz"
+GLYPH_IVF_DIR = "data/glyph_ivf_new"
+
+# staging → aktivno; što stage ovaj put ne proizvede (npr. ANN indeks) uklanja se iz aktivne generacije
+DERIVED_ARTIFACTS = {
+    VISUAL_EMBEDDINGS_FILE: "data/visual_embeddings.npy",
+    VISUAL_INDEX_FILE: "data/visual_index.json",
+    VISUAL_MANIFEST_FILE: "data/visual_manifest.json",
+    VISUAL_STORE_DIR: "data/visual_embeddings.store",
+    VISUAL_IVF_DIR: "data/visual_ivf",
+    VISUAL_HNSW_FILE: "data/visual_hnsw.bin",
+    VISUAL_HNSW_FILE + ".json": "data/visual_hnsw.bin.json",
+    SSIM_REFS_FILE: "data/ssim_refs.npy",
+    "data/ssim_refs_new.json": "data/ssim_refs.json",
+    PHASH_FILE: "data/phash.npy",
+    "data/phash_new.json": "data/phash.json",
+    GLYPH_STORE_DIR: "data/glyph_embeddings.store",
+    GLYPH_ROWS_FILE: "data/glyph_rows.npz",
+    GLYPH_IVF_DIR: "data/glyph_ivf",
+}
+
+# font_path u bazi uvijek pokazuje na aktivne direktorije; prije aktivacije se čita iz staginga
+STAGED_FONT_DIRS = {ACTIVE_FLAT: FLAT_DIR, ACTIVE_CONVERTED: CONVERTED_DIR}
+
+# --- DOWNLOAD CACHE (preživljava atomic_replace, služi za resume i CRC skip) ---
+GOOGLE_FONTS_URL = "https://github.com/google/fonts/archive/refs/heads/main.zip"
+DOWNLOAD_DIR = "data/downloads"
+GOOGLE_FONTS_ZIP = os.path.join(DOWNLOAD_DIR, "google-fonts.zip")
+GOOGLE_FONTS_CRC = os.path.join(DOWNLOAD_DIR, "google-fonts.crc.json")
+DOWNLOAD_CHUNK = 1 << 20
+DOWNLOAD_LOG_EVERY = 5.0  # sekundi
+
+WEB_FONT_EXTS = (".woff", ".woff2")
+SOURCE_PRIORITY = ["google-fonts", "fontsource"]
+CONVERT_WORKERS = os.cpu_count() or 4
+COLLECT_WORKERS = os.cpu_count() or 4
+STREAM_CHUNK = 256   # fontova po paketu između ingest stageova
+STREAM_QUEUE = 4     # paketa u redu između dva stagea (backpressure prema collectu)
 
 os.makedirs(BASE_DIR, exist_ok=True)
 os.makedirs(FLAT_DIR, exist_ok=True)
+os.makedirs(CONVERTED_DIR, exist_ok=True)
 os.makedirs(PREVIEW_DIR, exist_ok=True)
 
 # --- Logger setup ---
@@ -115,23 +176,160 @@ def parse_fontsource_license(folder):
     return "Unknown", None
 
 # --- Download izvora ---
-def download_google_fonts():
-    url = "https://github.com/google/fonts/archive/refs/heads/main.zip"
+def _read_json(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def _write_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def stream_download(url, dest_path, chunk_size=DOWNLOAD_CHUNK, timeout=300):
+    """
+    Skini `url` u `dest_path` u blokovima (bez držanja cijelog odgovora u RAM-u).
+    Nedovršeni .part se nastavlja preko HTTP Range + If-Range; gotova datoteka
+    se revalidira s If-None-Match pa nepromijenjena arhiva (304) ne ide ponovno.
+    """
+    part_path = dest_path + ".part"
+    meta_path = dest_path + ".meta.json"
+    part_meta_path = part_path + ".meta.json"
+    headers = {}
+    offset = 0
+
+    part_meta = _read_json(part_meta_path)
+    if os.path.exists(part_path) and part_meta.get("validator"):
+        offset = os.path.getsize(part_path)
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = part_meta["validator"]
+    elif os.path.exists(dest_path) and _read_json(meta_path).get("etag"):
+        headers["If-None-Match"] = _read_json(meta_path)["etag"]
+
+    with requests.get(url, stream=True, timeout=timeout, headers=headers) as r:
+        if r.status_code == 304:
+            logging.info(f"✅ {os.path.basename(dest_path)} unchanged on server (304), reusing local copy")
+            return dest_path
+        if r.status_code == 416 and offset:
+            # .part je već cijela datoteka (prekid nakon zadnjeg bloka) ili je veći od nje
+            size = r.headers.get("Content-Range", "").rpartition("/")[2]
+            if size.isdigit() and int(size) == offset:
+                logging.info(f"✅ {os.path.basename(part_path)} is already complete (416), finishing")
+                os.replace(part_path, dest_path)
+                _write_json(meta_path, {"etag": r.headers.get("ETag"), "bytes": offset})
+                os.remove(part_meta_path)
+                return dest_path
+            logging.warning(f"⚠️ Server rejected resume at {offset / 1e6:.1f} MB (416), restarting download")
+            r.close()
+            os.remove(part_path)
+            os.remove(part_meta_path)
+            return stream_download(url, dest_path, chunk_size, timeout)
+        r.raise_for_status()
+        if r.status_code == 206:
+            logging.info(f"↪️ Resuming download at {offset / 1e6:.1f} MB")
+            mode = "ab"
+        else:
+            offset = 0
+            mode = "wb"
+        validator = r.headers.get("ETag") or r.headers.get("Last-Modified")
+        _write_json(part_meta_path, {"validator": validator})
+        length = r.headers.get("Content-Length")
+        total = offset + int(length) if length else None
+
+        done = offset
+        t_start = time.monotonic()
+        t_log = t_start
+        with open(part_path, mode) as f:
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+                done += len(chunk)
+                now = time.monotonic()
+                if now - t_log >= DOWNLOAD_LOG_EVERY:
+                    rate = (done - offset) / max(now - t_start, 1e-6) / 1e6
+                    pct = f" ({done / total:.0%})" if total else ""
+                    logging.info(f"   … {done / 1e6:.1f} MB{pct}, {rate:.1f} MB/s")
+                    t_log = now
+        elapsed = time.monotonic() - t_start
+        if total is not None and done != total:
+            raise RuntimeError(f"Incomplete download: {done} of {total} bytes")
+
+    os.replace(part_path, dest_path)
+    _write_json(meta_path, {"etag": r.headers.get("ETag"), "bytes": done})
+    os.remove(part_meta_path)
+    logging.info(f"✅ Downloaded {done / 1e6:.1f} MB in {elapsed:.1f}s "
+                 f"({(done - offset) / max(elapsed, 1e-6) / 1e6:.1f} MB/s)")
+    return dest_path
+
+def _reuse_member(rel, size, reuse_dirs, dest):
+    for reuse_dir in reuse_dirs:
+        src = os.path.join(reuse_dir, rel)
+        if os.path.isfile(src) and os.path.getsize(src) == size:
+            try:
+                os.link(src, dest)
+            except OSError:
+                shutil.copy2(src, dest)
+            return True
+    return False
+
+def extract_fonts_from_zip(zip_path, out_dir, top_dir, reuse_dirs=(), crc_file=None):
+    """
+    Iz arhive izvuci samo fontove i METADATA.pb (putanje relativne na `top_dir`).
+    Članovi čiji se CRC poklapa s prošlim runom ne dekompresiraju se nego se
+    hardlinkaju/kopiraju iz prethodne ekstrakcije u `reuse_dirs`.
+    Vraća {član: CRC} za sljedeći run.
+    """
+    prev_crc = _read_json(crc_file) if crc_file else {}
+    new_crc = {}
+    extracted = reused = 0
+    font_exts = (".ttf", ".otf", ".woff", ".woff2")
+    prefix = top_dir.rstrip("/") + "/"
+    with zipfile.ZipFile(zip_path, "r") as z:
+        for info in z.infolist():
+            name = info.filename
+            if info.is_dir() or not name.startswith(prefix):
+                continue
+            base = os.path.basename(name)
+            if not (base.lower().endswith(font_exts) or base == "METADATA.pb"):
+                continue
+            rel = os.path.normpath(name[len(prefix):])
+            if rel.startswith("..") or os.path.isabs(rel):
+                logging.warning(f"⚠️ Skipping unsafe archive member {name}")
+                continue
+            dest = os.path.join(out_dir, rel)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            new_crc[name] = info.CRC
+
+            if prev_crc.get(name) == info.CRC and _reuse_member(rel, info.file_size, reuse_dirs, dest):
+                reused += 1
+                continue
+
+            with z.open(info) as zf, open(dest, "wb") as f:
+                shutil.copyfileobj(zf, f, DOWNLOAD_CHUNK)
+            extracted += 1
+    if not new_crc:
+        raise RuntimeError(f"Archive did not contain any fonts under {top_dir}/")
+    logging.info(f"✅ Extracted {extracted} members, reused {reused} unchanged (CRC match)")
+    return new_crc
+
+def download_google_fonts(url=GOOGLE_FONTS_URL):
     tmp_dir = mkdtemp(prefix="google-fonts-")
     target_dir = os.path.join(BASE_DIR, "google-fonts")
     try:
         logging.info("➡️ Downloading Google Fonts...")
-        r = requests.get(url, stream=True, timeout=300)
-        r.raise_for_status()
-        zip_path = os.path.join(tmp_dir, "google-fonts.zip")
-        with open(zip_path, "wb") as f:
-            f.write(r.content)
-        with zipfile.ZipFile(zip_path, "r") as z:
-            z.extractall(tmp_dir)
+        os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+        stream_download(url, GOOGLE_FONTS_ZIP)
         extracted = os.path.join(tmp_dir, "fonts-main")
-        if not os.path.exists(extracted):
-            raise RuntimeError("Google Fonts archive did not contain fonts-main folder")
+        reuse_dirs = [target_dir, os.path.join(ACTIVE_BASE, "google-fonts")]
+        crc = extract_fonts_from_zip(GOOGLE_FONTS_ZIP, extracted, "fonts-main",
+                                     reuse_dirs=reuse_dirs, crc_file=GOOGLE_FONTS_CRC)
         safe_replace(extracted, target_dir)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        _write_json(GOOGLE_FONTS_CRC, crc)
         logging.info("✅ Google Fonts updated successfully")
     except Exception as e:
         logging.error(f"❌ Failed to download Google Fonts: {e}")
@@ -151,38 +349,234 @@ def clone_repo(name, repo_url):
         shutil.rmtree(tmp_dir, ignore_errors=True)
         raise
 
-def collect_fonts():
+# --- Collect ---
+def _hash_worker(path):
+    try:
+        return path, sha256sum(path)
+    except OSError as e:
+        logging.warning(f"⚠️ Cannot hash {path}: {e}")
+        return path, None
+
+def _name_worker(item):
+    path, original_path = item
+    return get_font_name(path, original_path)
+
+def load_manifest(path=MANIFEST_FILE):
+    """sha256 → {"full_name": ...} iz prošlog collecta (preživljava atomic_replace)."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("fonts", {})
+    except Exception as e:
+        logging.warning(f"⚠️ Cannot read {path}, rebuilding metadata: {e}")
+        return {}
+
+def save_manifest(fonts, path=MANIFEST_FILE):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "fonts": fonts}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def _source_rank(source):
+    return (SOURCE_PRIORITY.index(source) if source in SOURCE_PRIORITY else len(SOURCE_PRIORITY), source)
+
+def iter_collected(workers=COLLECT_WORKERS, chunk_size=STREAM_CHUNK):
+    """
+    Skupi fontove u FLAT_DIR preko manifesta po sha256 i vraćaj zapise baze u
+    paketima od `chunk_size` čim su gotovi (ingest ih odmah šalje dalje):
+      • identične binarke iz više izvora → jedan zapis (prednost po SOURCE_PRIORITY)
+      • isti basename, različit sadržaj → drugi i dalji dobivaju sufiks -<sha[:8]>
+      • TTFont parsiranje samo za hasheve kojih nema u manifestu, na process poolu
+    Kandidati se hashiraju redom prioriteta, pa je zapis konačan čim se njegov
+    sha prvi put pojavi; "duplicates" se dopisuje već poslanim zapisima na kraju
+    (prije nego što itko zapiše bazu).
+    """
     logging.info("\n➡️ Collecting font files into flat directory...")
-    db = []
     font_exts = (".ttf", ".otf", ".woff", ".woff2")
-    for source in os.listdir(BASE_DIR):
+
+    # 1) deterministički popis kandidata: izvor po prioritetu, pa putanja
+    candidates = []
+    for source in sorted(os.listdir(BASE_DIR), key=_source_rank):
         source_dir = os.path.join(BASE_DIR, source)
-        for root, _, files in os.walk(source_dir):
-            for file in files:
-                if not file.lower().endswith(font_exts):
-                    continue
-                src_path = os.path.join(root, file)
-                dest_path = os.path.join(FLAT_DIR, file)
-                if not os.path.exists(dest_path):
-                    shutil.copy2(src_path, dest_path)
-                full_name = get_font_name(dest_path, src_path)
+        for root, dirs, files in os.walk(source_dir):
+            dirs.sort()
+            for file in sorted(files):
+                if file.lower().endswith(font_exts):
+                    candidates.append((source, root, os.path.join(root, file)))
+
+    manifest = load_manifest()
+    entries = {}      # sha → zapis baze
+    duplicates = {}   # sha → [ostale original putanje]
+    taken = set()     # flat imena
+    license_cache = {}
+    pending = []      # (sha, source, root, src_path, flat_name) za sljedeći paket
+    new_count = 0
+
+    def emit(name_pool):
+        # 5) metadata samo za nove/promijenjene fontove, 6) licence (jednom po direktoriju)
+        nonlocal new_count
+        todo = [item for item in pending if item[0] not in manifest]
+        if todo:
+            items = [(os.path.join(FLAT_DIR, flat_name), src_path) for _, _, _, src_path, flat_name in todo]
+            for item, full_name in zip(todo, name_pool.map(_name_worker, items, chunksize=32)):
+                manifest[item[0]] = {"full_name": full_name}
+            new_count += len(todo)
+        chunk = []
+        for sha, source, root, src_path, flat_name in pending:
+            if root not in license_cache:
                 if "google-fonts" in source:
-                    license_name, free = parse_google_license(root)
+                    license_cache[root] = parse_google_license(root)
                 elif "fontsource" in source:
-                    license_name, free = parse_fontsource_license(root)
+                    license_cache[root] = parse_fontsource_license(root)
                 else:
-                    license_name, free = "Unknown", None
-                db.append({
-                    "file": os.path.basename(dest_path),
-                    "source": source,
-                    "original_path": src_path,
-                    "full_name": full_name,
-                    "license": license_name,
-                    "free": free
-                })
-    with open(DB_FILE, "w", encoding="utf-8") as f:
+                    license_cache[root] = ("Unknown", None)
+            license_name, free = license_cache[root]
+            entries[sha] = {
+                "file": flat_name,
+                "source": source,
+                "original_path": src_path,
+                "full_name": manifest[sha]["full_name"],
+                "license": license_name,
+                "free": free,
+                "sha256": sha,
+            }
+            chunk.append(entries[sha])
+        pending.clear()
+        return chunk
+
+    with ProcessPoolExecutor(max_workers=workers) as hash_pool, \
+            ProcessPoolExecutor(max_workers=max(1, workers // 2)) as name_pool:
+        # 2) hash svih datoteka paralelno; rezultati stižu redom kandidata
+        hashes = hash_pool.map(_hash_worker, [c[2] for c in candidates], chunksize=64)
+        seen = set()
+        for (source, root, src_path), (_, sha) in zip(candidates, hashes):
+            if not sha:
+                continue
+            # 3) dedupe po sadržaju + rješavanje kolizija imena
+            if sha in seen:
+                duplicates.setdefault(sha, []).append(src_path)
+                continue
+            seen.add(sha)
+            flat_name = os.path.basename(src_path)
+            if flat_name in taken:
+                stem, ext = os.path.splitext(flat_name)
+                flat_name = f"{stem}-{sha[:8]}{ext}"
+            taken.add(flat_name)
+
+            # 4) kopiraj u FLAT_DIR (hardlink gdje je moguće); postojeća datoteka ostaje samo ako ima isti sadržaj
+            dest_path = os.path.join(FLAT_DIR, flat_name)
+            if os.path.exists(dest_path):
+                if not (os.path.samefile(src_path, dest_path) or (
+                        os.path.getsize(dest_path) == os.path.getsize(src_path) and sha256sum(dest_path) == sha)):
+                    os.remove(dest_path)
+            if not os.path.exists(dest_path):
+                try:
+                    os.link(src_path, dest_path)
+                except OSError:
+                    shutil.copy2(src_path, dest_path)
+
+            pending.append((sha, source, root, src_path, flat_name))
+            if len(pending) >= chunk_size:
+                yield emit(name_pool)
+        if pending:
+            yield emit(name_pool)
+
+    for sha, paths in duplicates.items():
+        entries[sha]["duplicates"] = paths
+    save_manifest({sha: manifest[sha] for sha in entries})
+    logging.info(f"✅ Collected {len(candidates)} files → {len(entries)} unique fonts "
+                 f"({len(candidates) - len(entries)} duplicates, {new_count} new/changed) into {FLAT_DIR}")
+
+def write_db(db):
+    """DB_FILE (preko tmp + os.replace) i SQLite metadata iz istih zapisa."""
+    tmp_path = DB_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
         json.dump(db, f, indent=2, ensure_ascii=False)
-    logging.info(f"✅ Collected {len(db)} fonts into {FLAT_DIR}")
+    os.replace(tmp_path, DB_FILE)
+    build_meta_db(db, META_DB_FILE)
+
+def collect_fonts(workers=COLLECT_WORKERS, convert=True):
+    """Cijeli collect odjednom (bez toka): zapisi → WOFF konverzija → DB_FILE + SQLite."""
+    db = [entry for chunk in iter_collected(workers) for entry in chunk]
+    if convert:
+        convert_web_fonts(db)
+    write_db(db)
+    return db
+
+# --- WOFF/WOFF2 → TTF/OTF ---
+def converted_name(src_path, sha, ext):
+    """Ime sfnt datoteke nosi sha256 izvora: Foo.woff i Foo.woff2 (ili isti stem iz dva izvora) se ne sudaraju."""
+    return f"{os.path.splitext(os.path.basename(src_path))[0]}-{sha[:16]}{ext}"
+
+def convert_web_font(src_path, sha=None, dest_dir=CONVERTED_DIR, reuse_dir=ACTIVE_CONVERTED):
+    """
+    Dekomprimiraj .woff/.woff2 u običan sfnt (.ttf ili .otf) i vrati novu putanju.
+    Ako aktivna generacija već ima konverziju istog izvora (isti sha u imenu),
+    samo se hardlinka/kopira.
+    """
+    sha = sha or sha256sum(src_path)
+    for ext in (".ttf", ".otf"):
+        dest_path = os.path.join(dest_dir, converted_name(src_path, sha, ext))
+        if os.path.exists(dest_path):
+            return dest_path
+        reuse_path = os.path.join(reuse_dir, os.path.basename(dest_path)) if reuse_dir else None
+        if reuse_path and os.path.exists(reuse_path):
+            try:
+                os.link(reuse_path, dest_path)
+            except OSError:
+                shutil.copy2(reuse_path, dest_path)
+            return dest_path
+
+    font = TTFont(src_path)
+    ext = ".otf" if font.sfntVersion == "OTTO" else ".ttf"
+    dest_path = os.path.join(dest_dir, converted_name(src_path, sha, ext))
+    font.flavor = None
+    tmp_path = f"{dest_path}.{os.getpid()}.tmp"
+    font.save(tmp_path)
+    os.replace(tmp_path, dest_path)
+    return dest_path
+
+def _convert_worker(item):
+    src_path, sha = item
+    try:
+        return src_path, convert_web_font(src_path, sha), None
+    except Exception as e:
+        return src_path, None, str(e)
+
+def convert_web_fonts(db, workers=CONVERT_WORKERS, pool=None):
+    """
+    Paralelno pretvori sve web fontove iz FLAT_DIR u CONVERTED_DIR (jednom po datoteci)
+    i svakom zapisu upiše `font_path` — aktivnu sfnt putanju koju runtime koristi
+    direktno, bez dekompresije i bez os.path.exists provjera. `pool` je postojeći
+    process pool (ingest ga dijeli između paketa).
+    """
+    web_files = sorted({(e["file"], e.get("sha256")) for e in db if e["file"].lower().endswith(WEB_FONT_EXTS)})
+    converted = {}
+    if web_files and TTFont:
+        logging.info(f"➡️ Converting {len(web_files)} web fonts to sfnt ({workers} workers)...")
+        items = [(os.path.join(FLAT_DIR, f), sha) for f, sha in web_files]
+        own_pool = pool is None
+        pool = pool or ProcessPoolExecutor(max_workers=workers)
+        try:
+            for src_path, dest_path, err in pool.map(_convert_worker, items, chunksize=32):
+                if dest_path:
+                    converted[os.path.basename(src_path)] = os.path.basename(dest_path)
+                else:
+                    logging.warning(f"⚠️ Conversion failed for {src_path}: {err}")
+        finally:
+            if own_pool:
+                pool.shutdown()
+        logging.info(f"✅ Converted {len(converted)}/{len(web_files)} web fonts into {CONVERTED_DIR}")
+
+    for entry in db:
+        fname = entry["file"]
+        if fname in converted:
+            entry["font_path"] = os.path.join(ACTIVE_CONVERTED, converted[fname])
+        else:
+            # nije web font ili konverzija nije uspjela — render_font_preview i dalje zna čitati WOFF
+            entry["font_path"] = os.path.join(ACTIVE_FLAT, fname)
+    return db
 
 def atomic_replace(old_path, new_path):
     backup_path = old_path + "_old"
@@ -193,20 +587,248 @@ def atomic_replace(old_path, new_path):
     os.rename(new_path, old_path)
     logging.info(f"✅ Switched {old_path} → novi sadržaj aktiviran.")
 
+# --- Pipeline ---
+class _Stream:
+    """
+    Ograničeni red paketa fontova između dva ingest stagea. Pun red blokira
+    producenta (backpressure prema collectu); abort() nakon greške bilo kojeg
+    stagea odblokira obje strane.
+    """
+    _END = object()
+
+    def __init__(self, maxsize=STREAM_QUEUE):
+        self._queue = queue.Queue(maxsize)
+        self._aborted = threading.Event()
+
+    def put(self, chunk):
+        while not self._aborted.is_set():
+            try:
+                self._queue.put(chunk, timeout=0.5)
+                return
+            except queue.Full:
+                pass
+        raise RuntimeError("stream aborted")
+
+    def close(self):
+        self.put(self._END)
+
+    def abort(self):
+        self._aborted.set()
+
+    def __iter__(self):
+        while not self._aborted.is_set():
+            try:
+                chunk = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if chunk is self._END:
+                return
+            yield chunk
+        raise RuntimeError("stream aborted")
+
+def run_streamed(stages, streams):
+    """
+    Pokreni povezane stageove istodobno, svaki u svom threadu; greška jednog
+    prekida sve tokove. Vraća {stage: sekunde od starta do kraja}.
+    """
+    timings, failed = {}, {}
+    t_start = time.perf_counter()
+
+    def run(name, func):
+        try:
+            func()
+        except BaseException as e:
+            failed[name] = e
+            for stream in streams:
+                stream.abort()
+            logging.error(f"❌ Ingest stage {name} failed: {e}")
+        finally:
+            timings[name] = time.perf_counter() - t_start
+
+    threads = [threading.Thread(target=run, args=(name, func), name=f"ingest-{name}") for name, func in stages]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    logging.info("⏱️ Ingest stream: " + ", ".join(f"{n} done at {timings[n]:.1f}s" for n, _ in stages))
+    if failed:
+        raise RuntimeError(f"ingest stages failed: {', '.join(failed)}") from next(iter(failed.values()))
+    return timings
+
+def ingest_stage():
+    """
+    collect → convert → (previews ∥ embed) kao tok paketa od STREAM_CHUNK fontova
+    kroz ograničene redove: previewi i embeddingi kreću s prvim paketom dok
+    collect još hashira ostatak. Sve ide u staging (font_path iz baze čita se
+    kroz STAGED_FONT_DIRS); na kraju DB_FILE + SQLite.
+    """
+    from build_previews import PreviewBuild
+    from build_visual_embeddings import EmbeddingBuild
+    from vector_index import refresh_indexes
+
+    clear_staged_derived()
+    to_convert, to_previews, to_embed = _Stream(), _Stream(), _Stream()
+    db = []
+
+    def collect():
+        for chunk in iter_collected():
+            to_convert.put(chunk)
+        to_convert.close()
+
+    def convert():
+        with ProcessPoolExecutor(max_workers=CONVERT_WORKERS) as pool:
+            for chunk in to_convert:
+                convert_web_fonts(chunk, pool=pool)
+                db.extend(chunk)
+                to_previews.put(chunk)
+                to_embed.put(chunk)
+        to_previews.close()
+        to_embed.close()
+
+    def previews():
+        # nepromijenjeni previewi se preuzimaju iz aktivne generacije
+        builder = PreviewBuild(font_dir=FLAT_DIR, out_dir=PREVIEW_DIR, reuse_dir=ACTIVE_PREVIEWS,
+                               path_map=STAGED_FONT_DIRS)
+        try:
+            for chunk in to_previews:
+                builder.add(chunk)
+            builder.finish()
+        finally:
+            builder.close()
+
+    def embed():
+        # inkrementalno prema aktivnim embeddinzima, pa se embedda samo razlika
+        builder = EmbeddingBuild(path_map=STAGED_FONT_DIRS)
+        try:
+            for chunk in to_embed:
+                builder.add([(entry["file"], entry["font_path"]) for entry in chunk])
+            builder.finish(embeddings_file=VISUAL_EMBEDDINGS_FILE, index_file=VISUAL_INDEX_FILE,
+                           manifest_file=VISUAL_MANIFEST_FILE, store_dir=VISUAL_STORE_DIR)
+        finally:
+            builder.close()
+        # IVF/HNSW nad starim embeddinzima bi mapirali retke na krive fontove
+        refresh_indexes(VISUAL_EMBEDDINGS_FILE, ivf_dir=VISUAL_IVF_DIR, hnsw_file=VISUAL_HNSW_FILE)
+
+    run_streamed([("collect", collect), ("convert", convert), ("previews", previews), ("embed", embed)],
+                 [to_convert, to_previews, to_embed])
+    write_db(db)
+
+def activate_stage():
+    logging.info("🔄 Switching new directories into production...")
+    atomic_replace(ACTIVE_BASE, BASE_DIR)
+    atomic_replace(ACTIVE_FLAT, FLAT_DIR)
+    atomic_replace(ACTIVE_CONVERTED, CONVERTED_DIR)
+    atomic_replace(ACTIVE_PREVIEWS, PREVIEW_DIR)
+    if os.path.exists(DB_FILE):
+        os.replace(DB_FILE, ACTIVE_DB)
+    if os.path.exists(META_DB_FILE):
+        os.replace(META_DB_FILE, ACTIVE_META_DB)
+    activate_derived()
+    logging.info("🎉 All new fonts, previews and indexes are live!")
+
+def activate_derived():
+    """Zamijeni embeddinge, ANN/SSIM/pHash/glyph indekse novima iz staginga."""
+    for staged_path, active_path in DERIVED_ARTIFACTS.items():
+        if os.path.isdir(staged_path):
+            atomic_replace(active_path, staged_path)
+        elif os.path.exists(staged_path):
+            os.replace(staged_path, active_path)
+        elif os.path.isdir(active_path):
+            shutil.rmtree(active_path, ignore_errors=True)  # izgrađen nad starim retcima
+            logging.info(f"🗑️ Removed stale {active_path}")
+        elif os.path.exists(active_path):
+            os.remove(active_path)
+            logging.info(f"🗑️ Removed stale {active_path}")
+
+def clear_staged_derived():
+    """Ostaci prekinutog runa ne smiju ući u aktivaciju (npr. ANN indeks koji se više ne gradi)."""
+    for staged_path in DERIVED_ARTIFACTS:
+        if os.path.isdir(staged_path):
+            shutil.rmtree(staged_path, ignore_errors=True)
+        elif os.path.exists(staged_path):
+            os.remove(staged_path)
+
+def refs_stage():
+    """SSIM reference (iz staging previewa) i pHash nad njima, poravnati s novim visual_index."""
+    from ssim_rerank import build_reference_rasters
+    from cascade import build_phash
+    build_reference_rasters(out_file=SSIM_REFS_FILE, index_file=VISUAL_INDEX_FILE,
+                            manifest_file=VISUAL_MANIFEST_FILE, preview_dir=PREVIEW_DIR,
+                            path_map=STAGED_FONT_DIRS)
+    build_phash(out_file=PHASH_FILE, refs_file=SSIM_REFS_FILE)
+
+def glyph_stage():
+    import numpy as np
+    from glyph_index import IVF_DIR, build
+    # postojeći glyph IVF se gradi ponovno s istim brojem lista
+    nlist = None
+    if os.path.exists(IVF_DIR):
+        nlist = len(np.load(os.path.join(IVF_DIR, "centroids.npy"), mmap_mode="r"))
+    build(nlist=nlist, store_dir=GLYPH_STORE_DIR, rows_file=GLYPH_ROWS_FILE, ivf_dir=GLYPH_IVF_DIR,
+          index_file=VISUAL_INDEX_FILE, manifest_file=VISUAL_MANIFEST_FILE, path_map=STAGED_FONT_DIRS)
+
+PIPELINE = [
+    # (ime, funkcija, ovisnosti)
+    ("fetch_google_fonts", download_google_fonts, []),
+    ("fetch_fontsource", lambda: clone_repo("fontsource", "https://github.com/fontsource/font-files.git"), []),
+    ("ingest", ingest_stage, ["fetch_google_fonts", "fetch_fontsource"]),  # collect → convert → previews ∥ embed
+    ("refs", refs_stage, ["ingest"]),
+    ("glyphs", glyph_stage, ["ingest"]),
+    ("activate", activate_stage, ["ingest", "refs", "glyphs"]),
+]
+
+def _timed(func):
+    t0 = time.perf_counter()
+    func()
+    return time.perf_counter() - t0
+
+def run_pipeline(stages=PIPELINE, max_workers=4):
+    """
+    Mali DAG runner: svaki stage kreće čim su mu sve ovisnosti gotove, pa
+    neovisni fetchevi (i refs/glyphs) idu istodobno; unutar "ingest" fontovi
+    teku u paketima kroz collect → convert → previews ∥ embed. "activate"
+    ovisi o svakom stageu koji proizvodi artefakte, pa nakon prve greške ne
+    pokreće se ništa novo, "activate" se ne izvrši i prethodna generacija
+    (fontovi i svi indeksi) ostaje živa. Vraća {stage: sekunde}.
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    pending = {name: (func, deps) for name, func, deps in stages}
+    timings, done, failed = {}, set(), {}
+    t_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        running = {}
+        while pending or running:
+            if not failed:
+                for name, (func, deps) in list(pending.items()):
+                    if all(d in done for d in deps):
+                        logging.info(f"▶️ Stage {name} started")
+                        running[pool.submit(_timed, func)] = name
+                        del pending[name]
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                name = running.pop(fut)
+                try:
+                    timings[name] = fut.result()
+                    done.add(name)
+                    logging.info(f"⏱️ Stage {name} finished in {timings[name]:.1f}s")
+                except Exception as e:
+                    failed[name] = e
+                    logging.error(f"❌ Stage {name} failed: {e}")
+
+    logging.info("⏱️ Stage timings: " + ", ".join(f"{n}={t:.1f}s" for n, t in timings.items())
+                 + f" | total={time.perf_counter() - t_start:.1f}s")
+    if failed:
+        skipped = sorted(pending)
+        raise RuntimeError(f"stages failed: {', '.join(failed)}; not run: {', '.join(skipped) or '-'}")
+    return timings
+
 if __name__ == "__main__":
     try:
         logging.info("🚀 Starting full font update pipeline...")
-        download_google_fonts()
-        clone_repo("fontsource", "https://github.com/fontsource/font-files.git")
-        collect_fonts()
-        logging.info("🎨 Pokrećem generate_preview_batch.py za nove previewe...")
-        subprocess.run(["python3", "generate_preview_batch.py"], check=False)
-        logging.info("🔄 Switching new directories into production...")
-        atomic_replace(ACTIVE_BASE, BASE_DIR)
-        atomic_replace(ACTIVE_FLAT, FLAT_DIR)
-        atomic_replace(ACTIVE_PREVIEWS, PREVIEW_DIR)
-        if os.path.exists(DB_FILE):
-            os.replace(DB_FILE, ACTIVE_DB)
-        logging.info("🎉 All new fonts and previews are live! Update complete.")
+        run_pipeline()
+        logging.info("🎉 Update complete.")
     except Exception as e:
         logging.error(f"❌ Pipeline terminated due to error: {e}")
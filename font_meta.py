@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+font_meta.py — indeksirani SQLite spremnik metapodataka fontova.
+
+Umjesto parsiranja cijelog fonts_db.json pri svakom rerunu i linearnog
+traženja po `file`, collect_fonts uz JSON zapisuje i data/fonts_meta.sqlite:
+
+    fonts(file PRIMARY KEY, row, full_name, license, source, free, font_path, sha256)
+    + indeksi na license, source, free
+
+Spremnik se otvara jednom po procesu (read-only, ponovno kad se datoteka
+zamijeni), pretraga po `file` ide preko primarnog ključa, a filtri
+(samo besplatni, licenca, izvor) daju bool masku poravnatu s redovima
+visual_index.json koju vector_index primjenjuje prije top-k.
+
+    python3 font_meta.py build [--db data/fonts_db.json]
+    python3 font_meta.py get Roboto-Regular.ttf
+"""
+
+import os
+import json
+import sqlite3
+import logging
+import threading
+import numpy as np
+
+# ----------------------------
+# KONFIG
+# ----------------------------
+FONT_DB_FILE = "data/fonts_db.json"
+META_DB_FILE = "data/fonts_meta.sqlite"
+COLUMNS = ("file", "row", "full_name", "license", "source", "free", "font_path", "sha256")
+SQLITE_MAX_VARS = 900  # ispod zadanog limita SQLITE_MAX_VARIABLE_NUMBER
+
+
+def build_meta_db(db, path=META_DB_FILE):
+    """Zapiši listu zapisa (format fonts_db.json) u SQLite; zamjena datoteke je atomska."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute("""
+            CREATE TABLE fonts (
+                file TEXT PRIMARY KEY,
+                row INTEGER NOT NULL,
+                full_name TEXT,
+                license TEXT,
+                source TEXT,
+                free INTEGER,
+                font_path TEXT,
+                sha256 TEXT
+            ) WITHOUT ROWID
+        """)
+        conn.executemany(
+            "INSERT OR IGNORE INTO fonts VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            ((font["file"], row, font.get("full_name"), font.get("license"), font.get("source"),
+              None if font.get("free") is None else int(bool(font["free"])),
+              font.get("font_path"), font.get("sha256"))
+             for row, font in enumerate(db) if font.get("file")),
+        )
+        conn.execute("CREATE INDEX idx_license ON fonts(license)")
+        conn.execute("CREATE INDEX idx_source ON fonts(source)")
+        conn.execute("CREATE INDEX idx_free ON fonts(free)")
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    logging.info(f"✅ Font metadata: {len(db)} rows → {path}")
+
+
+class FontMeta:
+    """Read-only pogled na fonts_meta.sqlite; ponaša se kao dict file → zapis."""
+
+    def __init__(self, path=META_DB_FILE):
+        self.path = path
+        self._conn = self._connect()
+        self._lock = threading.Lock()
+        self._len = None
+
+    def _connect(self):
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            if self._conn is None:
+                # zatvoren u open_meta dok ga je netko još držao — otvori trenutnu datoteku
+                self._conn = self._connect()
+            return self._conn.execute(sql, params).fetchall()
+
+    def __len__(self):
+        if self._len is None:
+            self._len = self._query("SELECT COUNT(*) FROM fonts")[0][0]
+        return self._len
+
+    def __contains__(self, file):
+        return bool(self._query("SELECT 1 FROM fonts WHERE file = ?", (file,)))
+
+    def __getitem__(self, file):
+        font = self.get(file)
+        if font is None:
+            raise KeyError(file)
+        return font
+
+    def get(self, file, default=None):
+        rows = self._query(f"SELECT {', '.join(COLUMNS)} FROM fonts WHERE file = ?", (file,))
+        return dict(rows[0]) if rows else default
+
+    def get_many(self, files):
+        """file → zapis za više datoteka (po jedan upit na SQLITE_MAX_VARS imena)."""
+        files = list(dict.fromkeys(files))
+        out = {}
+        for start in range(0, len(files), SQLITE_MAX_VARS):
+            chunk = files[start:start + SQLITE_MAX_VARS]
+            sql = f"SELECT {', '.join(COLUMNS)} FROM fonts WHERE file IN ({', '.join('?' * len(chunk))})"
+            out.update((r["file"], dict(r)) for r in self._query(sql, chunk))
+        return out
+
+    def all(self):
+        """Svi zapisi redoslijedom fonts_db.json."""
+        return [dict(r) for r in self._query(f"SELECT {', '.join(COLUMNS)} FROM fonts ORDER BY row")]
+
+    def filter_files(self, free=None, license=None, source=None):
+        """Skup `file` vrijednosti koje zadovoljavaju filtre (None = bez filtra)."""
+        where, params = [], []
+        if free is not None:
+            where.append("free = ?")
+            params.append(int(bool(free)))
+        for column, value in (("license", license), ("source", source)):
+            if value is None:
+                continue
+            values = [value] if isinstance(value, str) else list(value)
+            where.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        sql = "SELECT file FROM fonts" + (" WHERE " + " AND ".join(where) if where else "")
+        return {r[0] for r in self._query(sql, params)}
+
+    def distinct(self, column):
+        if column not in ("license", "source"):
+            raise ValueError(column)
+        return [r[0] for r in self._query(f"SELECT DISTINCT {column} FROM fonts WHERE {column} IS NOT NULL "
+                                          f"ORDER BY {column}")]
+
+    def candidate_mask(self, files, **filters):
+        """
+        Bool maska poravnata s `files` (npr. redovi visual_index.json) za zadane
+        filtre, ili None ako filtara nema (pretraga nad svime).
+        """
+        if all(v is None for v in filters.values()):
+            return None
+        allowed = self.filter_files(**filters)
+        return np.fromiter((f in allowed for f in files), dtype=bool, count=len(files))
+
+    def close(self):
+        """Zatvori konekciju nakon upita koji su u tijeku (isti lock)."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# ----------------------------
+# PROCESNI LOADER
+# ----------------------------
+_lock = threading.Lock()
+_opened = {}
+
+
+def open_meta(path=META_DB_FILE, db_file=FONT_DB_FILE):
+    """
+    FontMeta otvoren jednom po procesu; ponovno se otvara kad ingest zamijeni
+    datoteku (drugi mtime). Ako SQLite još ne postoji, gradi se iz fonts_db.json.
+    """
+    with _lock:
+        if not os.path.exists(path):
+            with open(db_file, "r", encoding="utf-8") as f:
+                build_meta_db(json.load(f), path)
+        mtime = os.path.getmtime(path)
+        cached = _opened.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        meta = FontMeta(path)
+        _opened[path] = (mtime, meta)
+        if cached is not None:
+            cached[1].close()  # inače svaka zamjena baze ostavlja otvoren file descriptor
+        return meta
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="SQLite font metadata store")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_build = sub.add_parser("build")
+    p_build.add_argument("--db", default=FONT_DB_FILE)
+    p_build.add_argument("--out", default=META_DB_FILE)
+    p_get = sub.add_parser("get")
+    p_get.add_argument("file")
+    args = parser.parse_args()
+
+    if args.cmd == "build":
+        with open(args.db, "r", encoding="utf-8") as f:
+            build_meta_db(json.load(f), args.out)
+    else:
+        print(json.dumps(open_meta().get(args.file), indent=2, ensure_ascii=False))
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+glyph_index.py — multi-vektorski indeks pojedinačnih znakova (A–Z, a–z, 0–9).
+
+Visual indeks ima jedan vektor po fontu (preview cijele abecede), pa se kratka
+riječ s uploada uspoređuje s renderom koji s njom dijeli malo znakova. Ovdje
+svaki znak svakog fonta dobiva svoj red:
+
+Offline (process pool, poravnato s redovima visual_index.json):
+    znak → render → izrez na tintu → 24×24 pločica (omjer očuvan) → blur
+    → centriran, L2-normaliziran vektor (576-d) → embedding_store
+    (data/glyph_embeddings.store) + kompaktno mapiranje red → (font, znak)
+    u data/glyph_rows.npz (int32 + uint8 po redu)
+
+Upit:
+    image_prep.threshold_text → povezane komponente → spajanje točkica/kvačica
+    → pločica po znaku → kNN nad svim znakovima → glasovi po fontu
+    (najbolja sličnost po segmentu, prosjek po segmentima)
+
+Pločice su male i usporedba je jedan matmul, pa je ovo jeftinije od SSIM-a nad
+previewima cijele abecede, a znakovi s uploada uspoređuju se s istim znakovima.
+
+    python3 glyph_index.py build [--workers 8] [--dtype float16] [--nlist 1024]
+    python3 glyph_index.py query slika.png [--top-n 10]
+"""
+
+import os
+import json
+import shutil
+import string
+import logging
+import threading
+import cv2
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import tracing
+
+# ----------------------------
+# KONFIG
+# ----------------------------
+INDEX_FILE = "data/visual_index.json"
+STORE_DIR = "data/glyph_embeddings.store"
+ROWS_FILE = "data/glyph_rows.npz"
+IVF_DIR = "data/glyph_ivf"
+GLYPHS = string.ascii_uppercase + string.ascii_lowercase + string.digits
+TILE = 24             # px, stranica pločice
+TILE_FILL = 20        # px, dulja stranica znaka unutar pločice
+RENDER_SIZE = 96      # px, veličina fonta pri renderu znaka
+BLUR_SIGMA = 1.0
+MIN_GLYPH_FRAC = 0.3  # segmenti niži od 30% medijana (točke, zarezi, šum) se ignoriraju
+MAX_QUERY_GLYPHS = 32
+GLYPH_TOP_K = 200     # susjeda po segmentu
+DEFAULT_WORKERS = os.cpu_count() or 4
+
+
+# ----------------------------
+# DESKRIPTOR
+# ----------------------------
+def glyph_descriptor(ink):
+    """
+    Maska tinte (H×W, >0 = tinta) → L2-normaliziran float32 vektor (TILE²).
+    Izrez na tintu i skaliranje s očuvanim omjerom čine ga neovisnim o veličini.
+    """
+    ink = np.asarray(ink) > 0
+    ys, xs = np.nonzero(ink)
+    if len(ys) == 0:
+        return None
+    crop = ink[ys.min():ys.max() + 1, xs.min():xs.max() + 1].astype(np.float32)
+    h, w = crop.shape
+    scale = TILE_FILL / max(h, w)
+    nh, nw = max(1, int(round(h * scale))), max(1, int(round(w * scale)))
+    crop = cv2.resize(crop, (nw, nh), interpolation=cv2.INTER_AREA)
+    tile = np.zeros((TILE, TILE), dtype=np.float32)
+    y0, x0 = (TILE - nh) // 2, (TILE - nw) // 2
+    tile[y0:y0 + nh, x0:x0 + nw] = crop
+    tile = cv2.GaussianBlur(tile, (0, 0), BLUR_SIGMA)
+    vec = tile.ravel()
+    vec -= vec.mean()
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm > 0 else None
+
+
+def _supported_codepoints(font_path):
+    try:
+        from fontTools.ttLib import TTFont
+        return set(TTFont(font_path, lazy=True, fontNumber=0).getBestCmap() or {})
+    except Exception:
+        return None  # nepoznato → renderiraj sve
+
+
+def _glyph_worker(font_path):
+    """font_path → (float16 vektori (g × TILE²), uint8 indeksi znakova u GLYPHS) ili None."""
+    from PIL import Image, ImageDraw
+    from render_font_preview import load_font
+
+    try:
+        font = load_font(font_path, RENDER_SIZE)
+    except Exception as e:
+        logging.warning(f"⚠️ Cannot load {font_path}: {e}")
+        return None
+    cmap = _supported_codepoints(font_path)
+    vectors, glyph_ids = [], []
+    for gi, ch in enumerate(GLYPHS):
+        if cmap is not None and ord(ch) not in cmap:
+            continue
+        img = Image.new("L", (RENDER_SIZE * 2, RENDER_SIZE * 2), 255)
+        ImageDraw.Draw(img).text((RENDER_SIZE // 2, RENDER_SIZE // 4), ch, font=font, fill=0)
+        vec = glyph_descriptor(np.asarray(img) < 128)
+        if vec is not None:
+            vectors.append(vec.astype(np.float16))
+            glyph_ids.append(gi)
+    if not vectors:
+        return None
+    return np.stack(vectors), np.asarray(glyph_ids, dtype=np.uint8)
+
+
+# ----------------------------
+# BUILD (offline)
+# ----------------------------
+def build(workers=DEFAULT_WORKERS, dtype="float16", nlist=None, store_dir=STORE_DIR, rows_file=ROWS_FILE,
+          ivf_dir=IVF_DIR, index_file=INDEX_FILE, manifest_file=None, path_map=None):
+    """
+    Izgradi glyph store + mapiranje redova za sve fontove iz visual_index.json.
+    Putanje su podesive da ingest gradi u staging i aktivira sve zajedno.
+    """
+    from ssim_rerank import MANIFEST_FILE, _font_paths_for_index
+    from embedding_store import write_store
+
+    font_paths = _font_paths_for_index(index_file, manifest_file or MANIFEST_FILE, path_map)
+    blocks, font_ids, glyph_ids = [], [], []
+    missing = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for row, out in enumerate(pool.map(_glyph_worker, font_paths, chunksize=8)):
+            if out is None:
+                missing += 1
+                continue
+            vecs, gids = out
+            blocks.append(vecs)
+            font_ids.append(np.full(len(gids), row, dtype=np.int32))
+            glyph_ids.append(gids)
+    if not blocks:
+        raise RuntimeError("Nijedan font nije renderiran.")
+
+    matrix = np.concatenate(blocks)
+    write_store(matrix, store_dir, dtype=dtype)
+    tmp_file = rows_file + ".tmp.npz"
+    np.savez(tmp_file, font_ids=np.concatenate(font_ids), glyph_ids=np.concatenate(glyph_ids),
+             glyphs=np.array(GLYPHS), fonts=np.int64(len(font_paths)))
+    os.replace(tmp_file, rows_file)
+    if nlist:
+        from vector_index import IVFIndex
+        IVFIndex.train(matrix.astype(np.float32), nlist=nlist).save(ivf_dir)
+    else:
+        shutil.rmtree(ivf_dir, ignore_errors=True)  # stari IVF pokazuje na stare retke
+    logging.info(f"✅ Glyph index: {matrix.shape[0]} glyphs from {len(font_paths) - missing} fonts "
+                 f"({missing} unrenderable) → {store_dir}")
+
+
+_lock = threading.Lock()
+_loaded = {}
+
+
+def get_glyph_index():
+    """
+    (indeks nad glyph storeom, font_ids, glyph_ids) — učitano jednom po procesu
+    (mmap) i ponovno kad build zamijeni store, mapiranje redova ili IVF.
+    """
+    from embedding_store import open_embeddings, file_stamp
+    from vector_index import ExactIndex, IVFIndex
+
+    stamp = file_stamp(os.path.join(STORE_DIR, "meta.json"), os.path.join(STORE_DIR, "vectors.npy"),
+                       ROWS_FILE, os.path.join(IVF_DIR, "meta.json"))
+    with _lock:
+        cached = _loaded.get("index")
+        if cached is None or cached[0] != stamp:
+            store = open_embeddings(store_dir=STORE_DIR, fallback_npy=os.path.join(STORE_DIR, "vectors.npy"))
+            rows = np.load(ROWS_FILE)
+            index = None
+            if os.path.exists(IVF_DIR):
+                try:
+                    index = IVFIndex.load(IVF_DIR)
+                except Exception as e:
+                    logging.warning(f"⚠️ Ne mogu učitati glyph IVF: {e}")
+                if index is not None and len(index) != len(store):
+                    index = None
+            cached = (stamp, (index or ExactIndex(store), rows["font_ids"], rows["glyph_ids"]))
+            _loaded["index"] = cached
+        return cached[1]
+
+
+# ----------------------------
+# UPIT
+# ----------------------------
+def segment_glyphs(image, max_glyphs=MAX_QUERY_GLYPHS):
+    """
+    Maske pojedinačnih znakova s uploada, slijeva nadesno po retcima. Komponente
+    koje se vodoravno preklapaju i vertikalno su blizu (točka na i, kvačice) se spajaju.
+    """
+    from image_prep import threshold_text, text_components
+
+    processed = threshold_text(image)
+    comps = text_components(processed)
+    if len(comps) == 0:
+        return []
+    x = comps[:, cv2.CC_STAT_LEFT]
+    y = comps[:, cv2.CC_STAT_TOP]
+    boxes = [[int(a), int(b), int(a + w), int(b + h)]
+             for a, b, w, h in zip(x, y, comps[:, cv2.CC_STAT_WIDTH], comps[:, cv2.CC_STAT_HEIGHT])]
+    boxes.sort()
+
+    merged = []
+    for box in boxes:
+        for m in merged:
+            overlap = min(m[2], box[2]) - max(m[0], box[0])
+            vgap = max(m[1], box[1]) - min(m[3], box[3])
+            tallest = max(m[3] - m[1], box[3] - box[1])
+            if overlap > 0.5 * min(m[2] - m[0], box[2] - box[0]) and vgap < 0.5 * tallest:
+                m[:] = [min(m[0], box[0]), min(m[1], box[1]), max(m[2], box[2]), max(m[3], box[3])]
+                break
+        else:
+            merged.append(list(box))
+
+    heights = np.array([b[3] - b[1] for b in merged])
+    keep = [b for b, h in zip(merged, heights) if h >= MIN_GLYPH_FRAC * np.median(heights)]
+    line_h = np.median(heights)
+    keep.sort(key=lambda b: (int(b[1] // max(line_h, 1)), b[0]))
+    return [processed[y0:y1, x0:x1] for x0, y0, x1, y1 in keep[:max_glyphs]]
+
+
+def search_glyphs(images, top_n=10, k=GLYPH_TOP_K, mask=None):
+    """
+    Lista PIL slika → po slici lista (red u visual_index.json, score 0–1, glasova, segmenata).
+    Score fonta je prosjek (po segmentu) najbolje sličnosti nekog njegovog znaka;
+    font bez znaka među k susjeda dobiva k-tu sličnost tog segmenta. `mask`
+    (bool po redu visual_index.json) ograničava fontove.
+    """
+    index, font_ids, _ = get_glyph_index()
+    row_mask = None if mask is None else np.asarray(mask)[font_ids]  # maska fonta → maska znakova
+    out = []
+    for image in images:
+        with tracing.span("glyph_segment"):
+            descs = [d for d in (glyph_descriptor(m) for m in segment_glyphs(image)) if d is not None]
+        if not descs:
+            out.append([])
+            continue
+        with tracing.span("index_search", backend="glyph", batch=len(descs), k=k):
+            ids, sims = index.search(np.stack(descs), k) if row_mask is None else \
+                index.search(np.stack(descs), k, mask=row_mask)
+        with tracing.span("glyph_votes", segments=len(descs)):
+            floor = np.where(np.isfinite(sims[:, -1]), sims[:, -1], 0.0).astype(np.float64)
+            best = {}
+            for si in range(len(descs)):
+                for row, sim in zip(ids[si], sims[si]):
+                    if row < 0:
+                        continue
+                    font = int(font_ids[row])
+                    per_seg = best.setdefault(font, {})
+                    if sim > per_seg.get(si, -1.0):
+                        per_seg[si] = float(sim)
+            ranked = []
+            for font, per_seg in best.items():
+                total = floor.sum() + sum(s - floor[si] for si, s in per_seg.items())
+                ranked.append((font, float(total / len(descs)), len(per_seg), len(descs)))
+            ranked.sort(key=lambda r: r[1], reverse=True)
+        out.append(ranked[:top_n])
+    return out
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Per-glyph multi-vector font index")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_build = sub.add_parser("build")
+    p_build.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    p_build.add_argument("--dtype", choices=["float32", "float16", "int8"], default="float16")
+    p_build.add_argument("--nlist", type=int, default=None, help="also train an IVF index")
+    p_query = sub.add_parser("query")
+    p_query.add_argument("image")
+    p_query.add_argument("--top-n", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.cmd == "build":
+        build(workers=args.workers, dtype=args.dtype, nlist=args.nlist)
+    else:
+        from PIL import Image
+        with open(INDEX_FILE, "r", encoding="utf-8") as f:
+            files = json.load(f)
+        with Image.open(args.image) as f:
+            img = f.convert("RGB")
+        for font, score, votes, segments in search_glyphs([img], top_n=args.top_n)[0]:
+            print(json.dumps({"file": files[font], "score": round(100 * score, 2),
+                              "votes": votes, "segments": segments}))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+image_prep.py — priprema uploadane slike za prepoznavanje fontova.
+
+Isti koraci kao u app.py (Otsu threshold + morfološki open za razdvajanje
+slova), ali bez temp datoteka:
+  1. binarizacija (threshold_text)
+  2. izrez na bounding box teksta (+ mala margina)
+  3. smanjenje tako da visina slova ne prelazi MAX_TEXT_HEIGHT px
+  4. kodiranje u memoriji (cv2.imencode, PNG)
+
+Velike fotografije s mobitela tako šalju desetke KB umjesto više MB.
+
+    python3 image_prep.py report slika1.jpg slika2.png   # bajtovi i latencija prije/poslije
+"""
+
+import time
+import cv2
+import numpy as np
+import tracing
+
+# ----------------------------
+# KONFIG
+# ----------------------------
+MAX_TEXT_HEIGHT = 64   # medijan visine slova nakon smanjenja (px)
+CROP_PADDING = 8       # px oko teksta (u izvornoj rezoluciji, prije smanjenja)
+MIN_COMPONENT_AREA = 12
+PNG_COMPRESSION = 9
+
+
+def threshold_text(image):
+    """PIL/RGB ndarray → binarna slika (tekst = 255) nakon Otsu + morfološkog opena."""
+    np_img = np.asarray(image)
+    gray = cv2.cvtColor(np_img, cv2.COLOR_RGB2GRAY) if np_img.ndim == 3 else np_img
+    _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    # Morfološka operacija za razdvajanje slova
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
+    return cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel)
+
+
+def text_components(processed, min_area=MIN_COMPONENT_AREA):
+    """Statistike povezanih komponenti (x, y, w, h, area) bez sitnog šuma."""
+    _, _, comp_stats, _ = cv2.connectedComponentsWithStats(processed, connectivity=8)
+    comp_stats = comp_stats[1:]  # 0 je pozadina
+    return comp_stats[comp_stats[:, cv2.CC_STAT_AREA] >= min_area]
+
+
+def text_bbox(components, shape, pad=CROP_PADDING):
+    """(x0, y0, x1, y1) svih komponenti + margina, ili cijela slika ako teksta nema."""
+    h, w = shape[:2]
+    if len(components) == 0:
+        return 0, 0, w, h
+    x0 = components[:, cv2.CC_STAT_LEFT].min()
+    y0 = components[:, cv2.CC_STAT_TOP].min()
+    x1 = (components[:, cv2.CC_STAT_LEFT] + components[:, cv2.CC_STAT_WIDTH]).max()
+    y1 = (components[:, cv2.CC_STAT_TOP] + components[:, cv2.CC_STAT_HEIGHT]).max()
+    return max(0, x0 - pad), max(0, y0 - pad), min(w, x1 + pad), min(h, y1 + pad)
+
+
+def prepare_for_api(image, max_text_height=MAX_TEXT_HEIGHT, pad=CROP_PADDING):
+    """
+    Vrati dict:
+        processed  binarna slika nakon izreza/smanjenja (tekst = 255, za prikaz)
+        png_bytes  crno na bijelom, kodirano u memoriji — ide u API
+        bbox       (x0, y0, x1, y1) u izvornoj slici
+        scale      faktor smanjenja (≤ 1)
+        seconds    trajanje pripreme
+    """
+    with tracing.span("preprocess", target="api"):
+        return _prepare(image, max_text_height, pad)
+
+
+def _prepare(image, max_text_height, pad):
+    t0 = time.perf_counter()
+    processed = threshold_text(image)
+    components = text_components(processed)
+    x0, y0, x1, y1 = text_bbox(components, processed.shape, pad)
+    cropped = processed[y0:y1, x0:x1]
+
+    scale = 1.0
+    if len(components):
+        text_height = float(np.median(components[:, cv2.CC_STAT_HEIGHT]))
+        if text_height > max_text_height:
+            scale = max_text_height / text_height
+    if scale < 1.0:
+        new_size = (max(1, int(round(cropped.shape[1] * scale))), max(1, int(round(cropped.shape[0] * scale))))
+        cropped = cv2.resize(cropped, new_size, interpolation=cv2.INTER_AREA)
+        _, cropped = cv2.threshold(cropped, 127, 255, cv2.THRESH_BINARY)
+
+    ok, buf = cv2.imencode(".png", cv2.bitwise_not(cropped), [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION])
+    if not ok:
+        raise RuntimeError("cv2.imencode nije uspio")
+    return {
+        "processed": cropped,
+        "png_bytes": buf.tobytes(),
+        "bbox": (int(x0), int(y0), int(x1), int(y1)),
+        "scale": scale,
+        "seconds": time.perf_counter() - t0,
+    }
+
+
+def legacy_encode(image):
+    """Stari put iz app.py (puna rezolucija, bez izreza) — za usporedbu u reportu."""
+    t0 = time.perf_counter()
+    processed = threshold_text(image)
+    ok, buf = cv2.imencode(".png", cv2.bitwise_not(processed))
+    return buf.tobytes(), time.perf_counter() - t0
+
+
+def size_report(image):
+    """Bajtovi (i base64 bajtovi u formi) i vrijeme pripreme: stari put vs. novi."""
+    old_bytes, old_s = legacy_encode(image)
+    prepared = prepare_for_api(image)
+    new_bytes = prepared["png_bytes"]
+    return {
+        "before_bytes": len(old_bytes),
+        "after_bytes": len(new_bytes),
+        "before_b64_bytes": (len(old_bytes) + 2) // 3 * 4,
+        "after_b64_bytes": (len(new_bytes) + 2) // 3 * 4,
+        "ratio": round(len(new_bytes) / max(1, len(old_bytes)), 4),
+        "before_ms": round(old_s * 1000, 2),
+        "after_ms": round(prepared["seconds"] * 1000, 2),
+        "bbox": prepared["bbox"],
+        "scale": round(prepared["scale"], 4),
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    import json
+    from PIL import Image
+
+    if len(sys.argv) < 3 or sys.argv[1] != "report":
+        raise SystemExit("Usage: python3 image_prep.py report <image> [<image> ...]")
+    for path in sys.argv[2:]:
+        with Image.open(path) as f:
+            img = f.convert("RGB")
+        print(json.dumps({"image": path, **size_report(img)}))
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+inference_backends.py — CPU izvršavanje image encodera preko ONNX Runtimea ili
+TorchScripta, opcionalno s dinamičkom int8 kvantizacijom.
+
+Deployment je CPU-only, a eager PyTorch fp32 je najsporija opcija. Export:
+
+    resnet50  Sequential bez fc sloja → 2048-d (flatten u grafu)
+    clip      encode_image (ViT-B/32) → 512-d
+
+    onnx         torch.onnx.export, dinamička batch os; int8 = onnxruntime
+                 quantize_dynamic (MatMul/Gemm/Conv težine u int8)
+    torchscript  torch.jit.trace; int8 = torch quantize_dynamic nad nn.Linear
+                 (ResNet nema Linear slojeva bez fc-a, pa tamo nema učinka)
+
+Svaki export se upisuje u models/exports/backends.json. `check` uspoređuje
+embeddinge s eager modelom (kosinus po slici) i mjeri ubrzanje; rezultat se
+također upisuje u manifest. model_registry.embed_images s BACKEND = "auto"
+koristi najbržu provjerenu varijantu čiji runtime je instaliran, a eager
+model samo ako nijedna nije prošla provjeru (ili je uređaj GPU).
+
+    python3 inference_backends.py export resnet50 clip --format onnx --int8
+    python3 inference_backends.py check resnet50 clip
+    python3 inference_backends.py list
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+import numpy as np
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+# ----------------------------
+# KONFIG
+# ----------------------------
+EXPORT_DIR = "models/exports"
+MANIFEST_FILE = os.path.join(EXPORT_DIR, "backends.json")
+BACKEND = "auto"        # "auto", "eager", "onnx", "onnx-int8", "torchscript", "torchscript-int8"
+MODELS = ("resnet50", "clip")
+INPUT_SIZE = 224
+ONNX_OPSET = 17
+MIN_COSINE = 0.98       # najlošija slika u provjeri mora biti barem ovoliko slična eager embeddingu
+CHECK_IMAGES = 32
+CHECK_BATCH = 8
+CHECK_REPEATS = 5
+
+
+def backend_id(fmt, int8):
+    return f"{fmt}-int8" if int8 else fmt
+
+
+def export_path(name, fmt, int8):
+    ext = "onnx" if fmt == "onnx" else "pt"
+    return os.path.join(EXPORT_DIR, f"{name}-{backend_id(fmt, int8)}.{ext}")
+
+
+def _load_manifest():
+    if not os.path.exists(MANIFEST_FILE):
+        return {}
+    with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_manifest(manifest):
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    tmp_file = MANIFEST_FILE + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_file, MANIFEST_FILE)
+
+
+# ----------------------------
+# EXPORT
+# ----------------------------
+def _encoder_module(name):
+    """Eager image encoder kao nn.Module: (N, 3, 224, 224) → (N, dim) float32, na CPU-u."""
+    import torch
+    from model_registry import LOADERS
+
+    model, _ = LOADERS[name]("cpu")
+
+    class Encoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, x):
+            feats = self.model.encode_image(x) if name == "clip" else self.model(x)
+            return feats.flatten(1).float()
+
+    return Encoder(model.float()).eval()
+
+
+def export(name, fmt="onnx", int8=False):
+    """Izvezi image encoder `name` u models/exports i upiši ga u manifest."""
+    import torch
+
+    if name not in MODELS:
+        raise KeyError(f"Nepoznat model: {name}")
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = export_path(name, fmt, int8)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    module = _encoder_module(name)
+    dummy = torch.randn(2, 3, INPUT_SIZE, INPUT_SIZE)
+    t0 = time.perf_counter()
+
+    with torch.no_grad():
+        if fmt == "onnx":
+            fp32_path = tmp_path + ".fp32.onnx" if int8 else tmp_path
+            torch.onnx.export(module, dummy, fp32_path, input_names=["image"], output_names=["embedding"],
+                              dynamic_axes={"image": {0: "batch"}, "embedding": {0: "batch"}},
+                              opset_version=ONNX_OPSET)
+            if int8:
+                from onnxruntime.quantization import quantize_dynamic, QuantType
+                quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+                os.remove(fp32_path)
+        elif fmt == "torchscript":
+            if int8:
+                if not any(isinstance(m, torch.nn.Linear) for m in module.modules()):
+                    logging.warning(f"⚠️ {name}: nema nn.Linear slojeva, int8 TorchScript je isti kao fp32")
+                module = torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+            scripted = torch.jit.freeze(torch.jit.trace(module, dummy))
+            scripted.save(tmp_path)
+        else:
+            raise ValueError(f"Nepoznat format: {fmt}")
+    os.replace(tmp_path, path)
+
+    manifest = _load_manifest()
+    manifest[f"{name}:{backend_id(fmt, int8)}"] = {
+        "model": name,
+        "format": fmt,
+        "int8": int8,
+        "path": path,
+        "bytes": os.path.getsize(path),
+        "exported_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    _save_manifest(manifest)
+    logging.info(f"✅ Exported {name} → {path} ({os.path.getsize(path) / 1e6:.0f} MB, "
+                 f"{time.perf_counter() - t0:.1f}s)")
+    return path
+
+
+# ----------------------------
+# RUNNERI
+# ----------------------------
+def _preprocess(name):
+    """Isti preprocess kao eager model, bez učitavanja eager težina."""
+    if name == "clip":
+        from clip.clip import _transform
+        return _transform(INPUT_SIZE)
+    from model_registry import resnet_preprocess
+    return resnet_preprocess()
+
+
+class OnnxRunner:
+    def __init__(self, name, path):
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input = self.session.get_inputs()[0].name
+        self.preprocess = _preprocess(name)
+
+    def __call__(self, batch):
+        import torch
+        return torch.from_numpy(self.session.run(None, {self.input: batch.numpy()})[0])
+
+
+class TorchScriptRunner:
+    def __init__(self, name, path):
+        import torch
+        self.module = torch.jit.load(path, map_location="cpu")
+        self.preprocess = _preprocess(name)
+
+    def __call__(self, batch):
+        import torch
+        with torch.no_grad():
+            return self.module(batch)
+
+
+def _runtime_available(fmt):
+    return fmt == "torchscript" or (fmt == "onnx" and onnxruntime is not None)
+
+
+def _load_runner(entry):
+    cls = OnnxRunner if entry["format"] == "onnx" else TorchScriptRunner
+    return cls(entry["model"], entry["path"])
+
+
+def select_variant(name, backend=BACKEND, manifest=None):
+    """
+    Ključ manifesta varijante koju treba koristiti za `name`, ili None (eager).
+    "auto" bira najveće izmjereno ubrzanje među varijantama koje su prošle
+    provjeru; eksplicitni backend se koristi i bez provjere.
+    """
+    if backend == "eager":
+        return None
+    manifest = _load_manifest() if manifest is None else manifest
+    usable = {key: entry for key, entry in manifest.items()
+              if entry["model"] == name and _runtime_available(entry["format"]) and os.path.exists(entry["path"])}
+    if backend != "auto":
+        matches = [key for key, entry in usable.items() if backend_id(entry["format"], entry["int8"]) == backend]
+        return matches[0] if matches else None
+    checked = [(entry["check"]["speedup"], key) for key, entry in usable.items()
+               if entry.get("check", {}).get("ok") and entry["check"]["speedup"] > 1.0]
+    return max(checked)[1] if checked else None
+
+
+_lock = threading.Lock()
+_runners = {}   # name → (ključ varijante ili None, runner ili None)
+
+
+def get_runner(name):
+    """Runner za `name` (učitan jednom po procesu) ili None ako treba eager model."""
+    with _lock:
+        if name not in _runners:
+            runner, key = None, select_variant(name)
+            if key is not None:
+                entry = _load_manifest()[key]
+                try:
+                    runner = _load_runner(entry)
+                    logging.info(f"🧠 {name}: using {key} ({entry['path']})")
+                except Exception as e:
+                    logging.warning(f"⚠️ {name}: {key} se ne može učitati, koristim eager ({e})")
+                    key = None
+            _runners[name] = (key, runner)
+        return _runners[name][1]
+
+
+def active():
+    """name → korištena varijanta ("eager" ako nijedna) za modele učitane u ovom procesu."""
+    with _lock:
+        return {name: key or "eager" for name, (key, _) in _runners.items()}
+
+
+# ----------------------------
+# PROVJERA (kosinus + ubrzanje prema eager modelu)
+# ----------------------------
+def _check_images(n, seed=0):
+    """Sintetski upiti: nasumične riječi u raznim veličinama, malo rotirane."""
+    import random
+    from PIL import Image, ImageDraw, ImageFont
+
+    rng = random.Random(seed)
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+    images = []
+    for _ in range(n):
+        img = Image.new("RGB", (rng.randint(200, 600), rng.randint(80, 240)), "white")
+        font = ImageFont.load_default(size=rng.randint(24, 64))
+        text = "".join(rng.choice(letters) for _ in range(rng.randint(4, 12)))
+        ImageDraw.Draw(img).text((10, 10), text, font=font, fill=(0, 0, 0))
+        images.append(img.rotate(rng.uniform(-5, 5), expand=True, fillcolor="white"))
+    return images
+
+
+def _timed_embed(fn, batches):
+    """(L2-normalizirani embeddingi, medijan ms po batchu)."""
+    feats, times = [], []
+    for _ in range(CHECK_REPEATS):
+        out = []
+        for batch in batches:
+            t0 = time.perf_counter()
+            out.append(fn(batch).float().numpy())
+            times.append(time.perf_counter() - t0)
+        feats = out
+    feats = np.concatenate(feats)
+    feats /= np.maximum(np.linalg.norm(feats, axis=1, keepdims=True), 1e-12)
+    return feats, 1000 * float(np.median(times))
+
+
+def check(names=MODELS):
+    """Za svaku izvezenu varijantu: kosinus s eager embeddingom i ubrzanje; upis u manifest."""
+    import torch
+
+    manifest = _load_manifest()
+    images = _check_images(CHECK_IMAGES)
+    report = []
+    for name in names:
+        keys = [key for key, entry in manifest.items()
+                if entry["model"] == name and _runtime_available(entry["format"]) and os.path.exists(entry["path"])]
+        if not keys:
+            logging.warning(f"⚠️ {name}: nema izvezenih varijanti (pokreni export)")
+            continue
+        eager = _encoder_module(name)
+        preprocess = _preprocess(name)
+        batches = [torch.stack([preprocess(img) for img in images[i:i + CHECK_BATCH]])
+                   for i in range(0, len(images), CHECK_BATCH)]
+        with torch.no_grad():
+            ref, eager_ms = _timed_embed(eager, batches)
+        del eager
+
+        for key in keys:
+            runner = _load_runner(manifest[key])
+            feats, ms = _timed_embed(runner, batches)
+            cosine = np.sum(ref * feats, axis=1)
+            result = {
+                "cosine_min": round(float(cosine.min()), 5),
+                "cosine_mean": round(float(cosine.mean()), 5),
+                "eager_ms": round(eager_ms, 2),
+                "ms": round(ms, 2),
+                "speedup": round(eager_ms / ms, 2),
+                "ok": bool(cosine.min() >= MIN_COSINE),
+                "batch": CHECK_BATCH,
+                "checked_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            manifest[key]["check"] = result
+            report.append({"variant": key, **result})
+            logging.info(f"{'✅' if result['ok'] else '❌'} {key}: cos min {result['cosine_min']} "
+                         f"mean {result['cosine_mean']}, {result['ms']} ms vs eager {result['eager_ms']} ms "
+                         f"(×{result['speedup']})")
+    _save_manifest(manifest)
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="ONNX / TorchScript CPU inference backends")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_export = sub.add_parser("export")
+    p_export.add_argument("models", nargs="*", help=f"default: {' '.join(MODELS)}")
+    p_export.add_argument("--format", choices=["onnx", "torchscript"], default="onnx")
+    p_export.add_argument("--int8", action="store_true", help="dynamic int8 quantization")
+    p_check = sub.add_parser("check")
+    p_check.add_argument("models", nargs="*", help=f"default: {' '.join(MODELS)}")
+    sub.add_parser("list")
+    args = parser.parse_args()
+    names = getattr(args, "models", None) or list(MODELS)
+    unknown = set(names) - set(MODELS)
+    if unknown:
+        parser.error(f"nepoznat model: {', '.join(sorted(unknown))}")
+
+    if args.cmd == "export":
+        for name in names:
+            export(name, args.format, args.int8)
+    elif args.cmd == "check":
+        report = check(names)
+        print(json.dumps(report, indent=2))
+        if any(not r["ok"] for r in report):
+            raise SystemExit(1)
+    else:
+        manifest = _load_manifest()
+        for name in MODELS:
+            print(json.dumps({"model": name, "selected": select_variant(name, manifest=manifest) or "eager"}))
+        print(json.dumps(manifest, indent=2))
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+match_cli.py — batch/offline prepoznavanje fontova iz naredbenog retka.
+
+Ulaz: direktorij, glob ili JSONL manifest (po retku {"path": ...} ili {"image": ...}).
+Izlaz: jedan JSON redak po slici na stdout, s top-N rezultatima i vremenima po fazi.
+
+Slike teku kroz ograničeni producer/consumer pipeline:
+    thread pool (čitanje + dekodiranje) → Queue(maxsize) → batch embedding
+    → vektorizirana pretraga → JSONL
+
+    python3 match_cli.py data/klijent/ --engine hybrid --top-n 5 > rezultati.jsonl
+    python3 match_cli.py "scans/**/*.jpg" --batch-size 32
+    python3 match_cli.py manifest.jsonl --engine module:search_font_vision
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff")
+DEFAULT_BATCH_SIZE = 16
+DEFAULT_DECODE_WORKERS = 4
+QUEUE_SIZE = 64
+_DONE = object()
+
+
+class _ProducerError:
+    """Iznimka iz producer niti (npr. neispravan JSONL) koju consumer ponovno baca."""
+
+    def __init__(self, exc):
+        self.exc = exc
+
+
+def iter_inputs(spec):
+    """Putanje slika iz direktorija, globa ili JSONL manifesta (redoslijed je stabilan)."""
+    if os.path.isdir(spec):
+        for root, dirs, files in os.walk(spec):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTS):
+                    yield os.path.join(root, name)
+    elif spec.endswith(".jsonl") and os.path.isfile(spec):
+        with open(spec, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                path = entry.get("path") or entry.get("image")
+                if path:
+                    yield path
+    else:
+        yield from sorted(glob.glob(spec, recursive=True))
+
+
+def _decode(path):
+    t0 = time.perf_counter()
+    try:
+        with Image.open(path) as f:
+            img = f.convert("RGB")
+        return path, img, None, time.perf_counter() - t0
+    except Exception as e:
+        return path, None, str(e), time.perf_counter() - t0
+
+
+def _producer(paths, out_q, workers):
+    """
+    Dekodira paralelno, ali nikad više od QUEUE_SIZE slika ne čeka u memoriji.
+    _DONE se šalje uvijek; greška pri čitanju ulaza ide consumeru prije njega.
+    """
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = []
+            for path in paths:
+                pending.append(pool.submit(_decode, path))
+                if len(pending) >= workers * 2:
+                    out_q.put(pending.pop(0).result())
+            for fut in pending:
+                out_q.put(fut.result())
+    except BaseException as e:
+        out_q.put(_ProducerError(e))
+    finally:
+        out_q.put(_DONE)
+
+
+def _emit(path, results, timings, error=None):
+    line = {"image": path, "timings_ms": {k: round(v * 1000, 2) for k, v in timings.items()}}
+    if error:
+        line["error"] = error
+    else:
+        line["matches"] = results
+    sys.stdout.write(json.dumps(line, ensure_ascii=False) + "\n")
+    sys.stdout.flush()
+
+
+def run(spec, engine="vision", top_n=10, batch_size=DEFAULT_BATCH_SIZE, workers=DEFAULT_DECODE_WORKERS):
+    q = queue.Queue(maxsize=QUEUE_SIZE)
+    threading.Thread(target=_producer, args=(iter_inputs(spec), q, workers), daemon=True).start()
+
+    module_search = None
+    if engine.startswith("module:"):
+        import importlib
+        module_search = importlib.import_module(engine.split(":", 1)[1]).find_most_similar_font
+    else:
+        from match_engine import search_batch
+
+    total = 0
+    t_start = time.perf_counter()
+    finished = False
+    while not finished:
+        batch = []
+        while len(batch) < batch_size:
+            item = q.get()
+            if item is _DONE:
+                finished = True
+                break
+            if isinstance(item, _ProducerError):
+                raise item.exc
+            path, img, err, decode_s = item
+            if err:
+                _emit(path, None, {"decode": decode_s}, error=err)
+                continue
+            batch.append((path, img, decode_s))
+        if not batch:
+            continue
+
+        if module_search is not None:
+            for path, img, decode_s in batch:
+                t0 = time.perf_counter()
+                results = module_search(path, top_n=top_n)
+                _emit(path, results, {"decode": decode_s, "search": time.perf_counter() - t0})
+        else:
+            stage = {}
+            all_results = search_batch([img for _, img, _ in batch], engine=engine, top_n=top_n, timings=stage)
+            n = len(batch)
+            for (path, _, decode_s), results in zip(batch, all_results):
+                per_image = {"decode": decode_s}
+                per_image.update({k: v / n for k, v in stage.items()})  # udio u batchu
+                _emit(path, results, per_image)
+        total += len(batch)
+
+    elapsed = time.perf_counter() - t_start
+    logging.info(f"✅ {total} images in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.1f} img/s)")
+    return total
+
+
+if __name__ == "__main__":
+    import argparse
+    from match_engine import ENGINES
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s", stream=sys.stderr)
+    parser = argparse.ArgumentParser(description="Batch font matching → JSONL")
+    parser.add_argument("input", help="directory, glob or JSONL manifest")
+    parser.add_argument("--engine", default="vision",
+                        help=f"{', '.join(ENGINES)} or module:<search module> (npr. module:search_font_vision)")
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=DEFAULT_DECODE_WORKERS)
+    args = parser.parse_args()
+    try:
+        run(args.input, engine=args.engine, top_n=args.top_n, batch_size=args.batch_size, workers=args.workers)
+    except Exception as e:
+        logging.error(f"❌ {type(e).__name__}: {e}")
+        raise SystemExit(1)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+match_engine.py — batched pretraga fontova nad gotovim indeksima.
+
+Jedan poziv search_batch() obrađuje više slika odjednom:
+embedding u jednom forwardu (model_registry.embed_images) → vektorizirana
+pretraga (vector_index / clip_text_index) → opcionalni batch SSIM rerank
+(ssim_rerank) → metadata (font_meta, SQLite). Rezultati imaju ista polja kao
+find_most_similar_font u aplikacijama (file, score 0–100, embed_score, ssim_score,
+full_name, license, source).
+
+`filters` (npr. {"free": True, "source": "google-fonts"}) se pretvaraju u masku
+kandidata i primjenjuju unutar vektorske pretrage, ne naknadno nad top-N.
+
+Engine:
+    "vision"    ResNet50 + visual_embeddings (vector_index)
+    "hybrid"    kao vision + SSIM nad top SSIM_TOP_K kandidata
+    "clip-text" CLIP slika ↔ CLIP tekst naziva fontova (clip_text_index)
+    "glyph"     glasovi po znaku nad glyph indeksom (glyph_index), bez modela
+    "cascade"   pHash prefilter → ResNet nad preživjelima → SSIM nad shortlistom (cascade)
+"""
+
+import os
+import json
+import time
+import threading
+import numpy as np
+import tracing
+
+# ----------------------------
+# KONFIG
+# ----------------------------
+INDEX_FILE = "data/visual_index.json"
+ENGINES = ("vision", "hybrid", "clip-text", "glyph", "cascade")
+SSIM_TOP_K = 100
+EMBED_WEIGHT = 0.7  # hybrid: score = 100 * (0.7 * embed + 0.3 * ssim)
+
+_lock = threading.Lock()
+_catalog = None
+
+
+def load_catalog():
+    """(redovi visual_index.json, font_meta.FontMeta: file → zapis); učitano jednom po procesu."""
+    from font_meta import open_meta
+
+    global _catalog
+    with _lock:
+        mtime = os.path.getmtime(INDEX_FILE)
+        if _catalog is None or _catalog[0] != mtime:
+            with open(INDEX_FILE, "r", encoding="utf-8") as f:
+                _catalog = (mtime, json.load(f))
+        return _catalog[1], open_meta()
+
+
+def candidate_mask(files, filters):
+    """Bool maska po `files` za filtre ({"free", "license", "source"}), ili None."""
+    if not filters:
+        return None
+    from font_meta import open_meta
+    return open_meta().candidate_mask(files, **filters)
+
+
+def _result(font, file, score, embed_score, ssim_score=None):
+    font = font or {}
+    return {
+        "file": file,
+        "score": float(score),
+        "embed_score": float(embed_score),
+        "ssim_score": float(ssim_score) if ssim_score is not None else 0.0,
+        "full_name": font.get("full_name"),
+        "license": font.get("license"),
+        "source": font.get("source"),
+        "font_path": font.get("font_path"),
+    }
+
+
+def search_batch(images, engine="vision", top_n=10, ssim_top_k=SSIM_TOP_K, timings=None, index=None,
+                 filters=None):
+    """
+    Lista PIL slika → lista lista rezultata (po slici). Ako je zadan dict
+    `timings`, u njega se zbrajaju sekunde po fazi (embed, search, ssim, meta).
+    `index` zamjenjuje get_visual_index() (npr. podskup kataloga u benchmarku);
+    mora vraćati retke visual_index.json. `filters` ograničava kandidate.
+    """
+    from model_registry import embed_images
+
+    if engine not in ENGINES:
+        raise ValueError(f"Nepoznat engine: {engine}")
+    timings = timings if timings is not None else {}
+
+    def _tick(stage, t0):
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - t0
+        return time.perf_counter()
+
+    t0 = time.perf_counter()
+    if engine == "glyph":
+        from glyph_index import search_glyphs
+
+        files, meta = load_catalog()
+        ranked = search_glyphs(images, top_n=top_n, mask=candidate_mask(files, filters))
+        t0 = _tick("search", t0)
+        metas = meta.get_many(files[row] for per_image in ranked for row, *_ in per_image)
+        out = [[_result(metas.get(files[row]), files[row], 100 * score, score) for row, score, _, _ in per_image]
+               for per_image in ranked]
+        _tick("meta", t0)
+        return out
+
+    if engine == "cascade":
+        from cascade import search_cascade
+
+        files, meta = load_catalog()
+        ranked = search_cascade(images, top_n=top_n, embed_keep=max(top_n, ssim_top_k),
+                                mask=candidate_mask(files, filters))
+        t0 = _tick("search", t0)
+        metas = meta.get_many(files[row] for per_image in ranked for row, *_ in per_image)
+        out = [[_result(metas.get(files[row]), files[row], score, embed_score, ssim_score)
+                for row, score, embed_score, ssim_score in per_image]
+               for per_image in ranked]
+        _tick("meta", t0)
+        return out
+
+    if engine == "clip-text":
+        from clip_text_index import get_text_index
+        from model_registry import get_model, CLIP_MODEL_NAME
+
+        vectors = embed_images("clip", images)
+        t0 = _tick("embed", t0)
+        clip_model, _, device = get_model("clip")
+        matrix, fonts = get_text_index(clip_model, device, model_name=CLIP_MODEL_NAME)
+        mask = candidate_mask([font.get("file") for font in fonts], filters)
+        with tracing.span("index_search", backend="clip-text", batch=len(images)):
+            sims = vectors @ matrix.T
+            if mask is not None:
+                sims[:, ~mask] = -np.inf
+            k = min(top_n, sims.shape[1] if mask is None else int(mask.sum()))
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k] if k else np.zeros((len(images), 0), int)
+        t0 = _tick("search", t0)
+        out = []
+        with tracing.span("metadata", batch=len(images)):
+            for qi in range(len(images)):
+                row = top[qi][np.argsort(-sims[qi, top[qi]])]
+                out.append([_result(fonts[i], fonts[i].get("file"), 100 * sims[qi, i], sims[qi, i]) for i in row])
+        _tick("meta", t0)
+        return out
+
+    from vector_index import get_visual_index
+
+    vectors = embed_images("resnet50", images)
+    t0 = _tick("embed", t0)
+    if index is None:
+        index = get_visual_index()
+    k = max(top_n, ssim_top_k) if engine == "hybrid" else top_n
+    files, meta = load_catalog()
+    mask = candidate_mask(files, filters)
+    with tracing.span("index_search", backend=index.backend, batch=len(images), k=k):
+        ids, scores = index.search(vectors, k) if mask is None else index.search(vectors, k, mask=mask)
+    t0 = _tick("search", t0)
+
+    ssim = None
+    if engine == "hybrid":
+        from ssim_rerank import rerank
+        ssim = []
+        for img, row_ids in zip(images, ids):
+            valid = row_ids[row_ids >= 0]
+            ssim.append(rerank(img, valid))
+        t0 = _tick("ssim", t0)
+
+    with tracing.span("metadata", batch=len(images)):
+        metas = meta.get_many(files[row] for row in np.unique(ids) if row >= 0)  # jedan SQL upit
+        out = []
+        for qi in range(len(images)):
+            results = []
+            for j, row in enumerate(ids[qi]):
+                if row < 0:
+                    continue
+                embed_score = float(scores[qi, j])
+                if ssim is not None:
+                    ssim_score = float(ssim[qi][j])
+                    score = 100 * (EMBED_WEIGHT * embed_score + (1 - EMBED_WEIGHT) * ssim_score)
+                else:
+                    ssim_score = None
+                    score = 100 * embed_score
+                results.append(_result(metas.get(files[row]), files[row], score, embed_score, ssim_score))
+            results.sort(key=lambda r: r["score"], reverse=True)
+            out.append(results[:top_n])
+    _tick("meta", t0)
+    return out
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+model_registry.py — procesni registar modela s lijenim učitavanjem.
+
+Svaki model se u jednom workeru učita najviše jednom (thread-safe, lock po
+modelu) i tek kad ga neki način pretrage prvi put zatraži. Sve Streamlit
+sesije u procesu dijele iste težine umjesto da svaka drži kopiju u
+st.session_state.
+
+    from model_registry import get_model, stats
+    model, preprocess, device = get_model("resnet50")
+
+embed_images na CPU-u koristi izvezeni ONNX/TorchScript encoder kad postoji
+provjerena varijanta (inference_backends.py), a eager model samo inače.
+
+    python3 model_registry.py warmup resnet50 clip   # učitaj + probni forward, ispiši statistiku
+"""
+
+import os
+import time
+import logging
+import threading
+import tracing
+import inference_backends
+
+# ----------------------------
+# KONFIG
+# ----------------------------
+CLIP_MODEL_NAME = "ViT-B/32"
+
+
+def get_device():
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+# ----------------------------
+# LOADERI
+# ----------------------------
+def resnet_preprocess():
+    """ImageNet preprocess za ResNet50 (dijele ga eager model i izvezeni backendi)."""
+    from torchvision import transforms
+
+    return transforms.Compose([
+        transforms.Resize((224, 224)),
+        transforms.ToTensor(),
+        transforms.Normalize(
+            mean=[0.485, 0.456, 0.406],
+            std=[0.229, 0.224, 0.225]
+        ),
+    ])
+
+
+def load_resnet50(device):
+    """ResNet50 bez fc sloja (2048-d avgpool značajke) + ImageNet preprocess."""
+    import torch
+    from torchvision import models
+
+    model = models.resnet50(weights=models.ResNet50_Weights.DEFAULT)
+    model = torch.nn.Sequential(*(list(model.children())[:-1]))  # bez fc sloja
+    model.eval().to(device)
+    return model, resnet_preprocess()
+
+
+def load_clip(device, name=CLIP_MODEL_NAME):
+    import clip
+
+    model, preprocess = clip.load(name, device=device, jit=False)
+    model.eval()
+    return model, preprocess
+
+
+def _dummy_forward(name, model, preprocess, device):
+    import torch
+    from PIL import Image
+
+    x = preprocess(Image.new("RGB", (224, 224), "white")).unsqueeze(0).to(device)
+    with torch.no_grad():
+        if name == "clip":
+            model.encode_image(x)
+        else:
+            model(x)
+
+
+LOADERS = {
+    "resnet50": load_resnet50,
+    "clip": load_clip,
+}
+
+
+# ----------------------------
+# REGISTAR
+# ----------------------------
+_registry_lock = threading.Lock()
+_model_locks = {}
+_models = {}   # name → (model, preprocess, device)
+_info = {}     # name → {"load_seconds", "param_bytes", "device", "warm"}
+
+
+def _lock_for(name):
+    with _registry_lock:
+        return _model_locks.setdefault(name, threading.Lock())
+
+
+def _param_bytes(model):
+    total = 0
+    for t in list(model.parameters()) + list(model.buffers()):
+        total += t.numel() * t.element_size()
+    return total
+
+
+def get_model(name):
+    """Vrati (model, preprocess, device); učitava se samo pri prvom pozivu u procesu."""
+    if name in _models:
+        return _models[name]
+    if name not in LOADERS:
+        raise KeyError(f"Nepoznat model: {name}")
+    with _lock_for(name):
+        if name in _models:
+            return _models[name]
+        device = get_device()
+        t0 = time.perf_counter()
+        model, preprocess = LOADERS[name](device)
+        elapsed = time.perf_counter() - t0
+        _info[name] = {
+            "device": device,
+            "load_seconds": round(elapsed, 2),
+            "param_bytes": _param_bytes(model),
+            "warm": False,
+        }
+        _models[name] = (model, preprocess, device)
+        logging.info(f"🧠 Loaded {name} on {device} in {elapsed:.1f}s "
+                     f"({_info[name]['param_bytes'] / 1e6:.0f} MB weights)")
+        return _models[name]
+
+
+def try_get_model(name):
+    """Kao get_model, ali vraća (None, None, None) ako se model ne može učitati."""
+    try:
+        return get_model(name)
+    except Exception as e:
+        logging.warning(f"⚠️ {name} nije učitan: {e}")
+        return None, None, None
+
+
+def is_loaded(name):
+    return name in _models
+
+
+def warm_up(names=("resnet50",)):
+    """Učitaj modele i napravi jedan probni forward (alokacije, lijeni init kernela)."""
+    for name in names:
+        model, preprocess, device = get_model(name)
+        if not _info[name]["warm"]:
+            t0 = time.perf_counter()
+            _dummy_forward(name, model, preprocess, device)
+            _info[name]["warm"] = True
+            _info[name]["warmup_seconds"] = round(time.perf_counter() - t0, 3)
+
+
+def embed_images(name, images):
+    """
+    Lista PIL slika → L2-normalizirana float32 matrica (len × dim) u jednom
+    batched forwardu. "resnet50" daje 2048-d avgpool značajke, "clip" encode_image.
+    Na CPU-u ide kroz izvezeni backend ako ga inference_backends odabere.
+    """
+    import torch
+
+    runner = inference_backends.get_runner(name) if get_device() == "cpu" else None
+    if runner is not None:
+        forward, preprocess, device = runner, runner.preprocess, "cpu"
+    else:
+        model, preprocess, device = get_model(name)
+        forward = model.encode_image if name == "clip" else model
+    with tracing.span("preprocess", model=name, batch=len(images)):
+        batch = torch.stack([preprocess(img.convert("RGB")) for img in images]).to(device)
+    with tracing.span("embed", model=name, batch=len(images)), torch.no_grad():
+        feats = forward(batch).flatten(1).float()
+        feats /= feats.norm(dim=-1, keepdim=True).clamp_min(1e-12)
+        return feats.cpu().numpy()
+
+
+def process_rss_bytes():
+    """Trenutni RSS procesa (Linux /proc), inače vršni RSS iz getrusage."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def stats():
+    """Što je rezidentno u ovom workeru: po modelu + ukupni RSS procesa."""
+    return {
+        "pid": os.getpid(),
+        "rss_bytes": process_rss_bytes(),
+        "models": {name: dict(info) for name, info in _info.items()},
+        "backends": inference_backends.active(),
+        "available": sorted(LOADERS),
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    import json
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    if len(sys.argv) < 2 or sys.argv[1] != "warmup":
+        raise SystemExit("Usage: python3 model_registry.py warmup [resnet50] [clip]")
+    warm_up(sys.argv[2:] or ["resnet50"])
+    print(json.dumps(stats(), indent=2))
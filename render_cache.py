@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+render_cache.py — dvorazinski, sadržajno adresiran cache za render_font_preview.
+
+1. razina: LRU u memoriji procesa s izbacivanjem po veličini (bajtovi piksela).
+2. razina: PNG/WebP datoteke na disku (data/render_cache/ab/<ključ>.png),
+   ograničene s DISK_LIMIT_BYTES; iznad granice se brišu najdulje nekorištene
+   (mtime se osvježava pri svakom pogotku s diska) do DISK_PRUNE_TO.
+
+Ključ = sha256(font datoteke) + tekst + size + image_size, pa preimenovani ili
+kopirani fontovi dijele isti zapis, a promijenjeni font automatski dobiva novi.
+"""
+
+import os
+import io
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+# ----------------------------
+# KONFIG
+# ----------------------------
+CACHE_DIR = "data/render_cache"
+CACHE_FORMAT = "PNG"                    # "PNG" ili "WEBP" (lossless)
+MEMORY_LIMIT_BYTES = 256 * 1024 * 1024  # ~1700 previewa 512x256 RGB
+DISK_LIMIT_BYTES = 2 * 1024 ** 3        # ~2 GB PNG-ova na disku
+DISK_PRUNE_TO = 0.8                     # nakon čišćenja ostaje 80% granice (ne skenira se na svaki put)
+RENDER_VERSION = "1"                    # povećaj kad se promijeni izgled previewa
+
+_lock = threading.Lock()
+_hash_cache = {}  # path -> ((mtime, size), sha256)
+_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "disk_evictions": 0}
+_disk_bytes = None  # procjena zauzeća diska u ovom procesu; None → skeniraj
+_prune_lock = threading.Lock()
+
+
+def font_file_hash(font_path):
+    """sha256 font datoteke; ponovno se čita samo kad se promijeni mtime/veličina."""
+    st = os.stat(font_path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _lock:
+        cached = _hash_cache.get(font_path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    h = hashlib.sha256()
+    with open(font_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _lock:
+        _hash_cache[font_path] = (stamp, digest)
+    return digest
+
+
+def cache_key(font_hash, text, size, image_size):
+    raw = f"{RENDER_VERSION}|{font_hash}|{size}|{image_size[0]}x{image_size[1]}|{text}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _ByteLRU:
+    """OrderedDict LRU ograničen ukupnom veličinom slika u bajtovima."""
+
+    def __init__(self, limit_bytes):
+        self.limit_bytes = limit_bytes
+        self.total_bytes = 0
+        self._items = OrderedDict()
+
+    def get(self, key):
+        item = self._items.get(key)
+        if item is None:
+            return None
+        self._items.move_to_end(key)
+        return item[0]
+
+    def put(self, key, img):
+        nbytes = img.width * img.height * len(img.getbands())
+        if nbytes > self.limit_bytes:
+            return
+        old = self._items.pop(key, None)
+        if old is not None:
+            self.total_bytes -= old[1]
+        self._items[key] = (img, nbytes)
+        self.total_bytes += nbytes
+        while self.total_bytes > self.limit_bytes:
+            _, (_, freed) = self._items.popitem(last=False)
+            self.total_bytes -= freed
+            _stats["evictions"] += 1
+
+    def clear(self):
+        self._items.clear()
+        self.total_bytes = 0
+
+    def __len__(self):
+        return len(self._items)
+
+
+_memory = _ByteLRU(MEMORY_LIMIT_BYTES)
+
+
+def _disk_path(key):
+    ext = ".webp" if CACHE_FORMAT.upper() == "WEBP" else ".png"
+    return os.path.join(CACHE_DIR, key[:2], key + ext)
+
+
+def get(key):
+    """Vrati kopiju slike iz cachea ili None."""
+    with _lock:
+        img = _memory.get(key)
+        if img is not None:
+            _stats["memory_hits"] += 1
+            return img.copy()
+
+    path = _disk_path(key)
+    if os.path.exists(path):
+        try:
+            with Image.open(path) as f:
+                img = f.convert("RGB")
+        except Exception as e:
+            logging.warning(f"⚠️ Oštećen zapis u render cacheu {path}: {e}")
+            return None
+        try:
+            os.utime(path)  # LRU redoslijed za čišćenje diska
+        except OSError:
+            pass
+        with _lock:
+            _memory.put(key, img)
+            _stats["disk_hits"] += 1
+        return img.copy()
+
+    with _lock:
+        _stats["misses"] += 1
+    return None
+
+
+def put(key, img):
+    """Spremi sliku u obje razine. Disk zapis ide preko tmp datoteke + os.replace."""
+    with _lock:
+        _memory.put(key, img.copy())
+
+    path = _disk_path(key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        buf = io.BytesIO()
+        if CACHE_FORMAT.upper() == "WEBP":
+            img.save(buf, format="WEBP", lossless=True)
+        else:
+            img.save(buf, format="PNG", optimize=False)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(buf.getvalue())
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logging.warning(f"⚠️ Ne mogu zapisati render cache {path}: {e}")
+        return
+    _account_disk(buf.getbuffer().nbytes)
+
+
+def _scan_disk():
+    """[(mtime, veličina, putanja)] svih zapisa u CACHE_DIR."""
+    entries = []
+    for root, _, files in os.walk(CACHE_DIR):
+        for name in files:
+            if name.endswith(".tmp"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue  # drugi proces ga je upravo obrisao
+            entries.append((st.st_mtime, st.st_size, path))
+    return entries
+
+
+def _account_disk(nbytes):
+    """Zbroji novi zapis; kad procjena prijeđe DISK_LIMIT_BYTES, obriši najstarije zapise."""
+    global _disk_bytes
+    with _prune_lock:
+        if _disk_bytes is None:
+            _disk_bytes = sum(size for _, size, _ in _scan_disk())
+        else:
+            _disk_bytes += nbytes
+        if _disk_bytes <= DISK_LIMIT_BYTES:
+            return
+        # ponovno skeniranje: i drugi procesi (Streamlit workeri) pišu u isti direktorij
+        entries = sorted(_scan_disk())
+        total = sum(size for _, size, _ in entries)
+        target = DISK_LIMIT_BYTES * DISK_PRUNE_TO
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        _disk_bytes = total
+    with _lock:
+        _stats["disk_evictions"] += removed
+    logging.info(f"🧹 Render cache: obrisano {removed} najstarijih zapisa, {total / 1e6:.0f} MB na disku")
+
+
+def clear_memory():
+    with _lock:
+        _memory.clear()
+
+
+def stats():
+    with _lock:
+        return dict(_stats, memory_entries=len(_memory), memory_bytes=_memory.total_bytes, disk_bytes=_disk_bytes)
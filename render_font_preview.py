@@ -4,36 +4,71 @@
 """
 render_font_preview.py — radna verzija (bez kontrast provjere)
 Radi i kad font ne podržava sve znakove.
+Gotovi previewi se spremaju u render_cache (memorija + disk).
+render_previews() renderira više previewa odjednom na thread poolu s rokom
+(kartice rezultata u UI-ju).
 """
 
 import io
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from PIL import Image, ImageDraw, ImageFont
 from fontTools.ttLib import TTFont
 from fontTools.ttLib.woff2 import decompress as woff2_decompress
+import render_cache
+import tracing
 
-def render_font_preview(font_path, text=None, size=64, image_size=(512, 256)):
-    try:
-        if font_path.lower().endswith(".woff2"):
-            with open(font_path, "rb") as input_buf:
-                output_buf = io.BytesIO()
-                woff2_decompress(input_buf, output_buf)
-                output_buf.seek(0)
-                font = ImageFont.truetype(output_buf, size)
-        elif font_path.lower().endswith(".woff"):
-            font = TTFont(font_path)
+DEFAULT_TEXT = "ABCDEFGHIJKLMNOPQRSTUVWXYZ\nabcdefghijklmnopqrstuvwxyz\n0123456789"
+PREVIEW_WORKERS = 8    # niti po pozivu render_previews (koliko kartica se renderira odjednom)
+PREVIEW_TIMEOUT = 5.0  # sekundi od predaje do kraja svih rendera jednog poziva
+
+def render_font_preview(font_path, text=None, size=64, image_size=(512, 256), use_cache=True):
+    if text is None:
+        text = DEFAULT_TEXT
+    image_size = tuple(image_size)
+
+    with tracing.span("preview") as attrs:
+        key = None
+        if use_cache:
+            try:
+                key = render_cache.cache_key(render_cache.font_file_hash(font_path), text, size, image_size)
+                cached = render_cache.get(key)
+                if cached is not None:
+                    attrs["cached"] = True
+                    return cached
+            except OSError as e:
+                print(f"⚠️  Ne mogu učitati font: {font_path} ({e})")
+                return None
+
+        attrs["cached"] = False
+        img = _render_uncached(font_path, text, size, image_size)
+        if img is not None and key is not None:
+            render_cache.put(key, img)
+        return img
+
+def load_font(font_path, size):
+    """ImageFont za .ttf/.otf/.woff/.woff2 (web fontovi se raspakiraju u memoriji)."""
+    if font_path.lower().endswith(".woff2"):
+        with open(font_path, "rb") as input_buf:
             output_buf = io.BytesIO()
-            font.save(output_buf)
+            woff2_decompress(input_buf, output_buf)
             output_buf.seek(0)
-            font = ImageFont.truetype(output_buf, size)
-        else:
-            font = ImageFont.truetype(font_path, size)
+            return ImageFont.truetype(output_buf, size)
+    elif font_path.lower().endswith(".woff"):
+        font = TTFont(font_path)
+        output_buf = io.BytesIO()
+        font.save(output_buf)
+        output_buf.seek(0)
+        return ImageFont.truetype(output_buf, size)
+    return ImageFont.truetype(font_path, size)
+
+def _render_uncached(font_path, text, size, image_size):
+    try:
+        font = load_font(font_path, size)
     except Exception as e:
         print(f"⚠️  Ne mogu učitati font: {font_path} ({e})")
         return None
 
-    if text is None:
-        text = "ABCDEFGHIJKLMNOPQRSTUVWXYZ\nabcdefghijklmnopqrstuvwxyz\n0123456789"
-
     img = Image.new("L", image_size, 255)
     draw = ImageDraw.Draw(img)
     draw.text((10, 10), text, font=font, fill=0)
@@ -48,3 +83,44 @@ def render_font_preview(font_path, text=None, size=64, image_size=(512, 256)):
 
     return img.convert("RGB")
 
+
+# ----------------------------
+# KONKURENTNI RENDER (UI)
+# ----------------------------
+def render_previews(font_paths, text=None, timeout=PREVIEW_TIMEOUT, **kwargs):
+    """
+    Generator (indeks, slika ili None) redoslijedom završetka rendera.
+
+    Svaki poziv ima svoj pool (najviše PREVIEW_WORKERS niti) i jedan rok od
+    `timeout` sekundi od predaje: sve što dotad ne završi (uključujući rendere
+    koji još čekaju na red) daje None. Zaglavljena nit se ne može prekinuti, ali
+    ostaje u poolu ovog poziva i ne blokira rendere drugih sesija.
+    """
+    if not font_paths:
+        return
+    pool = ThreadPoolExecutor(max_workers=min(PREVIEW_WORKERS, len(font_paths)), thread_name_prefix="preview")
+    render = tracing.bind(lambda path: render_font_preview(path, text=text, **kwargs))
+    pending = {pool.submit(render, path): i for i, path in enumerate(font_paths)}
+    deadline = time.monotonic() + timeout
+    try:
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for fut in done:
+                i = pending.pop(fut)
+                try:
+                    img = fut.result()
+                except Exception as e:
+                    print(f"⚠️  Preview nije uspio: {font_paths[i]} ({e})")
+                    img = None
+                yield i, img
+        for fut, i in sorted(pending.items(), key=lambda item: item[1]):
+            fut.cancel()
+            tracing.inc("preview_timeouts_total", "render_font_preview")
+            print(f"⚠️  Preview nije gotov nakon {timeout:.0f}s: {font_paths[i]}")
+            yield i, None
+        pending.clear()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
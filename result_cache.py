@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+result_cache.py — procesni cache rezultata pretrage za Streamlit rerune.
+
+Streamlit ponovno izvršava cijelu skriptu na svaku interakciju (odjava,
+promjena moda, checkbox), pa bi se ista slika iznova pretraživala. Ključ je
+sha256 bajtova uploada + mod pretrage + top_n, a zapisi istječu nakon
+TTL_SECONDS i izbacuju se LRU redom iznad MAX_ENTRIES. Cache je zajednički
+svim sesijama u procesu (ista slika → isti rezultat).
+"""
+
+import copy
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import tracing
+
+# ----------------------------
+# KONFIG
+# ----------------------------
+TTL_SECONDS = 15 * 60
+MAX_ENTRIES = 256
+
+_lock = threading.Lock()
+_items = OrderedDict()  # ključ → (vrijeme upisa, rezultati)
+_stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+
+
+def upload_key(data, *parts):
+    """Ključ iz bajtova uploada i parametara pretrage (mod, top_n...)."""
+    return "|".join([hashlib.sha256(data).hexdigest(), *map(str, parts)])
+
+
+def get(key):
+    """Kopija spremljenih rezultata ili None (nema zapisa / istekao)."""
+    with _lock:
+        item = _items.get(key)
+        if item is not None and time.monotonic() - item[0] > TTL_SECONDS:
+            del _items[key]
+            _stats["expired"] += 1
+            item = None
+        if item is None:
+            _stats["misses"] += 1
+            tracing.inc("result_cache_total", "miss")
+            return None
+        _items.move_to_end(key)
+        _stats["hits"] += 1
+    tracing.inc("result_cache_total", "hit")
+    return copy.deepcopy(item[1])
+
+
+def put(key, results):
+    with _lock:
+        _items.pop(key, None)
+        _items[key] = (time.monotonic(), copy.deepcopy(results))
+        while len(_items) > MAX_ENTRIES:
+            _items.popitem(last=False)
+            _stats["evictions"] += 1
+
+
+def get_or_compute(key, compute):
+    """Rezultat iz cachea, inače compute() koji se sprema (iznimke se ne cacheiraju)."""
+    results = get(key)
+    if results is None:
+        results = compute()
+        put(key, results)
+    return results
+
+
+def clear():
+    with _lock:
+        _items.clear()
+
+
+def stats():
+    with _lock:
+        return {**_stats, "entries": len(_items)}
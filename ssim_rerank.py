@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ssim_rerank.py — vektorizirani batch SSIM nad unaprijed pripremljenim referencama.
+
+Offline: za svaki red visual_index.json uzima se preview (iz sprite sheetova
+build_previews.py ako postoje, inače render), normalizira (prep_for_ssim: siva
+slika, fiksna veličina) i sprema u jedan pakirani uint8 tenzor
+data/ssim_refs.npy (N × H × W) koji se otvara s mmap_mode="r".
+
+Upit: batch_ssim() računa SSIM jednog upita protiv cijelog odsječka kandidata
+odjednom (box prozor 7×7, K1=0.01, K2=0.03, sample covariance — isto kao
+zadani skimage.metrics.structural_similarity), pa SSIM_TOP_K može biti stotine.
+
+    python3 ssim_rerank.py build [--workers 8]
+"""
+
+import os
+import json
+import logging
+import threading
+import numpy as np
+from PIL import Image
+import tracing
+from embedding_store import file_stamp
+from concurrent.futures import ProcessPoolExecutor
+
+# ----------------------------
+# KONFIG
+# ----------------------------
+INDEX_FILE = "data/visual_index.json"
+MANIFEST_FILE = "data/visual_manifest.json"
+REFS_FILE = "data/ssim_refs.npy"
+SSIM_SHAPE = (128, 256)  # (H, W)
+WIN_SIZE = 7
+K1, K2 = 0.01, 0.03
+BATCH_CHUNK = 64         # kandidata po vektoriziranom koraku (ograničava memoriju)
+PREVIEW_TEXT = "ABCDEFGHIJKLMNOPQRSTUVWXYZ\nabcdefghijklmnopqrstuvwxyz\n0123456789"
+DEFAULT_WORKERS = os.cpu_count() or 4
+
+
+def prep_for_ssim(img, shape=SSIM_SHAPE):
+    """PIL slika ili ndarray → uint8 siva slika fiksne veličine (H, W)."""
+    if isinstance(img, np.ndarray):
+        img = Image.fromarray(img)
+    img = img.convert("L")
+    if img.size != (shape[1], shape[0]):
+        img = img.resize((shape[1], shape[0]), Image.BILINEAR)
+    return np.asarray(img, dtype=np.uint8)
+
+
+def _box_filter(x, win=WIN_SIZE):
+    """Srednja vrijednost u win×win prozoru za zadnje dvije osi, samo 'valid' dio (integralna slika)."""
+    c = np.cumsum(np.cumsum(x, axis=-2, dtype=np.float64), axis=-1)
+    c = np.pad(c, [(0, 0)] * (x.ndim - 2) + [(1, 0), (1, 0)])
+    s = c[..., win:, win:] - c[..., :-win, win:] - c[..., win:, :-win] + c[..., :-win, :-win]
+    return (s / (win * win)).astype(np.float32)
+
+
+def batch_ssim(query, refs, data_range=255.0, win=WIN_SIZE):
+    """
+    SSIM (H, W) upita prema (K, H, W) referencama → (K,) float32.
+    Rubovi širine (win-1)//2 se izostavljaju kao u skimageu, pa je rezultat
+    isti kao structural_similarity(query, ref, data_range=255) par po par.
+    """
+    x = np.asarray(query, dtype=np.float32)[None]
+    out = np.empty(len(refs), dtype=np.float32)
+    np_ = win * win
+    cov_norm = np_ / (np_ - 1.0)
+    c1 = (K1 * data_range) ** 2
+    c2 = (K2 * data_range) ** 2
+
+    ux = _box_filter(x, win)
+    uxx = _box_filter(x * x, win)
+    vx = cov_norm * (uxx - ux * ux)
+    for start in range(0, len(refs), BATCH_CHUNK):
+        y = np.asarray(refs[start:start + BATCH_CHUNK], dtype=np.float32)
+        uy = _box_filter(y, win)
+        uyy = _box_filter(y * y, win)
+        uxy = _box_filter(x * y, win)
+        vy = cov_norm * (uyy - uy * uy)
+        vxy = cov_norm * (uxy - ux * uy)
+        num = (2 * ux * uy + c1) * (2 * vxy + c2)
+        den = (ux * ux + uy * uy + c1) * (vx + vy + c2)
+        out[start:start + y.shape[0]] = (num / den).mean(axis=(-2, -1))
+    return out
+
+
+# ----------------------------
+# REFERENCE (offline)
+# ----------------------------
+def _ref_worker(font_path):
+    from render_font_preview import render_font_preview
+    img = render_font_preview(font_path, text=PREVIEW_TEXT, use_cache=False)  # jednokratni offline render
+    return prep_for_ssim(img) if img is not None else None
+
+
+def _font_paths_for_index(index_file=INDEX_FILE, manifest_file=MANIFEST_FILE, path_map=None):
+    """Red u visual_index.json → font_path (iz visual_manifest.json, inače all_fonts_flat)."""
+    from build_visual_embeddings import local_path
+
+    with open(index_file, "r", encoding="utf-8") as f:
+        files = json.load(f)
+    paths = {}
+    if os.path.exists(manifest_file):
+        with open(manifest_file, "r", encoding="utf-8") as f:
+            paths = {row["file"]: row["font_path"] for row in json.load(f).get("rows", [])}
+    return [local_path(paths.get(fname) or os.path.join("data/all_fonts_flat", fname), path_map)
+            for fname in files]
+
+
+def _atlas_previews(files, preview_dir=None):
+    """(file, preview) iz sprite sheetova, sheet po sheet, ako su isti parametri rendera."""
+    from build_previews import PREVIEW_DIR, get_atlas
+
+    atlas = get_atlas(preview_dir or PREVIEW_DIR)
+    if atlas is None or atlas.atlas.get("params", {}).get("text") != PREVIEW_TEXT:
+        return iter(())
+    return atlas.iter_cells(files)
+
+
+def build_reference_rasters(workers=DEFAULT_WORKERS, out_file=REFS_FILE, index_file=INDEX_FILE,
+                            manifest_file=MANIFEST_FILE, preview_dir=None, path_map=None):
+    """
+    Izgradi pakirani (N, H, W) uint8 tenzor poravnat s redovima visual_index.json;
+    meta ide pokraj njega (ssim_refs.npy → ssim_refs.json).
+    """
+    font_paths = _font_paths_for_index(index_file, manifest_file, path_map)
+    with open(index_file, "r", encoding="utf-8") as f:
+        files = json.load(f)
+    tmp_file = out_file + ".tmp.npy"
+    refs = np.lib.format.open_memmap(tmp_file, mode="w+", dtype=np.uint8,
+                                     shape=(len(font_paths),) + SSIM_SHAPE)
+    # previewi se pripremaju izravno u memmap dok je njihov sheet učitan
+    row_of = {fname: row for row, fname in enumerate(files)}
+    done = np.zeros(len(files), dtype=bool)
+    for fname, cell in _atlas_previews(files, preview_dir):
+        refs[row_of[fname]] = prep_for_ssim(cell)
+        done[row_of[fname]] = True
+    todo = np.flatnonzero(~done).tolist()
+    logging.info(f"➡️ SSIM references: {len(files) - len(todo)} from preview atlas, {len(todo)} to render")
+    missing = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for row, arr in zip(todo, pool.map(_ref_worker, [font_paths[r] for r in todo], chunksize=16)):
+            if arr is None:
+                refs[row] = 255  # prazna (bijela) referenca → nizak SSIM
+                missing.append(row)
+            else:
+                refs[row] = arr
+    refs.flush()
+    del refs
+    os.replace(tmp_file, out_file)
+    with open(os.path.splitext(out_file)[0] + ".json", "w", encoding="utf-8") as f:
+        json.dump({"rows": len(font_paths), "shape": list(SSIM_SHAPE), "missing": missing}, f)
+    logging.info(f"✅ SSIM references: {len(font_paths)} rows → {out_file} ({len(missing)} unrenderable)")
+
+
+_lock = threading.Lock()
+_refs = {}  # path → (stamp, mmap)
+
+
+def get_reference_rasters(path=REFS_FILE):
+    """Mapirani (N, H, W) uint8 tenzor; ponovno se otvara kad build zamijeni datoteku."""
+    stamp = file_stamp(path)
+    with _lock:
+        cached = _refs.get(path)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, np.load(path, mmap_mode="r"))
+            _refs[path] = cached
+        return cached[1]
+
+
+def rerank(query_img, rows, refs=None):
+    """SSIM upita prema referencama zadanih redova (npr. top-K iz vector_index) → (K,) float32."""
+    refs = get_reference_rasters() if refs is None else refs
+    rows = np.asarray(rows, dtype=np.int64)
+    with tracing.span("ssim_rerank", k=len(rows)):
+        order = np.argsort(rows)  # sortirani indeksi → sekvencijalnija čitanja iz mmapa
+        scores = np.empty(len(rows), dtype=np.float32)
+        scores[order] = batch_ssim(prep_for_ssim(query_img), refs[rows[order]])
+    return scores
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Packed SSIM reference rasters")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_build = sub.add_parser("build")
+    p_build.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    args = parser.parse_args()
+    build_reference_rasters(workers=args.workers)
@@ -0,0 +1,225 @@
+import importlib
+import io
+import json
+import os
+import zipfile
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+DATA = bytes(range(256)) * 40  # 10240 B
+ETAG = '"v1"'
+
+
+@pytest.fixture(scope="session")
+def fd_module(tmp_path_factory):
+    # modul pri importu stvara logs/ i data/*_new u trenutnom direktoriju — to ide u tmp, jednom
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("import"))
+    try:
+        return importlib.import_module("first_download_all_fonts")
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def fd(fd_module, tmp_path, monkeypatch):
+    """Modul s putanjama preusmjerenima u tmp_path ovog testa."""
+    for name, value in {
+        "BASE_DIR": "all_fonts_new",
+        "ACTIVE_BASE": "all_fonts",
+        "DOWNLOAD_DIR": "downloads",
+        "GOOGLE_FONTS_ZIP": "downloads/google-fonts.zip",
+        "GOOGLE_FONTS_CRC": "downloads/google-fonts.crc.json",
+    }.items():
+        monkeypatch.setattr(fd_module, name, str(tmp_path / value))
+    os.makedirs(fd_module.BASE_DIR)
+    return fd_module
+
+
+def make_zip(members):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, data in members.items():
+            z.writestr(name, data)
+    return buf.getvalue()
+
+
+FONT_ZIP = {
+    "fonts-main/ofl/foo/Foo-Regular.ttf": b"ttf bytes",
+    "fonts-main/ofl/foo/Foo.woff2": b"woff2 bytes",
+    "fonts-main/ofl/foo/METADATA.pb": b'license: "OFL"',
+    "fonts-main/ofl/foo/README.md": b"not a font",
+    "fonts-main/ofl/foo/static/Foo-Bold.otf": b"otf bytes",
+    "other/Bar.ttf": b"outside top_dir",
+}
+
+
+def make_handler(requests_seen, drop_after=None, etag=ETAG, data=DATA):
+    """Poslužuje `data` s Range/If-Range/If-None-Match; `drop_after` prekida prvi odgovor nakon N bajtova."""
+    state = {"drop_after": drop_after}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            requests_seen.append(dict(self.headers))
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            start = 0
+            rng = self.headers.get("Range")
+            if rng and self.headers.get("If-Range", etag) == etag:
+                start = int(rng.split("=")[1].rstrip("-"))
+                if start >= len(data):
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{len(data)}")
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+            else:
+                self.send_response(200)
+            body = data[start:]
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if state["drop_after"] is not None:
+                self.wfile.write(body[:state["drop_after"]])
+                self.wfile.flush()
+                state["drop_after"] = None
+                self.close_connection = True
+                return
+            self.wfile.write(body)
+
+    return Handler
+
+
+def write_part(fd, dest, data, validator=ETAG):
+    with open(dest + ".part", "wb") as f:
+        f.write(data)
+    fd._write_json(dest + ".part.meta.json", {"validator": validator})
+
+
+def test_download_then_revalidate(fd, stub_server, tmp_path):
+    seen = []
+    url = stub_server(make_handler(seen))
+    dest = str(tmp_path / "fonts.zip")
+
+    fd.stream_download(url, dest, chunk_size=1024)
+    assert open(dest, "rb").read() == DATA
+    assert json.load(open(dest + ".meta.json"))["etag"] == ETAG
+    assert not os.path.exists(dest + ".part.meta.json")
+
+    fd.stream_download(url, dest, chunk_size=1024)
+    assert seen[-1]["If-None-Match"] == ETAG
+    assert open(dest, "rb").read() == DATA
+
+
+def test_retry_resumes_after_dropped_connection(fd, stub_server, tmp_path):
+    seen = []
+    url = stub_server(make_handler(seen, drop_after=3000))
+    dest = str(tmp_path / "fonts.zip")
+
+    with pytest.raises(Exception):
+        fd.stream_download(url, dest, chunk_size=512)
+    partial = os.path.getsize(dest + ".part")
+    assert 0 < partial < len(DATA)
+
+    fd.stream_download(url, dest, chunk_size=512)
+    assert seen[-1]["Range"] == f"bytes={partial}-"
+    assert seen[-1]["If-Range"] == ETAG
+    assert open(dest, "rb").read() == DATA
+
+
+def test_changed_file_restarts_from_zero(fd, stub_server, tmp_path):
+    seen = []
+    url = stub_server(make_handler(seen))
+    dest = str(tmp_path / "fonts.zip")
+    write_part(fd, dest, b"stale bytes", validator='"old"')
+
+    fd.stream_download(url, dest, chunk_size=1024)
+    assert seen[-1]["If-Range"] == '"old"'
+    assert open(dest, "rb").read() == DATA
+
+
+def test_416_with_complete_part_finishes(fd, stub_server, tmp_path):
+    seen = []
+    url = stub_server(make_handler(seen))
+    dest = str(tmp_path / "fonts.zip")
+    write_part(fd, dest, DATA)
+
+    fd.stream_download(url, dest, chunk_size=1024)
+    assert len(seen) == 1
+    assert open(dest, "rb").read() == DATA
+    assert json.load(open(dest + ".meta.json"))["etag"] == ETAG
+    assert not os.path.exists(dest + ".part")
+
+
+def test_416_with_oversized_part_restarts(fd, stub_server, tmp_path):
+    seen = []
+    url = stub_server(make_handler(seen))
+    dest = str(tmp_path / "fonts.zip")
+    write_part(fd, dest, DATA + b"garbage")
+
+    fd.stream_download(url, dest, chunk_size=1024)
+    assert len(seen) == 2
+    assert "Range" not in seen[-1]
+    assert open(dest, "rb").read() == DATA
+
+
+def extracted_files(root):
+    return sorted(os.path.relpath(os.path.join(d, f), root) for d, _, files in os.walk(root) for f in files)
+
+
+def test_extract_keeps_only_fonts_and_metadata(fd, tmp_path):
+    zip_path = tmp_path / "fonts.zip"
+    zip_path.write_bytes(make_zip(FONT_ZIP))
+    out = tmp_path / "out"
+
+    crc = fd.extract_fonts_from_zip(str(zip_path), str(out), "fonts-main")
+    assert extracted_files(out) == ["ofl/foo/Foo-Regular.ttf", "ofl/foo/Foo.woff2", "ofl/foo/METADATA.pb",
+                                    "ofl/foo/static/Foo-Bold.otf"]
+    assert (out / "ofl/foo/Foo-Regular.ttf").read_bytes() == b"ttf bytes"
+    assert set(crc) == {"fonts-main/" + rel for rel in extracted_files(out)}
+
+
+def test_extract_rejects_unsafe_paths(fd, tmp_path):
+    zip_path = tmp_path / "fonts.zip"
+    zip_path.write_bytes(make_zip({"fonts-main/ok/A.ttf": b"a", "fonts-main/../evil.ttf": b"x",
+                                   "fonts-main/ok/../../evil2.ttf": b"y"}))
+    out = tmp_path / "out"
+
+    fd.extract_fonts_from_zip(str(zip_path), str(out), "fonts-main")
+    assert extracted_files(out) == ["ok/A.ttf"]
+    assert not (tmp_path / "evil.ttf").exists()
+    assert not (tmp_path / "evil2.ttf").exists()
+
+
+def test_download_google_fonts_reuses_unchanged_members(fd, stub_server, tmp_path):
+    seen = []
+    url = stub_server(make_handler(seen, data=make_zip(FONT_ZIP)))
+    target = tmp_path / "all_fonts_new" / "google-fonts"
+
+    fd.download_google_fonts(url)
+    assert extracted_files(target) == ["ofl/foo/Foo-Regular.ttf", "ofl/foo/Foo.woff2", "ofl/foo/METADATA.pb",
+                                       "ofl/foo/static/Foo-Bold.otf"]
+    inode = os.stat(target / "ofl/foo/Foo-Regular.ttf").st_ino
+
+    # nepromijenjena arhiva: 304, a članovi s istim CRC-om se hardlinkaju umjesto ekstrakcije
+    fd.download_google_fonts(url)
+    assert seen[-1]["If-None-Match"] == ETAG
+    assert os.stat(target / "ofl/foo/Foo-Regular.ttf").st_ino == inode
+
+    # promijenjen član (novi ETag, drugi CRC) se ponovno ekstrahira, ostali se i dalje preuzimaju
+    changed = dict(FONT_ZIP, **{"fonts-main/ofl/foo/Foo-Regular.ttf": b"new ttf bytes"})
+    url = stub_server(make_handler(seen, etag='"v2"', data=make_zip(changed)))
+    fd.download_google_fonts(url)
+    assert (target / "ofl/foo/Foo-Regular.ttf").read_bytes() == b"new ttf bytes"
+    assert os.stat(target / "ofl/foo/Foo-Regular.ttf").st_ino != inode
+    assert (target / "ofl/foo/Foo.woff2").read_bytes() == b"woff2 bytes"
@@ -0,0 +1,105 @@
+import io
+import json
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+from PIL import Image, ImageDraw
+
+import whatfontis_client as wfi
+
+RESULTS = [{"title": "Roboto Regular", "url": "https://example.com/roboto"}]
+PARAMS = {"API_KEY": "secret", "NOTTEXTBOXSDETECTION": 1, "limit": 5}
+
+
+@pytest.fixture(autouse=True)
+def fast_client(tmp_path, monkeypatch):
+    monkeypatch.setattr(wfi, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(wfi, "BACKOFF_BASE", 0.0)
+
+
+def make_handler(statuses, seen, body=RESULTS):
+    """Redom vraća statuse iz `statuses` (zadnji se ponavlja); 200 nosi `body` kao JSON."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            seen.append(self.rfile.read(length))
+            status = statuses[min(len(seen), len(statuses)) - 1]
+            payload = json.dumps(body if status == 200 else {"error": status}).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return Handler
+
+
+def sample_png(text="Quiz"):
+    img = Image.new("RGB", (160, 48), "white")
+    ImageDraw.Draw(img).text((8, 12), text, fill="black")
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_retries_5xx_then_succeeds(stub_server):
+    seen = []
+    url = stub_server(make_handler([503, 502, 200], seen))
+    before = wfi.metrics()
+
+    assert wfi.identify_font(sample_png(), PARAMS, url=url) == RESULTS
+    after = wfi.metrics()
+    assert len(seen) == 3
+    assert after["retries"] - before["retries"] == 2
+    assert after["errors"] == before["errors"]
+
+
+def test_4xx_is_not_retried(stub_server):
+    seen = []
+    url = stub_server(make_handler([400], seen))
+
+    with pytest.raises(wfi.WhatFontIsError) as exc:
+        wfi.identify_font(sample_png(), PARAMS, url=url)
+    assert exc.value.status == 400
+    assert len(seen) == 1
+
+
+def test_gives_up_after_max_retries(stub_server):
+    seen = []
+    url = stub_server(make_handler([500], seen))
+    before = wfi.metrics()
+
+    with pytest.raises(wfi.WhatFontIsError) as exc:
+        wfi.identify_font(sample_png(), PARAMS, url=url)
+    assert exc.value.status == 500
+    assert len(seen) == wfi.MAX_RETRIES + 1
+    assert wfi.metrics()["errors"] - before["errors"] == 1
+
+
+def test_repeated_image_is_served_from_cache(stub_server):
+    seen = []
+    url = stub_server(make_handler([200], seen))
+    before = wfi.metrics()
+
+    first = wfi.identify_font(sample_png(), PARAMS, url=url)
+    # isti sadržaj, drugi API ključ → isti zapis u cacheu, bez novog poziva
+    second = wfi.identify_font(sample_png(), dict(PARAMS, API_KEY="other"), url=url)
+    assert first == second == RESULTS
+    assert len(seen) == 1
+    assert wfi.metrics()["hits"] - before["hits"] == 1
+
+    wfi.identify_font(sample_png(), dict(PARAMS, limit=10), url=url)
+    assert len(seen) == 2
+
+
+def test_empty_results_are_not_cached(stub_server):
+    seen = []
+    url = stub_server(make_handler([200], seen, body=[]))
+
+    assert wfi.identify_font(sample_png(), PARAMS, url=url) == []
+    assert wfi.identify_font(sample_png(), PARAMS, url=url) == []
+    assert len(seen) == 2
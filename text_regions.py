@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+text_regions.py — detekcija više regija teksta (redaka/blokova) u jednoj slici.
+
+Povezane komponente (slova) s binarne slike iz image_prep.threshold_text
+grupiraju se u retke po vertikalnom preklapanju i razmaku razmjernom vlastitoj
+visini slova, a po želji i retci u blokove. Naslov i tekst ispod njega tako
+dobivaju svaki svoj odgovor umjesto jednog "pomiješanog".
+
+match_regions() sve izreze šalje u JEDAN batched embedding + vektoriziranu
+pretragu (match_engine.search_batch), pa N regija košta otprilike kao jedna slika.
+"""
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from image_prep import threshold_text, text_components
+
+# ----------------------------
+# KONFIG
+# ----------------------------
+MAX_REGIONS = 8
+MIN_REGION_HEIGHT = 8     # px
+MIN_REGION_AREA_FRAC = 0.002
+REGION_PADDING = 6        # px
+MAX_COMPONENTS = 2000     # grupiranje je O(n²) — šum na fotografijama se odreže
+LINE_GAP_FACTOR = 1.2     # horizontalni razmak (× visina slova) koji još spaja slova u redak
+BLOCK_GAP_FACTOR = 0.8    # vertikalni razmak (× visina retka) za mode="block"
+
+
+def _union_find(n, pairs):
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for a, b in pairs:
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[rb] = ra
+    groups = {}
+    for i in range(n):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+
+def _group_boxes(boxes, groups):
+    return np.array([[boxes[g, 0].min(), boxes[g, 1].min(), boxes[g, 2].max(), boxes[g, 3].max()]
+                     for g in groups])
+
+
+def _line_pairs(b):
+    """Parovi slova u istom retku: dovoljno vertikalnog preklapanja i mali horizontalni razmak."""
+    h = b[:, 3] - b[:, 1]
+    overlap = np.minimum(b[:, None, 3], b[None, :, 3]) - np.maximum(b[:, None, 1], b[None, :, 1])
+    min_h = np.minimum(h[:, None], h[None, :])
+    max_h = np.maximum(h[:, None], h[None, :])
+    gap = np.maximum(b[:, None, 0], b[None, :, 0]) - np.minimum(b[:, None, 2], b[None, :, 2])
+    ok = (overlap >= 0.5 * min_h) & (gap <= LINE_GAP_FACTOR * max_h) & (min_h >= 0.4 * max_h)
+    return zip(*np.nonzero(np.triu(ok, 1)))
+
+
+def _block_pairs(b):
+    """Parovi redaka iste veličine slova koji su jedan ispod drugog (blok teksta)."""
+    h = b[:, 3] - b[:, 1]
+    min_h = np.minimum(h[:, None], h[None, :])
+    max_h = np.maximum(h[:, None], h[None, :])
+    vgap = np.maximum(b[:, None, 1], b[None, :, 1]) - np.minimum(b[:, None, 3], b[None, :, 3])
+    hoverlap = np.minimum(b[:, None, 2], b[None, :, 2]) - np.maximum(b[:, None, 0], b[None, :, 0])
+    ok = (vgap <= BLOCK_GAP_FACTOR * max_h) & (hoverlap > 0) & (min_h >= 0.7 * max_h)
+    return zip(*np.nonzero(np.triu(ok, 1)))
+
+
+def detect_regions(image, mode="line", max_regions=MAX_REGIONS):
+    """
+    Vrati listu bboxova (x0, y0, x1, y1), od vrha prema dnu. Slova se u retke
+    grupiraju prema vlastitoj visini (naslov i sitni tekst imaju različite
+    pragove); mode="block" dodatno spaja susjedne retke iste veličine slova.
+    """
+    processed = threshold_text(image)
+    comps = text_components(processed)
+    h, w = processed.shape[:2]
+    if len(comps) == 0:
+        return []
+    if len(comps) > MAX_COMPONENTS:
+        comps = comps[np.argsort(-comps[:, cv2.CC_STAT_AREA])[:MAX_COMPONENTS]]
+
+    x, y = comps[:, cv2.CC_STAT_LEFT], comps[:, cv2.CC_STAT_TOP]
+    boxes = np.stack([x, y, x + comps[:, cv2.CC_STAT_WIDTH], y + comps[:, cv2.CC_STAT_HEIGHT]], axis=1)
+    boxes = _group_boxes(boxes, _union_find(len(boxes), _line_pairs(boxes)))
+    if mode == "block":
+        boxes = _group_boxes(boxes, _union_find(len(boxes), _block_pairs(boxes)))
+
+    min_area = MIN_REGION_AREA_FRAC * h * w
+    keep = []
+    for x0, y0, x1, y1 in boxes:
+        if y1 - y0 < MIN_REGION_HEIGHT or (x1 - x0) * (y1 - y0) < min_area:
+            continue
+        keep.append((max(0, x0 - REGION_PADDING), max(0, y0 - REGION_PADDING),
+                     min(w, x1 + REGION_PADDING), min(h, y1 + REGION_PADDING)))
+    # najveće regije imaju prednost, a prikaz ide odozgo prema dolje
+    keep.sort(key=lambda b: (b[2] - b[0]) * (b[3] - b[1]), reverse=True)
+    keep = keep[:max_regions]
+    keep.sort(key=lambda b: (b[1], b[0]))
+    return [tuple(int(v) for v in b) for b in keep]
+
+
+def crop_regions(image, boxes):
+    if not isinstance(image, Image.Image):
+        image = Image.fromarray(np.asarray(image))
+    return [image.crop(b) for b in boxes]
+
+
+def draw_regions(image, boxes):
+    """Kopija slike s numeriranim okvirima regija (za prikaz u UI)."""
+    canvas = np.array(image.convert("RGB") if isinstance(image, Image.Image) else image).copy()
+    thickness = max(2, canvas.shape[1] // 400)
+    for i, (x0, y0, x1, y1) in enumerate(boxes, 1):
+        cv2.rectangle(canvas, (x0, y0), (x1, y1), (230, 40, 40), thickness)
+        cv2.putText(canvas, str(i), (x0 + 4, max(16, y0 - 4)), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.6 * thickness, (230, 40, 40), thickness)
+    return canvas
+
+
+def match_regions(image, engine="vision", top_n=5, mode="line", timings=None):
+    """
+    [{"region": i, "bbox": (x0, y0, x1, y1), "results": [...]}] — svi izrezi idu
+    u jedan search_batch poziv. Ako regija nema, cijela slika je jedna regija.
+    """
+    from match_engine import search_batch
+
+    boxes = detect_regions(image, mode=mode)
+    if not boxes:
+        w, h = image.size
+        boxes = [(0, 0, w, h)]
+    crops = crop_regions(image, boxes)
+    all_results = search_batch(crops, engine=engine, top_n=top_n, timings=timings)
+    return [{"region": i, "bbox": box, "results": results}
+            for i, (box, results) in enumerate(zip(boxes, all_results), 1)]
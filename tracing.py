@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+tracing.py — lagani spanovi i metrike za tok prepoznavanja fontova.
+
+    with tracing.trace("upload") as t:      # jedan upit
+        with tracing.span("decode"):
+            ...
+    t.breakdown()   # [{"span", "count", "ms", "share"}] — za debug panel
+
+Svaki span:
+  • logira se kao strukturirani redak (logging DEBUG; sažetak tracea na INFO)
+  • ulazi u procesni histogram fontmatch_span_seconds{span=...}
+  • dodaje se aktivnom traceu (contextvars; za threadove vidi bind())
+
+write_metrics() sprema Prometheus text format (za node_exporter textfile
+collector) u data/metrics/fontmatch.prom, a `python3 tracing.py serve`
+izlaže tu datoteku na http://<host>:9108/metrics.
+"""
+
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# ----------------------------
+# KONFIG
+# ----------------------------
+METRICS_FILE = "data/metrics/fontmatch.prom"
+METRICS_PREFIX = "fontmatch"
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+log = logging.getLogger("fontmatch.trace")
+_current = contextvars.ContextVar("fontmatch_trace", default=None)
+_lock = threading.Lock()
+_histograms = {}   # span → [bucket counts..., +Inf], sum
+_counters = {}     # (metrika, labela) → vrijednost
+
+
+class Trace:
+    """Spanovi jednog upita (thread-safe, spanovi mogu dolaziti iz više threadova)."""
+
+    def __init__(self, name):
+        self.name = name
+        self.spans = []
+        self.started = time.perf_counter()
+        self.seconds = None
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, attrs):
+        with self._lock:
+            self.spans.append({"span": name, "seconds": seconds, **attrs})
+
+    def breakdown(self):
+        """Zbroj po imenu spana, sortirano po trajanju; `share` je udio u trajanju tracea."""
+        total = self.seconds if self.seconds is not None else time.perf_counter() - self.started
+        agg = {}
+        with self._lock:
+            for s in self.spans:
+                count, secs = agg.get(s["span"], (0, 0.0))
+                agg[s["span"]] = (count + 1, secs + s["seconds"])
+        rows = [{"span": name, "count": count, "ms": round(secs * 1000, 2),
+                 "share": round(secs / total, 3) if total else 0.0}
+                for name, (count, secs) in agg.items()]
+        return sorted(rows, key=lambda r: r["ms"], reverse=True)
+
+
+def _observe(name, seconds, error):
+    with _lock:
+        hist = _histograms.get(name)
+        if hist is None:
+            hist = _histograms[name] = [[0] * (len(BUCKETS) + 1), 0.0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                hist[0][i] += 1
+        hist[0][-1] += 1
+        hist[1] += seconds
+        if error:
+            key = ("span_errors_total", name)
+            _counters[key] = _counters.get(key, 0) + 1
+
+
+def inc(metric, label, n=1):
+    """Brojač `fontmatch_<metric>{name="<label>"}` (npr. cache pogoci)."""
+    with _lock:
+        _counters[(metric, label)] = _counters.get((metric, label), 0) + n
+
+
+def record(name, seconds, **attrs):
+    """Zabilježi već izmjereno trajanje kao span."""
+    _observe(name, seconds, False)
+    trace_obj = _current.get()
+    if trace_obj is not None:
+        trace_obj.add(name, seconds, attrs)
+    log.debug(f"span {name} {seconds * 1000:.1f}ms {attrs}", extra={"span": name, "ms": round(seconds * 1000, 3)})
+
+
+@contextmanager
+def span(name, **attrs):
+    t0 = time.perf_counter()
+    error = False
+    try:
+        yield attrs  # pozivatelj može dopuniti atribute (npr. attrs["cached"] = True)
+    except BaseException:
+        error = True
+        raise
+    finally:
+        seconds = time.perf_counter() - t0
+        _observe(name, seconds, error)
+        trace_obj = _current.get()
+        if trace_obj is not None:
+            trace_obj.add(name, seconds, {**attrs, "error": error} if error else attrs)
+        log.debug(f"span {name} {seconds * 1000:.1f}ms {attrs}",
+                  extra={"span": name, "ms": round(seconds * 1000, 3), "error": error})
+
+
+@contextmanager
+def trace(name):
+    """Skupljaj spanove jednog upita; na kraju logira sažetak i broji upit."""
+    trace_obj = Trace(name)
+    token = _current.set(trace_obj)
+    try:
+        yield trace_obj
+    finally:
+        _current.reset(token)
+        trace_obj.seconds = time.perf_counter() - trace_obj.started
+        inc("traces_total", name)
+        _observe(f"trace:{name}", trace_obj.seconds, False)
+        parts = ", ".join(f"{r['span']}={r['ms']}ms" for r in trace_obj.breakdown())
+        log.info(f"⏱️ {name} {trace_obj.seconds * 1000:.1f}ms [{parts}]")
+
+
+def current_trace():
+    return _current.get()
+
+
+def bind(fn):
+    """Omotaj funkciju za ThreadPoolExecutor tako da njeni spanovi idu u trenutni trace."""
+    trace_obj = _current.get()
+
+    def wrapper(*args, **kwargs):
+        token = _current.set(trace_obj)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+
+    return wrapper
+
+
+# ----------------------------
+# PROMETHEUS
+# ----------------------------
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_metrics():
+    """Sve metrike procesa u Prometheus text formatu (0.0.4)."""
+    p = METRICS_PREFIX
+    lines = [f"# HELP {p}_span_seconds Trajanje faza prepoznavanja fontova.",
+             f"# TYPE {p}_span_seconds histogram"]
+    with _lock:
+        hists = {k: (list(v[0]), v[1]) for k, v in _histograms.items()}
+        counters = dict(_counters)
+    for name in sorted(hists):
+        buckets, total = hists[name]
+        lbl = _label(name)
+        for bound, count in zip(BUCKETS, buckets):
+            lines.append(f'{p}_span_seconds_bucket{{span="{lbl}",le="{bound}"}} {count}')
+        lines.append(f'{p}_span_seconds_bucket{{span="{lbl}",le="+Inf"}} {buckets[-1]}')
+        lines.append(f'{p}_span_seconds_sum{{span="{lbl}"}} {total:.6f}')
+        lines.append(f'{p}_span_seconds_count{{span="{lbl}"}} {buckets[-1]}')
+    for metric in sorted({m for m, _ in counters}):
+        lines.append(f"# TYPE {p}_{metric} counter")
+        for (m, label), value in sorted(counters.items()):
+            if m == metric:
+                key = "span" if metric == "span_errors_total" else "name"
+                lines.append(f'{p}_{metric}{{{key}="{_label(label)}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path=METRICS_FILE):
+    """Atomarno zapiši metrike (textfile collector nikad ne vidi pola datoteke)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render_metrics())
+    os.replace(tmp_path, path)
+
+
+def serve(port=9108, path=METRICS_FILE):
+    """Minimalni /metrics endpoint koji poslužuje zadnju zapisanu datoteku."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            try:
+                with open(path, "rb") as f:
+                    body = f.read()
+            except OSError:
+                body = b""
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    logging.info(f"📈 Serving {path} on :{port}/metrics")
+    ThreadingHTTPServer(("0.0.0.0", port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Prometheus endpoint for fontmatch metrics")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_serve = sub.add_parser("serve")
+    p_serve.add_argument("--port", type=int, default=9108)
+    p_serve.add_argument("--file", default=METRICS_FILE)
+    args = parser.parse_args()
+    serve(args.port, args.file)
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+vector_index.py — zamjenjivi indeks nad data/visual_embeddings.npy.
+
+Backendi:
+  • "exact" — brute-force kosinus (matrix @ q) + argpartition umjesto punog argsorta
+  • "ivf"   — inverted file (sferni k-means) u čistom NumPyju; `nprobe` je
+              preklopnik recall ↔ latencija
+  • "hnsw"  — hnswlib graf (opcionalno, samo ako je paket instaliran); `ef` je preklopnik
+
+Svi backendi imaju isto sučelje: search(queries, k, mask=None) → (ids, scores),
+gdje su ids retci u visual_embeddings.npy / visual_index.json. `mask` je bool
+niz po retku (npr. font_meta.candidate_mask) i primjenjuje se prije top-k;
+praznine se pune s id -1.
+
+Offline build i recall@k izvještaj:
+    python3 vector_index.py build --backend ivf --nlist 1024
+    python3 vector_index.py report --k 10 --nprobe 1 4 8 16 32
+"""
+
+import os
+import json
+import shutil
+import time
+import logging
+import threading
+import numpy as np
+from embedding_store import EmbeddingStore, open_embeddings, file_stamp, file_sha256, STORE_DIR
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+# ----------------------------
+# KONFIG
+# ----------------------------
+EMBEDDINGS_FILE = "data/visual_embeddings.npy"
+INDEX_JSON = "data/visual_index.json"
+IVF_DIR = "data/visual_ivf"
+HNSW_FILE = "data/visual_hnsw.bin"
+DEFAULT_BACKEND = "ivf"
+DEFAULT_NPROBE = 16
+DEFAULT_EF = 64
+KMEANS_ITERS = 12
+KMEANS_SAMPLE_PER_LIST = 64
+
+
+def normalize_rows(x):
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+def _topk(scores, k):
+    """Indeksi k najvećih vrijednosti, silazno sortirani (O(n) argpartition + sort k)."""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def _as_batch(queries):
+    q = normalize_rows(queries)
+    return (q[None, :], True) if q.ndim == 1 else (q, False)
+
+
+class ExactIndex:
+    """Točna pretraga: jedan (blokovski) matmul nad cijelim, po potrebi mapiranim, spremnikom."""
+
+    backend = "exact"
+
+    def __init__(self, matrix):
+        self.store = matrix if isinstance(matrix, EmbeddingStore) else EmbeddingStore.from_array(matrix)
+
+    def __len__(self):
+        return len(self.store)
+
+    def search(self, queries, k=10, mask=None):
+        q, single = _as_batch(queries)
+        if mask is not None:
+            allowed = np.flatnonzero(mask)
+            # rijetka maska: skeniraj samo dopuštene retke umjesto cijelog spremnika
+            sims = q @ self.store.rows(allowed).T if allowed.size < 0.25 * len(self) else \
+                self.store.scores(q)[:, allowed]
+            top = np.stack([_topk(row, k) for row in sims])
+            ids = np.full((q.shape[0], k), -1, dtype=np.int64)
+            scores = np.full((q.shape[0], k), -np.inf, dtype=np.float32)
+            ids[:, :top.shape[1]] = allowed[top]
+            scores[:, :top.shape[1]] = np.take_along_axis(sims, top, axis=1)
+        else:
+            sims = self.store.scores(q)
+            ids = np.stack([_topk(row, k) for row in sims])
+            scores = np.take_along_axis(sims, ids, axis=1)
+        return (ids[0], scores[0]) if single else (ids, scores)
+
+
+class IVFIndex:
+    """
+    Inverted file: retci su presloženi po listama (centroidima) tako da je svaka
+    lista kontinuirani odsječak matrice. Upit skenira samo `nprobe` najbližih lista.
+    """
+
+    backend = "ivf"
+
+    def __init__(self, centroids, matrix, ids, offsets, nprobe=DEFAULT_NPROBE, source_sha256=None):
+        self.source_sha256 = source_sha256                   # sha256 embeddinga iz kojih je izgrađen
+        self.centroids = centroids.astype(np.float32, copy=False)
+        self.matrix = matrix.astype(np.float32, copy=False)  # presloženo po listama
+        self.ids = ids.astype(np.int64, copy=False)          # red u presloženoj → originalni red
+        self.offsets = offsets.astype(np.int64, copy=False)  # nlist + 1
+        self.nprobe = nprobe
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    @property
+    def nlist(self):
+        return self.centroids.shape[0]
+
+    @classmethod
+    def train(cls, matrix, nlist=None, iters=KMEANS_ITERS, seed=0, nprobe=DEFAULT_NPROBE):
+        x = normalize_rows(matrix)
+        n = x.shape[0]
+        if nlist is None:
+            nlist = max(1, int(4 * np.sqrt(n)))
+        nlist = min(nlist, n)
+        rng = np.random.default_rng(seed)
+
+        sample_n = min(n, nlist * KMEANS_SAMPLE_PER_LIST)
+        sample = x[rng.choice(n, sample_n, replace=False)]
+        centroids = sample[rng.choice(sample_n, nlist, replace=False)].copy()
+        for _ in range(iters):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=nlist)
+            empty = counts == 0
+            if empty.any():
+                # prazne liste ponovno posij nasumičnim točkama
+                sums[empty] = sample[rng.choice(sample_n, int(empty.sum()), replace=False)]
+            centroids = normalize_rows(sums)
+
+        assign = np.empty(n, dtype=np.int64)
+        for start in range(0, n, 8192):
+            assign[start:start + 8192] = np.argmax(x[start:start + 8192] @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))])
+        return cls(centroids, x[order], order, offsets, nprobe=nprobe)
+
+    def search(self, queries, k=10, nprobe=None, mask=None):
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        q, single = _as_batch(queries)
+        coarse = q @ self.centroids.T
+        out_ids = np.full((q.shape[0], k), -1, dtype=np.int64)
+        out_scores = np.full((q.shape[0], k), -np.inf, dtype=np.float32)
+        allowed = None  # dopušteni retci u presloženoj matrici, računa se samo kad zatreba
+        for qi in range(q.shape[0]):
+            lists = _topk(coarse[qi], nprobe)
+            rows = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in lists])
+            if mask is not None:
+                rows = rows[mask[self.ids[rows]]]
+                if rows.size < k:
+                    # maska je ispraznila probane liste — točna pretraga nad svim dopuštenim retcima
+                    if allowed is None:
+                        allowed = np.flatnonzero(mask[self.ids])
+                    if allowed.size > rows.size:
+                        rows = allowed
+            if rows.size == 0:
+                continue
+            sims = self.matrix[rows] @ q[qi]
+            top = _topk(sims, k)
+            out_ids[qi, :top.size] = self.ids[rows[top]]
+            out_scores[qi, :top.size] = sims[top]
+        return (out_ids[0], out_scores[0]) if single else (out_ids, out_scores)
+
+    def save(self, path=IVF_DIR):
+        """Svaki niz u svoj .npy (npz se ne može mapirati); direktorij se mijenja atomski."""
+        tmp_dir = path + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name in ("centroids", "matrix", "ids", "offsets"):
+            np.save(os.path.join(tmp_dir, name + ".npy"), getattr(self, name))
+        with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"rows": len(self), "source_sha256": self.source_sha256}, f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp_dir, path)
+
+    @classmethod
+    def load(cls, path=IVF_DIR, nprobe=DEFAULT_NPROBE, mmap=True):
+        arrays = {
+            name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r" if mmap else None)
+            for name in ("centroids", "matrix", "ids", "offsets")
+        }
+        meta = _read_meta(os.path.join(path, "meta.json"))
+        return cls(nprobe=nprobe, source_sha256=meta.get("source_sha256"), **arrays)
+
+
+class HNSWIndex:
+    """hnswlib graf (inner product nad normaliziranim vektorima). Traži `pip install hnswlib`."""
+
+    backend = "hnsw"
+
+    def __init__(self, graph, ef=DEFAULT_EF, source_sha256=None):
+        self.source_sha256 = source_sha256
+        self.graph = graph
+        self.graph.set_ef(ef)
+
+    def __len__(self):
+        return self.graph.get_current_count()
+
+    @classmethod
+    def train(cls, matrix, M=32, ef_construction=200, ef=DEFAULT_EF):
+        if hnswlib is None:
+            raise RuntimeError("hnswlib nije instaliran (pip install hnswlib)")
+        x = normalize_rows(matrix)
+        graph = hnswlib.Index(space="ip", dim=x.shape[1])
+        graph.init_index(max_elements=x.shape[0], M=M, ef_construction=ef_construction)
+        graph.add_items(x, np.arange(x.shape[0]))
+        return cls(graph, ef=ef)
+
+    def set_ef(self, ef):
+        self.graph.set_ef(ef)
+
+    def search(self, queries, k=10, mask=None):
+        q, single = _as_batch(queries)
+        k = min(k, len(self) if mask is None else int(np.count_nonzero(mask)))
+        if k == 0:
+            ids, scores = np.full((q.shape[0], 0), -1, dtype=np.int64), np.zeros((q.shape[0], 0), np.float32)
+            return (ids[0], scores[0]) if single else (ids, scores)
+        kwargs = {} if mask is None else {"filter": lambda label: bool(mask[label])}
+        labels, dists = self.graph.knn_query(q, k=k, **kwargs)
+        ids, scores = labels.astype(np.int64), (1.0 - dists).astype(np.float32)
+        return (ids[0], scores[0]) if single else (ids, scores)
+
+    def save(self, path=HNSW_FILE):
+        self.graph.save_index(path)
+        with open(path + ".json", "w", encoding="utf-8") as f:
+            json.dump({"rows": len(self), "source_sha256": self.source_sha256}, f)
+
+    @classmethod
+    def load(cls, path, dim, ef=DEFAULT_EF):
+        if hnswlib is None:
+            raise RuntimeError("hnswlib nije instaliran (pip install hnswlib)")
+        graph = hnswlib.Index(space="ip", dim=dim)
+        graph.load_index(path)
+        return cls(graph, ef=ef, source_sha256=_read_meta(path + ".json").get("source_sha256"))
+
+
+def _read_meta(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# ----------------------------
+# PROCESNI LOADER
+# ----------------------------
+_lock = threading.Lock()
+_loaded = {}
+
+
+def _index_stamp(embeddings_file):
+    return file_stamp(embeddings_file, os.path.join(STORE_DIR, "meta.json"),
+                      os.path.join(IVF_DIR, "meta.json"), HNSW_FILE)
+
+
+def get_visual_index(backend=DEFAULT_BACKEND, embeddings_file=EMBEDDINGS_FILE, nprobe=DEFAULT_NPROBE):
+    """
+    Vrati indeks za visual_embeddings.npy. Učitava se jednom po procesu i ponovno
+    kad ingest zamijeni embeddinge, store ili ANN datoteke (mtime/veličina).
+    Exact backend čita mapirani embedding_store (float32/float16/int8). Ako ANN
+    datoteka ne postoji, ne odgovara broju redaka ili je izgrađena iz drugih
+    embeddinga (source_sha256), vraća se na exact backend.
+    """
+    key = (backend, embeddings_file)
+    stamp = _index_stamp(embeddings_file)
+    with _lock:
+        cached = _loaded.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        matrix = open_embeddings(fallback_npy=embeddings_file)
+        index = None
+        try:
+            if backend == "ivf" and os.path.exists(IVF_DIR):
+                index = IVFIndex.load(IVF_DIR, nprobe=nprobe)
+            elif backend == "hnsw" and os.path.exists(HNSW_FILE):
+                index = HNSWIndex.load(HNSW_FILE, dim=matrix.shape[1])
+        except Exception as e:
+            logging.warning(f"⚠️ Ne mogu učitati {backend} indeks: {e}")
+            index = None
+        if index is not None and len(index) != matrix.shape[0]:
+            logging.warning(f"⚠️ {backend} indeks ima {len(index)} redaka, embeddingi {matrix.shape[0]} — koristim exact")
+            index = None
+        if index is not None:
+            source = file_sha256(embeddings_file) if os.path.exists(embeddings_file) \
+                else matrix.meta.get("source_sha256")
+            if index.source_sha256 != source:
+                logging.warning(f"⚠️ {backend} indeks je izgrađen iz drugih embeddinga — koristim exact "
+                                f"(python3 vector_index.py build --backend {backend})")
+                index = None
+        if index is None:
+            index = ExactIndex(matrix)
+        _loaded[key] = (stamp, index)
+        return index
+
+
+def build_index(backend=DEFAULT_BACKEND, embeddings_file=EMBEDDINGS_FILE, out=None, **kwargs):
+    """Offline build ANN indeksa pokraj visual_index.json (ili u `out`, npr. staging putanju)."""
+    matrix = np.load(embeddings_file)
+    t0 = time.perf_counter()
+    if backend == "ivf":
+        index = IVFIndex.train(matrix, **kwargs)
+        out = out or IVF_DIR
+    elif backend == "hnsw":
+        index = HNSWIndex.train(matrix, **kwargs)
+        out = out or HNSW_FILE
+    else:
+        raise ValueError(f"Nepoznat backend: {backend}")
+    index.source_sha256 = file_sha256(embeddings_file)
+    index.save(out)
+    logging.info(f"✅ {backend} index over {matrix.shape[0]} rows saved to {out} ({time.perf_counter() - t0:.1f}s)")
+    with _lock:
+        _loaded.pop((backend, embeddings_file), None)
+    return index
+
+
+def refresh_indexes(embeddings_file=EMBEDDINGS_FILE, ivf_dir=IVF_DIR, hnsw_file=HNSW_FILE):
+    """
+    Ponovno izgradi svaki ANN indeks koji postoji u aktivnoj generaciji (IVF_DIR,
+    HNSW_FILE) nad novim embeddinzima; ingest ih zapisuje u staging putanje.
+    """
+    if os.path.exists(IVF_DIR):
+        nlist = len(np.load(os.path.join(IVF_DIR, "centroids.npy"), mmap_mode="r"))
+        build_index("ivf", embeddings_file, out=ivf_dir, nlist=nlist)
+    if os.path.exists(HNSW_FILE) and hnswlib is not None:
+        build_index("hnsw", embeddings_file, out=hnsw_file)
+
+
+def recall_report(index, exact, queries, k=10, knob_values=None):
+    """
+    recall@k i prosječna latencija ANN indeksa u odnosu na exact backend, za svaku
+    vrijednost preklopnika (nprobe za IVF, ef za HNSW).
+    """
+    truth, _ = exact.search(queries, k)
+    t0 = time.perf_counter()
+    for q in queries:
+        exact.search(q, k)
+    exact_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+
+    rows = []
+    for knob in knob_values or [None]:
+        if knob is not None:
+            if index.backend == "ivf":
+                index.nprobe = knob
+            elif index.backend == "hnsw":
+                index.set_ef(max(knob, k))
+        t0 = time.perf_counter()
+        found = np.stack([index.search(q, k)[0] for q in queries])
+        ann_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+        hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+        rows.append({
+            "backend": index.backend,
+            "knob": knob,
+            f"recall@{k}": round(hits / (len(queries) * k), 4),
+            "ann_ms": round(ann_ms, 3),
+            "exact_ms": round(exact_ms, 3),
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="ANN index over visual_embeddings.npy")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_build = sub.add_parser("build")
+    p_build.add_argument("--backend", choices=["ivf", "hnsw"], default=DEFAULT_BACKEND)
+    p_build.add_argument("--nlist", type=int, default=None)
+    p_build.add_argument("--M", type=int, default=32)
+
+    p_report = sub.add_parser("report")
+    p_report.add_argument("--backend", choices=["ivf", "hnsw"], default=DEFAULT_BACKEND)
+    p_report.add_argument("--k", type=int, default=10)
+    p_report.add_argument("--queries", type=int, default=200)
+    p_report.add_argument("--noise", type=float, default=0.05)
+    p_report.add_argument("--nprobe", type=int, nargs="*", default=[1, 4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    if args.cmd == "build":
+        kwargs = {"nlist": args.nlist} if args.backend == "ivf" else {"M": args.M}
+        build_index(args.backend, **kwargs)
+    else:
+        matrix = normalize_rows(np.load(EMBEDDINGS_FILE))
+        rng = np.random.default_rng(0)
+        picks = rng.choice(matrix.shape[0], min(args.queries, matrix.shape[0]), replace=False)
+        queries = normalize_rows(matrix[picks] + rng.normal(0, args.noise, (picks.size, matrix.shape[1])))
+        index = get_visual_index(args.backend)
+        if index.backend == "exact":
+            raise SystemExit(f"❌ {args.backend} indeks nije izgrađen — pokreni: python3 vector_index.py build")
+        print(json.dumps(recall_report(index, ExactIndex(matrix), queries, k=args.k,
+                                       knob_values=args.nprobe), indent=2))
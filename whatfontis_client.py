@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+whatfontis_client.py — WhatFontIs API klijent za app.py.
+
+  • jedan requests.Session po procesu (keep-alive, pool TLS konekcija)
+  • ograničen broj ponovnih pokušaja s eksponencijalnim backoffom + jitter
+    (samo mrežne greške, 429 i 5xx; 4xx se ne ponavlja)
+  • trajni cache odgovora (data/whatfontis_cache/) po perceptualnom hashu
+    obrađene slike + parametrima zahtjeva, pa ponovni upload iste slike ili
+    promjena widgeta ne naplaćuje API ponovno
+  • brojači hit/miss/retry/error
+"""
+
+import os
+import json
+import time
+import random
+import base64
+import hashlib
+import logging
+import threading
+import numpy as np
+import requests
+from PIL import Image
+import tracing
+
+# ----------------------------
+# KONFIG
+# ----------------------------
+WHATFONTIS_API_URL = "https://www.whatfontis.com/api2/"
+CACHE_DIR = "data/whatfontis_cache"
+CACHE_TTL_SECONDS = 30 * 24 * 3600
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5   # sekundi; pokušaj n čeka BACKOFF_BASE * 2**n * [0.5, 1.5)
+BACKOFF_MAX = 8.0
+TIMEOUT = (5, 60)    # (connect, read)
+POOL_SIZE = 8
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_lock = threading.Lock()
+_session = None
+_metrics = {"hits": 0, "misses": 0, "requests": 0, "retries": 0, "errors": 0}
+
+
+class WhatFontIsError(RuntimeError):
+    def __init__(self, message, status=None, body=None):
+        super().__init__(message)
+        self.status = status
+        self.body = body
+
+
+def get_session():
+    """Zajednički Session s HTTPAdapter poolom (jedan po procesu)."""
+    global _session
+    with _lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            _session = s
+        return _session
+
+
+def perceptual_hash(image, hash_size=16):
+    """
+    dHash (razlika susjednih piksela na umanjenoj sivoj slici) kao hex string.
+    Otporan na ponovno kodiranje i sitne razlike skaliranja iste slike.
+    """
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    px = np.asarray(small, dtype=np.int16)
+    bits = (px[:, 1:] > px[:, :-1]).flatten()
+    return np.packbits(bits).tobytes().hex()
+
+
+def _cache_key(phash, params):
+    public = {k: v for k, v in sorted(params.items()) if k not in ("API_KEY", "urlimagebase64")}
+    raw = phash + "|" + json.dumps(public, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _cache_get(key):
+    path = os.path.join(CACHE_DIR, key + ".json")
+    try:
+        if time.time() - os.path.getmtime(path) > CACHE_TTL_SECONDS:
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _cache_put(key, results):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = os.path.join(CACHE_DIR, key + ".json")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _count(name, n=1):
+    with _lock:
+        _metrics[name] += n
+
+
+def _post_with_retries(url, data):
+    session = get_session()
+    last_error = None
+    for attempt in range(MAX_RETRIES + 1):
+        if attempt:
+            _count("retries")
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** (attempt - 1))) * random.uniform(0.5, 1.5)
+            time.sleep(delay)
+        try:
+            _count("requests")
+            r = session.post(url, data=data, timeout=TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            last_error = WhatFontIsError(f"network error: {e}")
+            logging.warning(f"⚠️ WhatFontIs attempt {attempt + 1} failed: {e}")
+            continue
+        if r.status_code in RETRY_STATUSES:
+            last_error = WhatFontIsError(f"API greška: {r.status_code}", r.status_code, r.text)
+            logging.warning(f"⚠️ WhatFontIs attempt {attempt + 1}: HTTP {r.status_code}")
+            continue
+        if r.status_code != 200:
+            raise WhatFontIsError(f"API greška: {r.status_code}", r.status_code, r.text)
+        try:
+            return r.json()
+        except ValueError:
+            raise WhatFontIsError("API nije vratio valjani JSON odgovor.", r.status_code, r.text)
+    raise last_error
+
+
+def identify_font(image_bytes, params, cache_image=None, url=WHATFONTIS_API_URL, use_cache=True):
+    """
+    Pošalji sliku (PNG/JPEG bajtovi) na WhatFontIs i vrati listu rezultata.
+    `params` su API parametri bez slike; `cache_image` je slika za perceptual
+    hash (ako nije zadana, dekodira se iz image_bytes).
+    """
+    if cache_image is None:
+        import io
+        cache_image = Image.open(io.BytesIO(image_bytes))
+    key = _cache_key(perceptual_hash(cache_image), params)
+
+    if use_cache:
+        cached = _cache_get(key)
+        if cached is not None:
+            _count("hits")
+            return cached
+        _count("misses")
+
+    data = dict(params)
+    data["IMAGEBASE64"] = 1
+    data["urlimagebase64"] = base64.b64encode(image_bytes).decode("utf-8")
+    try:
+        with tracing.span("api_request"):
+            results = _post_with_retries(url, data)
+    except WhatFontIsError:
+        _count("errors")
+        raise
+    if isinstance(results, list) and results:
+        _cache_put(key, results)  # prazne odgovore ne cacheiramo
+    return results
+
+
+def metrics():
+    with _lock:
+        m = dict(_metrics)
+    lookups = m["hits"] + m["misses"]
+    m["hit_rate"] = round(m["hits"] / lookups, 3) if lookups else 0.0
+    return m